@@ -0,0 +1,50 @@
+'''
+    Gunicorn settings, loaded automatically by the command of the Procfile.
+'''
+import os
+import subprocess
+import sys
+
+# The figure builders do not write to the shared dataset, so each worker can serve
+# several requests at once
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+
+def on_starting(server):
+    '''
+        Pre-renders the figures into FIGURE_CACHE_DIR before the workers start,
+        when WARMUP_FIGURES=1, from the aggregates of OUT_OF_CORE_DATA if set.
+        The figures of previous builds are deleted first when WARMUP_CLEAR=1.
+    '''
+    directory = os.environ.get('FIGURE_CACHE_DIR')
+    if os.environ.get('WARMUP_FIGURES') == '1' and directory:
+        # pylint: disable=import-outside-toplevel
+        clear = os.environ.get('WARMUP_CLEAR') == '1'
+        if os.environ.get('OUT_OF_CORE_DATA'):
+            from src.chunked import warm_up_directory
+            count = warm_up_directory(directory, os.environ['OUT_OF_CORE_DATA'], clear=clear)
+        else:
+            from src.warmup import warm_up_directory
+            count = warm_up_directory(directory, clear=clear)
+        server.log.info("Pre-rendered %d figures into %s", count, directory)
+
+
+def when_ready(server):
+    '''
+        Starts the ingester of STREAM_DIRECTORY in a process of its own, which
+        writes the records into the batch store the workers all follow.
+    '''
+    if os.environ.get('STREAM_DIRECTORY'):
+        server.stream_ingester = subprocess.Popen([sys.executable, '-m', 'src.stream'])
+        server.log.info("Started the stream ingester (pid %d)", server.stream_ingester.pid)
+
+
+def on_exit(server):
+    '''
+        Stops the stream ingester, if any.
+    '''
+    ingester = getattr(server, 'stream_ingester', None)
+    if ingester is not None:
+        ingester.terminate()
+        ingester.wait()
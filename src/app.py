@@ -1,22 +1,111 @@
+import os
+import threading
+import time
+
 import dash
 from dash import html, dcc, Input, Output, State
-import pandas as pd
 import dash_bootstrap_components as dbc
 
-from src.correlation_heatmap import get_correlation_figure, assign_cluster_labels
-from src.cluster_scatter import get_cluster_figure
-from src.radar_chart import get_radar_chart
-from src.bar_chart import get_bar_chart_figure
-from src.waffle_chart import get_waffle_figure
-from src.sankey_chart import get_sankey_chart_figure
+from src.chunked import ChunkedAggregates, get_cached_figure as get_cached_aggregate_figure, read_chunks
+from src.cluster_model import CLUSTER_MODELS_FILE, load_cluster_models
+from src.correlation_heatmap import get_cluster_choices
+from src.sankey_chart import sankey_left_type_options, sankey_habit_options
+from src.dataset import Dataset, load_dataframe
+from src.figure_cache import FigureCache
+from src.figure_patch import apply_patch_js, get_figure_patch
+from src.figures import get_cached_figure, get_data_version, get_figure_key
+from src.filters import Selection, filter_columns, get_filter_key, range_columns
+from src.radar_chart import get_radar_user_settings
+from src.stream import BatchStore, append_rows, follow_directory, get_store_directory
 
 app = dash.Dash(__name__)
 server = app.server
 app.title = 'Student Habits vs Performance'
 
-df = pd.read_csv("src/assets/data/student_habits_performance.csv")
-df_clustered = assign_cluster_labels(df)
-available_clusters = ["All students"] + sorted(df_clustered['cluster_name'].unique())
+# Set FIGURE_CACHE_DIR to share the rendered figures between the gunicorn workers
+figure_cache = FigureCache(directory=os.environ.get('FIGURE_CACHE_DIR'))
+
+# Set RADAR_CLIENTSIDE=0 to draw the user trace of the radar chart on the server
+RADAR_CLIENTSIDE = os.environ.get('RADAR_CLIENTSIDE', '1') == '1'
+
+# Set OUT_OF_CORE_DATA to a CSV file or a columnar directory larger than memory
+# to draw the figures from its aggregates (see src.chunked), read once in chunks,
+# instead of loading the dataframe. The student profiles are then not drawn, and
+# neither the stream nor the figure patches are used
+OUT_OF_CORE_DATA = os.environ.get('OUT_OF_CORE_DATA')
+
+# Set FIGURE_PATCHES=0 to send whole figures when a dropdown changes
+FIGURE_PATCHES = os.environ.get('FIGURE_PATCHES', '1') == '1' and not OUT_OF_CORE_DATA
+# Graphs updated with patches, whose reference and patch stores are in the layout
+patched_graphs = []
+
+# Set STREAM_DIRECTORY to append the records of the CSV and JSON Lines files
+# dropped into (or appended to) that directory to the dataset while the app runs.
+# The directory is read by a single ingester (python -m src.stream), which writes
+# the records into a batch store (STREAM_STORE) that every worker follows. The
+# workers then hold a private copy of the dataset instead of sharing its
+# memory-mapped columns (see Dataset.append), so it is off by default
+STREAM_DIRECTORY = os.environ.get('STREAM_DIRECTORY')
+# Number of seconds between two reads of the directory, and between two version checks of the pages
+STREAM_INTERVAL = float(os.environ.get('STREAM_INTERVAL', '10'))
+
+# The dataset is loaded on first use so that importing the app (and booting the
+# gunicorn workers) does not wait for the data and the figures. _batches is the
+# number of batches of the store appended to it
+_dataset = None
+_batches = 0
+_aggregates = None
+_dataset_lock = threading.Lock()
+
+
+def get_dataset():
+    global _dataset  # pylint: disable=global-statement
+    with _dataset_lock:
+        if _dataset is None:
+            _dataset = Dataset(load_dataframe())
+            # Reuse the cluster models fitted by the warm-up, if any
+            directory = os.environ.get('FIGURE_CACHE_DIR')
+            if directory and os.path.isfile(os.path.join(directory, CLUSTER_MODELS_FILE)):
+                load_cluster_models(os.path.join(directory, CLUSTER_MODELS_FILE))
+            if STREAM_DIRECTORY:
+                threading.Thread(target=_follow_store, args=(_dataset,), daemon=True).start()
+    return _dataset
+
+
+def get_aggregates():
+    global _aggregates  # pylint: disable=global-statement
+    with _dataset_lock:
+        if _aggregates is None:
+            _aggregates = ChunkedAggregates.from_chunks(read_chunks(OUT_OF_CORE_DATA))
+    return _aggregates
+
+
+def _follow_store(dataset):
+    # Appends the batches of the store to the dataset, in their order, the
+    # callbacks picking the new dataset up on their next call
+    global _dataset, _batches  # pylint: disable=global-statement
+    store = BatchStore(get_store_directory(STREAM_DIRECTORY))
+    batches = 0
+    while True:
+        try:
+            for rows in store.read(batches):
+                dataset = append_rows(dataset, rows)
+                batches += 1
+                with _dataset_lock:
+                    _dataset, _batches = dataset, batches
+        except Exception:  # pylint: disable=broad-except
+            # Retried on the next check, from the first batch not appended
+            server.logger.exception("Could not append the batches of %s", store.directory)
+        time.sleep(STREAM_INTERVAL)
+
+
+def get_figure(name, *inputs, filters=None, dataset=None):
+    if OUT_OF_CORE_DATA:
+        return get_cached_aggregate_figure(figure_cache, get_aggregates(), name, *inputs, filters=filters)
+    dataset = get_dataset() if dataset is None else dataset
+    selection = dataset.filter_index.select(filters)
+    return get_cached_figure(figure_cache, dataset.df, dataset.version, name, *inputs, selection=selection)
+
 
 habits = [
     'study_hours_per_day', 'social_media_hours_per_day', 'netflix_hours_per_day',
@@ -34,22 +123,6 @@ slider_config = {
     'mental_health_rating': {'min': 1, 'max': 10, 'step': 1}
 }
 
-# Sankey dropdown options
-sankey_left_type_options = [
-    {'label': 'Age', 'value': 'age'},
-    {'label': 'Gender', 'value': 'gender'}
-]
-
-sankey_habit_options = [
-    {'label': 'Study Hours per Day', 'value': 'study_hours_per_day'},
-    {'label': 'Sleep Hours per Day', 'value': 'sleep_hours_per_day'},
-    {'label': 'Social Media Hours per Day', 'value': 'social_media_hours_per_day'},
-    {'label': 'Netflix Hours per Day', 'value': 'netflix_hours_per_day'},
-    {'label': 'Exercise Frequency per Week', 'value': 'exercise_frequency_per_week'},
-    {'label': 'Mental Health Rating', 'value': 'mental_health_rating'},
-    {'label': 'Diet Quality', 'value': 'diet_quality'}
-]
-
 waffle_desc = """The waffle chart visualizes the relationship between the students' academic performance and their parents' education level.
 Each column group represents one of four parental education categories: None, High School, Bachelor, and Master.
 Inside each group, colored squares indicate the number of students performing at different levels.
@@ -87,28 +160,55 @@ This insight supports students and educators in recognizing habits that influenc
 correlation_desc_post ="""From this chart, we can see that across all student profiles, study hours strongly correlate with higher exam scores, making it the most important factor for academic success. Excessive social media use negatively impacts exam performance and attendance, especially for Media Addicts and Balanced Learners. Sleep consistently shows positive links to exam results and mental health, highlighting its role in well-being and performance. Attendance correlates moderately with exam scores and is negatively affected by social media in some groups. Exercise has a small positive effect on both mental health and academics. Overall, good study habits, adequate sleep, and limited social media use are key to better academic outcomes and well-being.
 
 """
-correlation_controls = html.Div([
-    html.Label("Select Cluster Group:", style={
-        'color': 'black',
-        'fontSize': '18px',
-        'fontWeight': '600',
-        'textAlign': 'center',
-        'display': 'block',
-        'marginBottom': '10px'
-    }),
-
-    html.Div([
-        dcc.Dropdown(
-            id='cluster-dropdown',
-            options=[{'label': name, 'value': name} for name in available_clusters],
-            value='All students',
-            clearable=False,
-            style={'width': '300px'}
-        )
-    ], style={'margin': '0 auto', 'marginBottom': '30px', 'width': '300px'}),
+def correlation_controls():
+    return html.Div([
+        html.Label("Select Cluster Group:", style={
+            'color': 'black',
+            'fontSize': '18px',
+            'fontWeight': '600',
+            'textAlign': 'center',
+            'display': 'block',
+            'marginBottom': '10px'
+        }),
 
-    dcc.Graph(id='correlation-graph', figure=get_correlation_figure(df, selected_cluster='All students'))
-])
+        html.Div([
+            dcc.Dropdown(
+                id='cluster-dropdown',  # options filled by update_cluster_options
+                value='All students',
+                clearable=False,
+                style={'width': '300px'}
+            )
+        ], style={'margin': '0 auto', 'marginBottom': '30px', 'width': '300px'}),
+
+        dcc.Graph(id='correlation-graph')  # filled by update_correlation_figure
+    ])
+
+
+# The filters applied to all the charts; the options are filled by update_filter_options
+def filter_controls():
+    label_style = {'fontWeight': '600', 'display': 'block', 'marginBottom': '5px'}
+    return html.Div([
+        html.Div([
+            html.Label(column.replace("_", " ").capitalize(), htmlFor=f'filter-{column}', style=label_style),
+            dcc.Dropdown(id=f'filter-{column}', multi=True, placeholder='All', style={'width': '200px'})
+        ], style={'display': 'inline-block', 'margin': '0 10px', 'verticalAlign': 'top'})
+        for column in filter_columns
+    ] + [
+        html.Div([
+            html.Label(column.replace("_", " ").capitalize(), htmlFor=f'filter-{column}', style=label_style),
+            dcc.RangeSlider(id=f'filter-{column}', step=1, marks=None,
+                            tooltip={"placement": "bottom", "always_visible": False})
+        ], style={'display': 'inline-block', 'margin': '0 10px', 'width': '250px', 'verticalAlign': 'top'})
+        for column in range_columns
+    ], style={
+        'backgroundColor': 'white',
+        'padding': '15px',
+        'textAlign': 'center',
+        'position': 'sticky',
+        'top': 0,
+        'zIndex': 10,
+        'boxShadow': '0 2px 10px rgba(0,0,0,0.15)'
+    })
 
 
 # Create sections to compartmentalize the charts
@@ -236,103 +336,118 @@ def radar_section():
         children=[
             html.Div(slider_controls(), style={'flex': '1', 'maxWidth': '600px'}),
             html.Div(
-                dcc.Graph(id='radar-chart', figure=get_radar_chart(df), style={'height': '500px'}),
+                dcc.Graph(id='radar-chart', style={'height': '500px'}),  # filled by update_radar_chart
                 style={'flex': '1', 'maxWidth': '600px'}
-            )
+            ),
+            # The group traces and the advice thresholds, sent once when RADAR_CLIENTSIDE is set
+            dcc.Store(id='radar-baseline')
         ]
     )
 
-sections = [
-    create_section("How Habits Impact Academic Performance", "Explore the average habits of the top 20% and the lowest 40% compared to all students.",
-                   dcc.Graph(figure=get_bar_chart_figure(df)), 
-                   bgcolor='#78c2ad',
-                   title_color='white',
-				   post_description=dcc.Markdown(bar_post_desc),
-                   description_color='white'),
-    create_section("Cluster-Based Scatterplot Profiles",cluster_desc,
-		   dcc.Graph(figure=get_cluster_figure(df)), 
-                   bgcolor='#cc6041',
-                   title_color='white',
-		   post_description=dcc.Markdown(cluster_desc_post),
-                   description_color='white'),
-    create_section("Habit Correlation Heatmap", 
-                   correlation_desc,
-                   correlation_controls,
-                   bgcolor='#569caa',
-                   title_color='white',
-                   post_description=dcc.Markdown(correlation_desc_post),
-                   description_color='white'),
-    create_section("Waffle Chart of Student Groups",
-                   waffle_desc,
-                   dcc.Graph(figure=get_waffle_figure(df)),
-                   post_description=waffle_post_desc,
-                   bgcolor='#f3969a',
-                   title_color='white',
-                   description_color='white'),
-    create_section(
-        "Sankey Chart of Habit Flows",
-        sankey_desc,
-        html.Div([  # Wrap these two inside one container
-            html.Div([
-                html.Label("Group By (Left Nodes):"),
-                dcc.Dropdown(
-                    id='sankey-left-dropdown',
-                    options=sankey_left_type_options,
-                    value='age',
-                    clearable=False,
-                    style={'width': '250px'}
-                )
-            ], style={'display': 'inline-block', 'marginRight': '40px'}),
-
-            html.Div([
-                html.Label("Habit Metric:"),
-                dcc.Dropdown(
-                    id='sankey-habit-dropdown',
-                    options=sankey_habit_options,
-                    value='study_hours_per_day',
-                    clearable=False,
-                    style={'width': '300px'}
-                )
-            ], style={'display': 'inline-block'}),
-
-            dcc.Graph(id='sankey-graph', figure=get_sankey_chart_figure(df, selected_left_type='age', selected_habit='study_hours_per_day'))
-        ], style={'textAlign': 'center', 'marginBottom': '20px'}),  # single content argument ends here
-        post_description=sankey_post_desc,
-        bgcolor='#ffce67',
-        title_color='white',
-        description_color='white'
-    ),
-
-    create_section("Where Do You Fit In?",
-                   "Everyone’s habits are unique! Use the sliders to generate a personal profile and see where you align or differ from other student groups. What can you learn from the data?",
-                   radar_section(),
-                   bgcolor='#6DD2B0',
-                   title_color='white',
-                   description_color='white')
-]
+def create_sections():
+    return [
+        create_section("How Habits Impact Academic Performance", "Explore the average habits of the top 20% and the lowest 40% compared to all students.",
+                       dcc.Graph(id='bar-graph'),
+                       bgcolor='#78c2ad',
+                       title_color='white',
+                       post_description=dcc.Markdown(bar_post_desc),
+                       description_color='white'),
+        create_section("Cluster-Based Scatterplot Profiles",cluster_desc,
+                       dcc.Graph(id='cluster-graph'),
+                       bgcolor='#cc6041',
+                       title_color='white',
+                       post_description=dcc.Markdown(cluster_desc_post),
+                       description_color='white'),
+        create_section("Habit Correlation Heatmap", 
+                       correlation_desc,
+                       correlation_controls(),
+                       bgcolor='#569caa',
+                       title_color='white',
+                       post_description=dcc.Markdown(correlation_desc_post),
+                       description_color='white'),
+        create_section("Waffle Chart of Student Groups",
+                       waffle_desc,
+                       dcc.Graph(id='waffle-graph'),
+                       post_description=waffle_post_desc,
+                       bgcolor='#f3969a',
+                       title_color='white',
+                       description_color='white'),
+        create_section(
+            "Sankey Chart of Habit Flows",
+            sankey_desc,
+            html.Div([  # Wrap these two inside one container
+                html.Div([
+                    html.Label("Group By (Left Nodes):"),
+                    dcc.Dropdown(
+                        id='sankey-left-dropdown',
+                        options=sankey_left_type_options,
+                        value='age',
+                        clearable=False,
+                        style={'width': '250px'}
+                    )
+                ], style={'display': 'inline-block', 'marginRight': '40px'}),
+
+                html.Div([
+                    html.Label("Habit Metric:"),
+                    dcc.Dropdown(
+                        id='sankey-habit-dropdown',
+                        options=sankey_habit_options,
+                        value='study_hours_per_day',
+                        clearable=False,
+                        style={'width': '300px'}
+                    )
+                ], style={'display': 'inline-block'}),
+
+                dcc.Graph(id='sankey-graph')  # filled by update_sankey_chart
+            ], style={'textAlign': 'center', 'marginBottom': '20px'}),  # single content argument ends here
+            post_description=sankey_post_desc,
+            bgcolor='#ffce67',
+            title_color='white',
+            description_color='white'
+        ),
+
+        create_section("Where Do You Fit In?",
+                       "Everyone’s habits are unique! Use the sliders to generate a personal profile and see where you align or differ from other student groups. What can you learn from the data?",
+                       radar_section(),
+                       bgcolor='#6DD2B0',
+                       title_color='white',
+                       description_color='white')
+    ]
 
-app.layout = html.Div([
-    html.Div([
-        html.H1("Student Behavior Profiles & Academic Performance", style={
-            'fontSize': '4rem',
-            'textAlign': 'center',
-            'margin': '20px 0 0 0', 
-            'fontWeight': '700',
-            'color':'white'
+
+# The layout is a function without any data: the figures are filled by the
+# callbacks on page load, from the figure cache
+def serve_layout():
+    return html.Div([
+        dcc.Location(id='url'),
+        html.Div([
+            html.H1("Student Behavior Profiles & Academic Performance", style={
+                'fontSize': '4rem',
+                'textAlign': 'center',
+                'margin': '20px 0 0 0', 
+                'fontWeight': '700',
+                'color':'white'
+            }),
+            html.P("Discover how lifestyle choices and study habits shape academic success. Explore behavior patterns across performance groups and see how your own habits compare to top performers and the student average..", style={
+                'fontSize': '1.5rem',
+                'textAlign': 'center',
+                'margin': '0 0 40px 0',
+                'color':'white'
+            })
+        ], style={
+            'backgroundColor': '#343a40',
+            'paddingTop': '10px',
+            'paddingBottom': '10px',
         }),
-        html.P("Discover how lifestyle choices and study habits shape academic success. Explore behavior patterns across performance groups and see how your own habits compare to top performers and the student average..", style={
-            'fontSize': '1.5rem',
-            'textAlign': 'center',
-            'margin': '0 0 40px 0',
-            'color':'white'
-        })
-    ], style={
-        'backgroundColor': '#343a40',
-        'paddingTop': '10px',
-        'paddingBottom': '10px',
-    }),
-    *sections,
-    dcc.Markdown("""
+        filter_controls(),
+        # The selected filters, shared by all the charts
+        dcc.Store(id='filters'),
+        # The number of batches of the stream the figures were drawn from and
+        # the version of the dataset, checked periodically when STREAM_DIRECTORY is set
+        dcc.Store(id='dataset-version'),
+        dcc.Interval(id='dataset-refresh', interval=STREAM_INTERVAL * 1000, disabled=not STREAM_DIRECTORY),
+        *create_sections(),
+        dcc.Markdown("""
         <style>
             @keyframes bounce {
                 0%, 20%, 50%, 80%, 100% {transform: translateY(0);}
@@ -348,9 +463,14 @@ app.layout = html.Div([
             }
         </style>
     """, style={"display": "none"}),
-    dcc.Store(id='scroll-position-store'),
-    dcc.Store(id='blur-trigger')
-])
+        dcc.Store(id='scroll-position-store'),
+        dcc.Store(id='blur-trigger'),
+        *[dcc.Store(id=f'{graph_id}-{kind}') for graph_id in patched_graphs
+          for kind in ('reference', 'reference-version', 'patch')]
+    ])
+
+
+app.layout = serve_layout
 
 # To update the hover of the button and the slider
 app.clientside_callback(
@@ -396,46 +516,253 @@ app.clientside_callback(
 
 
 @app.callback(
-    Output('radar-chart', 'figure'),
-    Input('update-button', 'n_clicks'),
-    [State(h, 'value') for h in habits]
+    [Output(f'filter-{column}', 'options') for column in filter_columns]
+    + [Output(f'filter-{column}', prop) for column in range_columns for prop in ('min', 'max', 'value')],
+    Input('url', 'pathname')
 )
-def update_radar_chart(n_clicks, *user_values):
-    if not user_values or any(v is None for v in user_values):
-        return get_radar_chart(df)
-
-    ranges = {
-        'study_hours_per_day': (0, 9),
-        'social_media_hours_per_day': (0, 7),
-        'netflix_hours_per_day': (0, 6),
-        'sleep_hours_per_day': (3, 10),
-        'diet_quality': (1, 3),
-        'exercise_frequency_per_week': (0, 6),
-        'mental_health_rating': (1, 10)
-    }
+def update_filter_options(_):
+    # The aggregates list the options as the index of the dataset does
+    filter_index = get_aggregates() if OUT_OF_CORE_DATA else get_dataset().filter_index
+    options = [[{'label': str(value), 'value': value} for value in filter_index.get_options(column)]
+               for column in filter_columns]
+    for column in range_columns:
+        low, high = (float(bound) for bound in filter_index.get_options(column))
+        options += [low, high, [low, high]]
+    return options
 
-    normalized = [
-        5 * (v - ranges[h][0]) / (ranges[h][1] - ranges[h][0])
-        for h, v in zip(habits, user_values)
-    ]
 
-    return get_radar_chart(df, user_data=normalized)
+@app.callback(
+    Output('filters', 'data'),
+    [Input(f'filter-{column}', 'value') for column in filter_columns + range_columns],
+    [State(f'filter-{column}', prop) for column in range_columns for prop in ('min', 'max')]
+)
+def update_filters(*values):
+    selected = dict(zip(filter_columns + range_columns, values))
+    bounds = values[len(filter_columns) + len(range_columns):]
+    filters = {column: selected[column] for column in filter_columns if selected[column]}
+    for column, low, high in zip(range_columns, bounds[::2], bounds[1::2]):
+        # A range covering every value does not filter, which keeps the figures of all the rows cached
+        if selected[column] and list(selected[column]) != [low, high]:
+            filters[column] = selected[column]
+    return filters
+
+
+@app.callback(
+    Output('dataset-version', 'data'),
+    Input('dataset-refresh', 'n_intervals'),
+    State('dataset-version', 'data')
+)
+def update_dataset_version(_, current_version):
+    # The figures are only redrawn when this worker appended more batches than
+    # the page has seen, so that workers lagging behind do not move it back
+    if OUT_OF_CORE_DATA:
+        return dash.no_update
+    get_dataset()
+    with _dataset_lock:
+        dataset, batches = _dataset, _batches
+    if batches <= (current_version or {}).get('batches', 0):
+        return dash.no_update
+    return {'batches': batches, 'version': dataset.version}
+
+
+@app.callback(
+    Output('bar-graph', 'figure'),
+    Input('filters', 'data'),
+    Input('dataset-version', 'data')
+)
+def update_bar_chart(filters, _):
+    return get_figure('bar', filters=filters)
 
 
 @app.callback(
-    Output('sankey-graph', 'figure'),
-    [Input('sankey-habit-dropdown', 'value'),
-     Input('sankey-left-dropdown', 'value')]
+    Output('cluster-graph', 'figure'),
+    Input('filters', 'data'),
+    Input('dataset-version', 'data')
 )
-def update_sankey_chart(selected_habit, selected_left_type):
-    return get_sankey_chart_figure(df, selected_left_type=selected_left_type, selected_habit=selected_habit)
+def update_cluster_figure(filters, _):
+    return get_figure('cluster', filters=filters)
+
 
 @app.callback(
-    Output('correlation-graph', 'figure'),
-    Input('cluster-dropdown', 'value')
+    Output('waffle-graph', 'figure'),
+    Input('filters', 'data'),
+    Input('dataset-version', 'data')
+)
+def update_waffle_figure(filters, _):
+    return get_figure('waffle', filters=filters)
+
+
+@app.callback(
+    Output('cluster-dropdown', 'options'),
+    Input('dataset-version', 'data')
+)
+def update_cluster_options(_):
+    # The clusters need the rows, so the aggregates only have all the students
+    choices = ['All students'] if OUT_OF_CORE_DATA else get_cluster_choices(get_dataset().df)
+    return [{'label': name, 'value': name} for name in choices]
+
+
+if RADAR_CLIENTSIDE:
+    @app.callback(
+        Output('radar-baseline', 'data'),
+        Input('filters', 'data'),
+        Input('dataset-version', 'data')
+    )
+    def update_radar_baseline(filters, _):
+        if OUT_OF_CORE_DATA:
+            settings = get_radar_user_settings(None, baseline=get_aggregates().get_radar_baseline(filters))
+        else:
+            dataset = get_dataset()
+            settings = get_radar_user_settings(dataset.df, dataset.filter_index.select(filters))
+        return {'figure': get_figure('radar', filters=filters), 'settings': settings}
+
+    # Adds the user trace and its advice to the group traces in the browser,
+    # as the server-side update_radar_chart and normalize_user_values do
+    app.clientside_callback(
+        """
+        function(baseline, n_clicks, ...values) {
+            if (!baseline) {
+                return window.dash_clientside.no_update;
+            }
+            const figure = baseline.figure;
+            const settings = baseline.settings;
+            if (values.some(v => v === null || v === undefined)) {
+                return figure;
+            }
+            function wrapText(text, maxLength) {
+                const lines = [];
+                let line = '';
+                text.split(/\\s+/).filter(w => w).forEach(word => {
+                    if (line.length + word.length + 1 <= maxLength) {
+                        line = line ? line + ' ' + word : word;
+                    } else {
+                        lines.push(line);
+                        line = word;
+                    }
+                });
+                lines.push(line);
+                return lines.join('<br>');
+            }
+            const r = values.map((v, i) => 5 * (v - settings.ranges[i][0]) / (settings.ranges[i][1] - settings.ranges[i][0]));
+            const advice = r.map((v, i) => wrapText(settings.advice[i][v >= settings.mid_means[i] ? 0 : 1], 20));
+            const user = {
+                type: 'scatterpolar',
+                r: r.concat([r[0]]),
+                theta: settings.labels.concat([settings.labels[0]]),
+                fill: 'toself',
+                name: 'You',
+                line: {color: settings.color, dash: 'dash'},
+                customdata: advice.concat([advice[0]]),
+                hovertemplate: settings.hovertemplate
+            };
+            return Object.assign({}, figure, {data: figure.data.concat([user])});
+        }
+        """,
+        Output('radar-chart', 'figure'),
+        Input('radar-baseline', 'data'),
+        Input('update-button', 'n_clicks'),
+        [State(h, 'value') for h in habits]
+    )
+else:
+    @app.callback(
+        Output('radar-chart', 'figure'),
+        Input('update-button', 'n_clicks'),
+        Input('filters', 'data'),
+        Input('dataset-version', 'data'),
+        [State(h, 'value') for h in habits]
+    )
+    def update_radar_chart(n_clicks, filters, _, *user_values):
+        if not user_values or any(v is None for v in user_values):
+            return get_figure('radar', filters=filters)
+        return get_figure('radar', *user_values, filters=filters)
+
+
+def register_figure_callback(graph_id, update, inputs, reference_values):
+    '''
+        Registers the callback of a figure driven by dropdowns.
+
+        With FIGURE_PATCHES, the figure of the initial dropdown values is sent
+        once per selection of the filters, and each change of a dropdown only
+        sends the patch turning it into the new figure, which the browser applies.
+        The reference and the patches are tagged with the version of their data
+        and filters, so that the browser never applies a patch to the reference
+        of other filters. The whole figure is sent instead when the worker has
+        other data than the reference the browser holds.
+
+        Args:
+            graph_id: The id of the dcc.Graph
+            update: The function building the figure from the input values, the
+                filters and the Dataset (the current one if None)
+            inputs: The Inputs of the callback, in the order of the arguments of update
+            reference_values: The initial values of the inputs
+    '''
+    # The figures are also redrawn when the filters or the dataset change
+    inputs = inputs + [Input('filters', 'data'), Input('dataset-version', 'data')]
+    if not FIGURE_PATCHES:
+        app.callback(Output(graph_id, 'figure'), inputs)(lambda *values: update(*values[:-1]))
+        return
+
+    patched_graphs.append(graph_id)
+
+    @app.callback(
+        Output(f'{graph_id}-reference', 'data'),
+        Output(f'{graph_id}-reference-version', 'data'),
+        Input('filters', 'data'),
+        Input('dataset-version', 'data')
+    )
+    def update_reference(filters, _):
+        dataset = get_dataset()
+        version = get_data_version(dataset.df, dataset.version, Selection(get_filter_key(filters)))
+        return {'version': version, 'figure': update(*reference_values, filters, dataset)}, version
+
+    # Chained to the reference, so that each patch is computed against the reference the browser holds
+    @app.callback(
+        Output(f'{graph_id}-patch', 'data'),
+        inputs[:-2] + [Input(f'{graph_id}-reference-version', 'data'), State('filters', 'data')]
+    )
+    def update_patch(*values):
+        *values, reference_version, filters = values
+        dataset = get_dataset()
+        selection = Selection(get_filter_key(filters))
+        version = get_data_version(dataset.df, dataset.version, selection)
+        if version != reference_version:
+            # The reference was drawn from other data, e.g. by a worker that appended more batches
+            return {'figure': update(*values, filters, dataset)}
+        # The patches are cached with the figures, as a dict as the cache stores figure dicts
+        key = get_figure_key(version, f'{graph_id}/patch', *values, selection=selection)
+        return figure_cache.get_or_build(key, lambda: {'version': version, 'patch': get_figure_patch(
+            update(*reference_values, filters, dataset), update(*values, filters, dataset))})
+
+    app.clientside_callback(
+        apply_patch_js,
+        Output(graph_id, 'figure'),
+        Input(f'{graph_id}-reference', 'data'),
+        Input(f'{graph_id}-patch', 'data')
+    )
+
+
+def update_sankey_chart(selected_habit, selected_left_type, filters=None, dataset=None):
+    return get_figure('sankey', selected_left_type, selected_habit, filters=filters, dataset=dataset)
+
+def update_correlation_figure(selected_cluster, filters=None, dataset=None):
+    return get_figure('correlation', selected_cluster, filters=filters, dataset=dataset)
+
+
+register_figure_callback(
+    'sankey-graph', update_sankey_chart,
+    [Input('sankey-habit-dropdown', 'value'), Input('sankey-left-dropdown', 'value')],
+    ('study_hours_per_day', 'age')
+)
+register_figure_callback(
+    'correlation-graph', update_correlation_figure,
+    [Input('cluster-dropdown', 'value')],
+    ('All students',)
 )
-def update_correlation_figure(selected_cluster):
-    return get_correlation_figure(df, selected_cluster)
 
 if __name__ == '__main__':
+    # Without gunicorn, the development server ingests the records itself, in
+    # the process of the app the reloader starts
+    if STREAM_DIRECTORY and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        threading.Thread(target=follow_directory, args=(STREAM_DIRECTORY,),
+                         kwargs={'interval': STREAM_INTERVAL, 'logger': server.logger}, daemon=True).start()
     app.run_server(debug=True)
@@ -1,7 +1,20 @@
 import pandas as pd
 import plotly.graph_objects as go
 
-def get_bar_chart_figure(df):
+from src.cube import get_cube, get_means
+
+def get_bar_chart_figure(df, filters=None, cube=None):
+    '''
+        Draws the average habits of the top 20% and the lowest 40% of the
+        exam scores, and of all the students.
+
+        Args:
+            df: The dataframe of the students
+            filters: A dict of the demographic filters, as for FilterIndex.select
+            cube: The AggregateCube to draw from, that of df if None
+        Returns:
+            The figure
+    '''
     habits = [
         'study_hours_per_day', 'sleep_hours', 'social_media_hours', 'netflix_hours',
         'exercise_frequency', 'mental_health_rating', 'diet_quality_numeric',
@@ -22,18 +35,12 @@ def get_bar_chart_figure(df):
         'Diet Quality': '(1–3 scale)',
     }
     
-    diet_mapping = {'Poor': 1, 'Fair': 2, 'Good': 3}
-    df['diet_quality_numeric'] = df['diet_quality'].map(diet_mapping)
-     
-    quantiles = df['exam_score'].quantile([0.4, 0.8])
-    low_df = df[df['exam_score'] <= quantiles[0.4]]
-    top_df = df[df['exam_score'] >= quantiles[0.8]]
-    all_df = df
-    
+    # Lowest 40% and top 20% of the exam scores, added up from the cells of the cube
+    tiers = (get_cube(df) if cube is None else cube).aggregate(['performance_tier_bar'], filters)
 
-    low_means = low_df[habits].mean().round(2)
-    top_means = top_df[habits].mean().round(2)
-    all_means = all_df[habits].mean().round(2)
+    low_means = get_means(tiers.reindex(['Low']).iloc[0], habits).round(2)
+    top_means = get_means(tiers.reindex(['Top']).iloc[0], habits).round(2)
+    all_means = get_means(tiers.sum(), habits).round(2)
 
     fig = go.Figure()
 
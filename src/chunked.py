@@ -0,0 +1,450 @@
+'''
+    Computes the aggregates of the dashboard out of core, for datasets larger than memory.
+
+    Usage: python -m src.chunked --cache-dir DIR [--data PATH] [--chunk-size N] [--clear]
+
+    The dataset is read once, in chunks of bounded size. Each chunk is
+    reduced to mergeable aggregates, which are added to those of the
+    previous chunks:
+
+        - the number of students of each exam score, rounded to SCORE_DECIMALS,
+          from which the quantile performance tiers are derived once every
+          chunk is read
+        - cells of the students by demographics and rounded exam score, with
+          the measures of the aggregate cube (counts, sums and sums of squares
+          of the habits, counts of the habit groups) and the count, sums,
+          minimums and maximums of the habits of the students the radar chart keeps
+        - the correlation statistics of the habits, by demographic cell
+
+    Their size depends on the number of distinct demographics and rounded
+    scores, not on the number of students. The bar, waffle, sankey, radar and
+    correlation (of all the students) figures are then drawn from them as from
+    the whole dataframe, with the same counts and the same means up to
+    floating-point rounding, as long as the scores have at most SCORE_DECIMALS
+    decimals (the tiers of the other scores are those of their rounded value).
+    The cluster scatter plot and the clusters of the correlation heatmap
+    need the rows, so they are left to the in-memory mode.
+
+    The app serves these figures when OUT_OF_CORE_DATA is set, and this
+    command pre-renders them into its figure cache directory, under the keys
+    the app looks them up by.
+'''
+import argparse
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from src.bar_chart import get_bar_chart_figure
+from src.columnar import has_columns, iter_columns
+from src.correlation_heatmap import corr_vars, get_correlation_figure
+from src.correlation_stats import CorrelationStats
+from src.cube import AggregateCube, cube_dimensions, get_cell_measures, group_cells, select_cells, tier_dimensions
+from src.dataset import COLUMNS_PATH, DATA_PATH
+from src.features import cluster_features, cluster_required
+from src.figure_cache import FigureCache
+from src.figures import get_figure_key
+from src.filters import Selection, filter_columns, get_filter_key, range_columns
+from src.preprocess import (add_derived_columns, get_performance_tier_cuts_from_counts, get_performance_tiers,
+                            performance_tier_schemes, sort_radar_groups)
+from src.radar_chart import get_radar_chart, habits as radar_habits, normalize_user_values
+from src.sankey_chart import get_sankey_chart_figure, sankey_habit_options, sankey_left_type_options
+from src.waffle_chart import get_waffle_figure
+
+# Number of rows read at once
+CHUNK_SIZE = 100000
+
+# Dimensions the students are grouped by in the demographic cells
+demographic_dimensions = filter_columns + range_columns
+
+# Dimensions of the cells, the tiers being derived from the exam score once its quantiles are known
+score_dimensions = demographic_dimensions + ['exam_score']
+
+# Number of decimals the exam scores are rounded to in the cells, which bounds
+# their number whatever the number of students (the scores of the dataset have one)
+SCORE_DECIMALS = 1
+
+# Numeric columns of the habits of the radar chart
+_radar_columns = ['diet_quality_numeric' if habit == 'diet_quality' else habit for habit in radar_habits]
+
+
+def read_chunks(path=None, chunk_size=CHUNK_SIZE):
+    '''
+        Reads the raw dataset in chunks of rows.
+
+        Args:
+            path: A CSV file or a columnar directory, the app's dataset if None
+            chunk_size: The number of rows of each chunk
+        Returns:
+            An iterator over the dataframes of the chunks
+    '''
+    if path is None:
+        path = COLUMNS_PATH if has_columns(COLUMNS_PATH) else DATA_PATH
+    if has_columns(path):
+        return iter_columns(path, chunk_size)
+    return pd.read_csv(path, chunksize=chunk_size)
+
+
+class ChunkedAggregates:
+    '''
+        The mergeable aggregates of the students read so far.
+
+        Attributes:
+            size: The number of students
+            version: The fingerprint of the students read so far, whatever the size of the chunks
+            score_counts: The number of students of each rounded exam score
+            cells: One row per non-empty cell of score_dimensions (the exam
+                score being rounded to SCORE_DECIMALS), with the
+                measures of AggregateCube and 'radar_students' and
+                '<habit>_radar_sum', '<habit>_radar_min' and '<habit>_radar_max'
+                for each habit of the radar chart, or None before the first chunk
+            habit_groups: The groups of each habit of habit_group_columns
+            correlation: The CorrelationStats of corr_vars by demographic cell id,
+                or None before the first chunk
+            demographic_cells: The values of demographic_dimensions of each
+                demographic cell id, None for the missing ones
+    '''
+
+    def __init__(self):
+        self.size = 0
+        self._digest = hashlib.blake2b(digest_size=8)
+        self.score_counts = pd.Series(dtype=np.int64)
+        self.cells = None
+        self.habit_groups = None
+        self.correlation = None
+        self.demographic_cells = []
+        self._cell_ids = {}
+        self._cube = None
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        '''
+            Computes the aggregates of chunks of students, in a single pass.
+
+            Args:
+                chunks: An iterable of raw dataframes, e.g. from read_chunks
+            Returns:
+                The ChunkedAggregates of all the chunks
+        '''
+        aggregates = cls()
+        for chunk in chunks:
+            aggregates.add(chunk)
+        return aggregates
+
+    def add(self, chunk):
+        '''
+            Adds a chunk of students, in time proportional to its size and to the number of cells.
+
+            Args:
+                chunk: The raw dataframe of the students
+        '''
+        self._digest.update(_hash_rows(chunk))
+        # The quantile tiers of the chunk alone are not used
+        df = add_derived_columns(chunk)
+        scores = df['exam_score'].round(SCORE_DECIMALS)
+        self.size += len(df)
+        self.score_counts = self.score_counts.add(scores.value_counts(), fill_value=0).astype(np.int64)
+        self._add_cells(df, scores)
+        self._add_correlation(df)
+        self._cube = None
+
+    @property
+    def version(self):
+        '''
+            The fingerprint of the students read so far.
+        '''
+        return self._digest.hexdigest()
+
+    def _add_cells(self, df, scores):
+        cells, inverse = group_cells([df[column] for column in demographic_dimensions] + [scores], score_dimensions)
+        size = len(cells)
+        measures, self.habit_groups = get_cell_measures(df, inverse, size)
+
+        # The students the radar chart keeps, those without missing habit or score
+        values = df[_radar_columns].to_numpy(dtype=np.float64)
+        complete = ~np.isnan(values).any(axis=1) & df['exam_score'].notna().to_numpy()
+        measures['radar_students'] = np.bincount(inverse[complete], minlength=size)
+        lows, highs = _get_extremes(inverse[complete], values[complete], size)
+        for position, habit in enumerate(radar_habits):
+            measures[f'{habit}_radar_sum'] = np.bincount(inverse[complete], weights=values[complete, position],
+                                                         minlength=size)
+            measures[f'{habit}_radar_min'] = lows[:, position]
+            measures[f'{habit}_radar_max'] = highs[:, position]
+        for measure, values in measures.items():
+            cells[measure] = values
+
+        if self.cells is not None:
+            cells = _merge_cells(pd.concat([self.cells, cells], ignore_index=True), score_dimensions)
+        self.cells = cells
+
+    def _add_correlation(self, df):
+        # The students of the correlation heatmap: those the cluster model keeps, without missing habit
+        values = df[corr_vars]
+        complete = df[cluster_features + cluster_required + corr_vars].notna().all(axis=1).to_numpy()
+        cells, inverse = group_cells([df[column] for column in demographic_dimensions], demographic_dimensions)
+        cell_ids = np.array([self._get_cell_id(cell) for cell in cells.itertuples(index=False)], dtype=np.int64)
+        groups = cell_ids[inverse]
+
+        if self.correlation is None:
+            self.correlation = CorrelationStats.from_rows(values[complete], groups[complete])
+        else:
+            self.correlation = self.correlation.add(values[complete], groups[complete])
+
+    def _get_cell_id(self, cell):
+        key = tuple(None if pd.isna(value) else value for value in cell)
+        cell_id = self._cell_ids.get(key)
+        if cell_id is None:
+            cell_id = self._cell_ids[key] = len(self.demographic_cells)
+            self.demographic_cells.append(key)
+        return cell_id
+
+    def get_options(self, column):
+        '''
+            Lists the values of a filter column, or the bounds of a range column, as FilterIndex.get_options.
+        '''
+        values = np.sort(self.cells[column].dropna().unique()) if self.cells is not None else []
+        if column in filter_columns:
+            return list(values)
+        return [values[0], values[-1]] if len(values) else [0, 0]
+
+    def get_tier_cuts(self):
+        '''
+            Gets the cut points of every performance tier scheme, from the counts of the exam scores.
+        '''
+        return {
+            scheme: get_performance_tier_cuts_from_counts(self.score_counts, scheme)
+            for scheme in performance_tier_schemes
+        }
+
+    def get_cube(self):
+        '''
+            Gets the aggregate cube of the students, computing it on the first call.
+
+            Returns:
+                The AggregateCube, as get_cube computes it from the whole dataframe
+        '''
+        if self._cube is None:
+            cuts = self.get_tier_cuts()
+            cells = self.cells
+            dimensions = [cells[column] for column in demographic_dimensions] + [
+                get_performance_tiers(cells['exam_score'], scheme, cuts[scheme]) for scheme in tier_dimensions
+            ]
+            measures = [column for column in cells.columns
+                        if column not in score_dimensions and '_radar_' not in column and column != 'radar_students']
+            cube_cells, inverse = group_cells(dimensions, cube_dimensions)
+            for measure in measures:
+                sums = np.bincount(inverse, weights=cells[measure].to_numpy(dtype=np.float64), minlength=len(cube_cells))
+                cube_cells[measure] = sums.astype(cells[measure].dtype)
+            self._cube = AggregateCube(cube_cells, self.habit_groups,
+                                       {scheme: cuts[scheme] for scheme in tier_dimensions})
+        return self._cube
+
+    def get_radar_baseline(self, filters=None):
+        '''
+            Gets the mean normalized habits of each performance group of the radar chart.
+
+            Args:
+                filters: A dict of filters, as for FilterIndex.select, or None
+            Returns:
+                The group means and the means of the mid-level performers, as get_radar_baseline
+        '''
+        cells = self.cells[select_cells(self.cells, filters)]
+        cells = cells[cells['radar_students'] > 0]
+        # Min-max scaling to [0, 5] of the means, constant habits are left at 0 as MinMaxScaler does
+        low = cells[[f'{habit}_radar_min' for habit in radar_habits]].to_numpy().min(axis=0, initial=np.inf)
+        high = cells[[f'{habit}_radar_max' for habit in radar_habits]].to_numpy().max(axis=0, initial=-np.inf)
+        span = np.where(high > low, high - low, 1.0)
+
+        tiers = get_performance_tiers(cells['exam_score'], 'performance_tier_radar',
+                                      self.get_tier_cuts()['performance_tier_radar'])
+        performance_group = tiers.cat.rename_categories(
+            ['Low Performers', 'Mid-Level Performers', 'Top Performers']).rename('performance_group')
+        sums = cells[['radar_students'] + [f'{habit}_radar_sum' for habit in radar_habits]].groupby(
+            performance_group, observed=True).sum()
+        means = sums[[f'{habit}_radar_sum' for habit in radar_habits]].to_numpy() / sums[['radar_students']].to_numpy()
+        group_means = pd.DataFrame(5 * (means - low) / span, columns=radar_habits, index=sums.index).reset_index()
+        return sort_radar_groups(group_means, radar_habits)
+
+    def get_correlation_stats(self, filters=None):
+        '''
+            Gets the correlation statistics of the students selected by filters.
+
+            Args:
+                filters: A dict of filters, as for FilterIndex.select, or None
+            Returns:
+                The CorrelationStats of corr_vars, by demographic cell
+        '''
+        if not filters:
+            return self.correlation
+        cells = pd.DataFrame(self.demographic_cells, columns=demographic_dimensions)
+        return self.correlation.select(np.flatnonzero(select_cells(cells, filters)).tolist())
+
+
+def _merge_cells(cells, dimensions):
+    # Adds up the measures of the cells of the same values, keeping the extremes of the radar habits
+    merged, inverse = group_cells([cells[column] for column in dimensions], dimensions)
+    lows = [column for column in cells.columns if column.endswith('_radar_min')]
+    highs = [column for column in cells.columns if column.endswith('_radar_max')]
+    extremes = dict(zip(lows, _get_extremes(inverse, cells[lows].to_numpy(), len(merged))[0].T))
+    extremes.update(zip(highs, _get_extremes(inverse, cells[highs].to_numpy(), len(merged))[1].T))
+    for measure in cells.columns.difference(dimensions, sort=False):
+        if measure in extremes:
+            merged[measure] = extremes[measure]
+        else:
+            # The counts stay integers, the sums of integers below 2**53 being exact
+            sums = np.bincount(inverse, weights=cells[measure].to_numpy(dtype=np.float64), minlength=len(merged))
+            merged[measure] = sums.astype(cells[measure].dtype)
+    return merged
+
+
+def _get_extremes(inverse, values, size):
+    # The minimum and maximum of each column of values in each cell, infinite for the empty cells
+    lows, highs = np.full((size, values.shape[1]), np.inf), np.full((size, values.shape[1]), -np.inf)
+    grouped = pd.DataFrame(values).groupby(inverse)
+    low, high = grouped.min(), grouped.max()
+    lows[low.index] = low.to_numpy()
+    highs[high.index] = high.to_numpy()
+    return lows, highs
+
+
+def _hash_rows(chunk):
+    # The rows are hashed one by one, so that the fingerprint does not depend on
+    # the size of the chunks, and the numbers as floats, whatever the dtype of their chunk
+    columns = sorted(chunk.columns)
+    values = pd.DataFrame({
+        column: chunk[column].astype(np.float64) if pd.api.types.is_numeric_dtype(chunk[column])
+        else chunk[column].astype(object)
+        for column in columns
+    })
+    return pd.util.hash_pandas_object(values, index=False).values.tobytes()
+
+
+def _get_cluster_placeholder(aggregates, filters=None):
+    # The profiles are clusters of the rows, which the aggregates do not keep
+    fig = go.Figure()
+    fig.add_annotation(text="The student profiles are not drawn when the dataset is read out of core",
+                       x=0.5, y=0.5, xref='paper', yref='paper', showarrow=False, font=dict(size=16))
+    fig.update_xaxes(visible=False)
+    fig.update_yaxes(visible=False)
+    return fig
+
+
+# Builders of the figures drawn from the aggregates, as figures.figure_builders;
+# the correlation heatmap only has the choice of all the students
+figure_builders = {
+    'bar': lambda aggregates, filters=None: get_bar_chart_figure(None, filters, cube=aggregates.get_cube()),
+    'cluster': _get_cluster_placeholder,
+    'waffle': lambda aggregates, filters=None: get_waffle_figure(None, filters=filters, cube=aggregates.get_cube()),
+    'sankey': lambda aggregates, left_type, habit, filters=None: get_sankey_chart_figure(
+        None, left_type, habit, filters, cube=aggregates.get_cube()),
+    'correlation': lambda aggregates, selected_cluster='All students', filters=None: get_correlation_figure(
+        None, stats=aggregates.get_correlation_stats(filters)),
+    'radar': lambda aggregates, *user_values, filters=None: get_radar_chart(
+        None, user_data=normalize_user_values(user_values) if user_values else None,
+        baseline=aggregates.get_radar_baseline(filters)),
+}
+
+
+def build_figure(aggregates, name, *inputs, filters=None):
+    '''
+        Builds a figure from the aggregates.
+
+        Args:
+            aggregates: The ChunkedAggregates of the students
+            name: The name of the figure in figure_builders
+            inputs: The inputs of the figure builder, as for figures.build_figure
+            filters: A dict of filters, as for FilterIndex.select, or None
+        Returns:
+            The figure
+    '''
+    return figure_builders[name](aggregates, *inputs, filters=filters)
+
+
+def get_aggregate_figure_key(aggregates, name, *inputs, filters=None):
+    '''
+        Gets the cache key of a figure drawn from the aggregates, as figures.get_figure_key.
+    '''
+    return get_figure_key(aggregates.version, name, *inputs, selection=Selection(get_filter_key(filters)))
+
+
+def get_cached_figure(cache, aggregates, name, *inputs, filters=None):
+    '''
+        Gets a figure drawn from the aggregates from the cache, building it on a miss.
+
+        Args:
+            cache: The FigureCache to look the figure up in
+            aggregates: The ChunkedAggregates of the students
+            name: The name of the figure in figure_builders
+            inputs: The inputs of the figure builder
+            filters: A dict of filters, as for FilterIndex.select, or None
+        Returns:
+            The figure, as a dict
+    '''
+    return cache.get_or_build(get_aggregate_figure_key(aggregates, name, *inputs, filters=filters),
+                              lambda: build_figure(aggregates, name, *inputs, filters=filters))
+
+
+def get_figure_inputs():
+    '''
+        Lists every input combination of the figures drawn from the aggregates.
+
+        Returns:
+            A list of (name, inputs) pairs
+    '''
+    inputs = [('bar', ()), ('cluster', ()), ('waffle', ())]
+    inputs += [
+        ('sankey', (left['value'], habit['value']))
+        for left in sankey_left_type_options
+        for habit in sankey_habit_options
+    ]
+    inputs += [('correlation', ('All students',)), ('radar', ())]
+    return inputs
+
+
+def warm_up_directory(directory, data_path=None, chunk_size=CHUNK_SIZE, clear=False):
+    '''
+        Renders the figures of the aggregates of a dataset into a cache directory.
+
+        Args:
+            directory: The cache directory shared by the workers
+            data_path: A CSV file or a columnar directory, the app's dataset if None
+            chunk_size: The number of rows read at once
+            clear: Whether to delete the figures already in the directory
+        Returns:
+            The number of figures rendered
+    '''
+    aggregates = ChunkedAggregates.from_chunks(read_chunks(data_path, chunk_size))
+    cache = FigureCache(directory=directory)
+    if clear:
+        cache.clear()
+    rendered = 0
+    for name, inputs in get_figure_inputs():
+        key = get_aggregate_figure_key(aggregates, name, *inputs)
+        if cache.get(key) is None:
+            cache.put(key, pio.to_json(build_figure(aggregates, name, *inputs), validate=False))
+            rendered += 1
+    return rendered
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cache-dir', default=os.environ.get('FIGURE_CACHE_DIR'),
+                        help='figure cache directory (default: $FIGURE_CACHE_DIR)')
+    parser.add_argument('--data', default=os.environ.get('OUT_OF_CORE_DATA'),
+                        help='path of a CSV file or columnar directory (default: $OUT_OF_CORE_DATA, '
+                             'or the app\'s dataset)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='number of rows read at once')
+    parser.add_argument('--clear', action='store_true', help='delete the figures of previous builds first')
+    args = parser.parse_args(argv)
+    if not args.cache_dir:
+        parser.error('--cache-dir or FIGURE_CACHE_DIR is required')
+
+    count = warm_up_directory(args.cache_dir, args.data, args.chunk_size, args.clear)
+    print(f"Rendered {count} figures into {args.cache_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+'''
+    Contains the registry of the fitted cluster models shared by the visualisations.
+
+    The KMeans (and optional PCA) models are fitted on the shared feature
+    matrix of src.features once per dataset version and kept in memory, so
+    the figure builders and the callbacks only have to read the labels
+    instead of refitting on every interaction.
+
+    Large datasets are clustered with mini-batch KMeans. Rows appended to a
+    dataset are assigned to the existing clusters (and update the mini-batch
+    centroids) without refitting, and the registry can be saved to disk so
+    that a restarted worker does not refit either. The saved models are
+    loaded with joblib, which can run code while unpickling: the directory they
+    are saved in (FIGURE_CACHE_DIR) must only be writable by the app.
+'''
+import copy
+import hashlib
+import threading
+
+import joblib
+import numpy as np
+
+from src.figure_cache import FIGURE_CACHE_VERSION
+from src.features import (cluster_features, cluster_required, clear_feature_matrices,
+                          get_feature_matrix, get_feature_version)
+
+# Number of rows above which the clusters are fitted with mini-batch KMeans
+MINI_BATCH_THRESHOLD = 100000
+
+# Name of the file of the saved models, in the figure cache directory
+CLUSTER_MODELS_FILE = 'cluster_models.joblib'
+
+
+class ClusterModel:
+    '''
+        The fitted models and results of one clustering run.
+
+        Attributes:
+            features: The columns used for the clustering
+            index: The index of the rows that were clustered
+            positions: The positions of these rows in the dataframe
+            mean: The mean of each feature, from the feature matrix
+            scale: The standard deviation of each feature, from the feature matrix
+            kmeans: The fitted KMeans or MiniBatchKMeans model
+            labels: The cluster of each clustered row
+            centroids: The cluster centers, in the standardized space
+            pca: The fitted PCA model, or None
+            projection: The PCA coordinates of each clustered row, or None
+            persona_matches: The personas matched to the clusters, see src.personas
+            statistics: Statistics of the clusters computed by the figures, by name
+            lineage: A fingerprint of the data the model was fitted on and of
+                the rows it was then extended with, as models of the same data
+                fitted or extended differently have different clusters
+    '''
+
+    def __init__(self, features, index, positions, mean, scale, kmeans, pca=None, projection=None, labels=None,
+                 lineage=None):
+        self.features = features
+        self.index = index
+        self.positions = positions
+        self.mean = mean
+        self.scale = scale
+        self.kmeans = kmeans
+        self.labels = kmeans.labels_ if labels is None else labels
+        self.centroids = kmeans.cluster_centers_
+        self.pca = pca
+        self.projection = projection
+        self.persona_matches = {}
+        self.statistics = {}
+        self.lineage = lineage
+
+    def standardize(self, df):
+        '''
+            Standardizes rows as the feature matrix the model was fitted on.
+
+            Args:
+                df: The rows, with the features of the model
+            Returns:
+                The standardized features, as a float32 array
+        '''
+        values = df[list(self.features)].to_numpy(dtype=np.float64)
+        return ((values - self.mean) / self.scale).astype(np.float32)
+
+    def predict(self, df):
+        '''
+            Assigns rows to the nearest clusters, without changing the model.
+
+            Args:
+                df: The rows to assign, without missing features
+            Returns:
+                The cluster of each row
+        '''
+        return self.kmeans.predict(self.standardize(df))
+
+    def extend(self, df, positions, version):
+        '''
+            Adds new rows to the model, in time proportional to their number.
+
+            The standardization and the PCA are kept as they are. A mini-batch
+            model moves its centroids towards the new rows (partial_fit), a
+            full KMeans model keeps them. The previous rows keep their labels.
+
+            Args:
+                df: The new rows, without missing features
+                positions: The positions of the new rows in the whole dataframe
+                version: The feature version of the whole dataframe
+            Returns:
+                A new ClusterModel of the previous and new rows
+        '''
+        X = self.standardize(df)
+        kmeans = self.kmeans
+        if hasattr(kmeans, 'partial_fit'):
+            kmeans = copy.deepcopy(kmeans)
+            kmeans.partial_fit(X)
+
+        projection = self.projection
+        if self.pca is not None:
+            projection = np.concatenate([projection, self.pca.transform(X)])
+
+        labels = np.concatenate([self.labels, kmeans.predict(X)])
+        lineage = hashlib.blake2b(f'{self.lineage}+{version}'.encode(), digest_size=8).hexdigest()
+        return ClusterModel(self.features, self.index.append(df.index), np.concatenate([self.positions, positions]),
+                            self.mean, self.scale, kmeans, self.pca, projection, labels, lineage)
+
+
+_models = {}
+_lock = threading.Lock()
+
+
+def get_cluster_model(df, features, n_clusters=4, random_state=0, n_components=None):
+    '''
+        Gets the cluster model of the given data, fitting it on the first call.
+
+        The model is fitted on the columns of the shared feature matrix, so
+        rows missing one of the cluster features or details are left out.
+
+        Args:
+            df: The dataframe to cluster
+            features: The columns used for the clustering, among cluster_features
+            n_clusters: The number of clusters
+            random_state: The seed of the KMeans model
+            n_components: The number of PCA components to project on, if any
+        Returns:
+            The ClusterModel of the data
+    '''
+    key = _get_key(df, features, n_clusters, random_state, n_components)
+
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            model = _fit_cluster_model(get_feature_matrix(df), tuple(features),
+                                       n_clusters, random_state, n_components, lineage=key[0])
+            _models[key] = model
+    return model
+
+
+def get_cluster_lineage(df, features, n_clusters=4, random_state=0, n_components=None):
+    '''
+        Gets the lineage of the cluster model of the given data, without fitting it.
+
+        The figures drawn from a model are keyed by its lineage, so that the
+        figures of a model extended with streamed rows and those of a model
+        fitted on the same rows, e.g. by a restarted worker, are not mixed up.
+
+        Args:
+            (arguments): As for get_cluster_model
+        Returns:
+            The lineage of the registered model, or that of the model get_cluster_model would fit
+    '''
+    key = _get_key(df, features, n_clusters, random_state, n_components)
+    with _lock:
+        model = _models.get(key)
+    return key[0] if model is None else model.lineage
+
+
+def extend_cluster_model(df, n_new_rows, features, n_clusters=4, random_state=0, n_components=None):
+    '''
+        Gets the cluster model of data whose last rows were just appended,
+        reusing the model of the previous rows instead of refitting.
+
+        Args:
+            df: The dataframe with the appended rows at its end
+            n_new_rows: The number of appended rows
+            (other arguments): As for get_cluster_model
+        Returns:
+            The ClusterModel of the data, registered for its new version
+    '''
+    key = _get_key(df, features, n_clusters, random_state, n_components)
+    with _lock:
+        model = _models.get(key)
+    if model is not None:
+        return model
+
+    previous = get_cluster_model(df.iloc[:len(df) - n_new_rows], features,
+                                 n_clusters, random_state, n_components)
+    new_rows = df.iloc[len(df) - n_new_rows:]
+    complete = new_rows[cluster_features + cluster_required].notna().all(axis=1).to_numpy()
+    model = previous.extend(new_rows[complete], len(df) - n_new_rows + np.flatnonzero(complete), key[0])
+    # Another thread may have extended the same rows meanwhile, keep its model
+    with _lock:
+        return _models.setdefault(key, model)
+
+
+def _get_key(df, features, n_clusters, random_state, n_components):
+    return (get_feature_version(df), tuple(features), n_clusters, random_state, n_components)
+
+
+def _fit_cluster_model(matrix, features, n_clusters, random_state, n_components, lineage=None):
+    # scikit-learn is imported on the first fit to keep importing the app fast
+    # pylint: disable=import-outside-toplevel
+    from sklearn.decomposition import PCA
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    columns = matrix.get_columns(features)
+    # Only a subset of the features is copied out of the shared matrix
+    X = matrix.values if columns == list(range(len(matrix.features))) else matrix.values[:, columns]
+
+    pca, projection = None, None
+    if n_components is not None:
+        pca = PCA(n_components=n_components)
+        projection = pca.fit_transform(X)
+
+    if len(X) > MINI_BATCH_THRESHOLD:
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, batch_size=4096, n_init=3)
+    else:
+        kmeans = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10)
+    kmeans.fit(X)
+    return ClusterModel(features, matrix.index, matrix.positions, matrix.mean[columns], matrix.scale[columns],
+                        kmeans, pca, projection, lineage=lineage)
+
+
+def save_cluster_models(path):
+    '''
+        Saves every fitted model, with the dataset version it was fitted on
+        and the version of the code that fitted it.
+
+        Args:
+            path: The file to write
+    '''
+    with _lock:
+        models = dict(_models)
+    joblib.dump({'code_version': FIGURE_CACHE_VERSION, 'models': models}, path)
+
+
+def load_cluster_models(path):
+    '''
+        Loads models saved by save_cluster_models into the registry.
+
+        The models saved by another version of the code are ignored, as they
+        may not match the current clustering.
+
+        Args:
+            path: The file to read
+        Returns:
+            The number of models loaded
+    '''
+    saved = joblib.load(path)
+    if not isinstance(saved, dict) or saved.get('code_version') != FIGURE_CACHE_VERSION:
+        return 0
+    models = saved['models']
+    with _lock:
+        _models.update(models)
+    return len(models)
+
+
+def clear_cluster_models(df=None):
+    '''
+        Forgets the models fitted on a dataframe, e.g. once rows were appended
+        to it, or every fitted model after the dataset was reloaded.
+
+        Args:
+            df: The dataframe, None for every model
+    '''
+    with _lock:
+        if df is None:
+            _models.clear()
+        else:
+            version = get_feature_version(df)
+            for key in [key for key in _models if key[0] == version]:
+                del _models[key]
+    clear_feature_matrices(df)
@@ -1,70 +1,70 @@
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
-
-def get_cluster_figure(df):
-    # Features used for clustering
-    habits = [
-        'study_hours_per_day', 'social_media_hours', 'netflix_hours',
-        'exercise_frequency', 'exam_score','sleep_hours','mental_health_rating',
-        'social_media_hours', 'attendance_percentage'
-    ]
-    
-    # Drop rows with missing required fields
-    df = df.dropna(subset=habits + ['gender', 'age', 'extracurricular_participation', 'part_time_job'])
-    
-    # Normalize
-    X = StandardScaler().fit_transform(df[habits])
-    # PCA for 2D projection
-    pca = PCA(n_components=2)
-    df[['PC1', 'PC2']] = pca.fit_transform(X)
-    # Clustering
-    kmeans = KMeans(n_clusters=4, random_state=42)
-    df['cluster'] = kmeans.fit_predict(X)
-
-    # Define personas
-    cluster_map = {
-        0: {'name': 'The Academic Achiever', 'color': '#1f77b4', 'desc': 'Focused, healthy and top of the class.'},
-        1: {'name': 'The Balanced Learner', 'color': '#2ca02c', 'desc': 'Stable academic and personal life balance.'},
-        2: {'name': 'The Social Butterfly', 'color': '#ff7f0e', 'desc': 'Socially active, academically inconsistent.'},
-        3: {'name': 'The Minimalist', 'color': '#d62728', 'desc': 'Low engagement, just getting by.'}
-    }
-    # Assign profile names/colors/descriptions
-    df['profile'] = df['cluster'].map(lambda x: cluster_map[x]['name'])
-    df['color'] = df['cluster'].map(lambda x: cluster_map[x]['color'])
-    df['description'] = df['cluster'].map(lambda x: cluster_map[x]['desc'])
 
-    # Build rich hover text (to match marker color)
-    def make_hover(row):
-        return (
-            f"<span style='background-color:{row['color']}; padding:5px; display:block;'>"
-            f"<b>{row['profile']}</b></span><br>"
-            f"Gender: {row['gender']}<br>"
-            f"Age: {row['age']}<br>"
-            f"Extracurricular: {row['extracurricular_participation']}<br>"
-            f"Part-time Job: {row['part_time_job']}"
-        )
-
-    df['hover_card'] = df.apply(make_hover, axis=1)
+from src.cluster_model import extend_cluster_model, get_cluster_lineage, get_cluster_model
+from src.features import cluster_features
+from src.filters import is_selected
+from src.personas import match_personas, scatter_personas
+
+def get_cluster_figure(df, webgl_threshold=5000, max_points_per_cluster=5000, rows=None):
+    '''
+        Draws the students in the PCA plane, colored by profile.
+
+        Above webgl_threshold students, the markers are drawn with WebGL. Each
+        cluster is also downsampled to max_points_per_cluster students, keeping
+        its outliers, so that the figure size stays bounded.
+
+        Args:
+            df: The dataframe of the students
+            webgl_threshold: The number of students above which WebGL is used
+            max_points_per_cluster: The maximum number of students drawn per
+                cluster, None to draw all of them
+            rows: The positions of the selected students, None for all of them
+        Returns:
+            The figure
+    '''
+    # Normalize, project on 2 PCA components and cluster (fitted once per dataset version)
+    model = get_scatter_cluster_model(df)
+    # Keep only the clustered rows (those without missing required fields) that are selected,
+    # the clusters being those of all the students
+    keep = is_selected(model.positions, rows, len(df))
+    df = df.take(model.positions[keep])
+    df[['PC1', 'PC2']] = model.projection[keep]
+    df['cluster'] = model.labels[keep]
+
+    # Match the clusters to the personas by their centroids, whatever their labels
+    cluster_map = match_personas(model, scatter_personas)
+    # Per-student details shown in the hover card, the profile part of the card
+    # is the same for the whole cluster and is written once in its template
+    hover_columns = ['gender', 'age', 'extracurricular_participation', 'part_time_job']
 
     # Create figure manually for better control
+    scatter = go.Scattergl if len(df) > webgl_threshold else go.Scatter
+    shown = 0
     fig = go.Figure()
-    for cluster_id, group in df.groupby('cluster'):
-        fig.add_trace(go.Scatter(
+    # The traces follow the order of the personas, so the legend does not change with the labels
+    order = {persona['name']: position for position, persona in enumerate(scatter_personas)}
+    groups = sorted(df.groupby('cluster'), key=lambda item: order.get(cluster_map[item[0]]['name'], len(order) + item[0]))
+    for cluster_id, group in groups:
+        if max_points_per_cluster is not None:
+            group = downsample_cluster(group, max_points_per_cluster)
+        shown += len(group)
+        fig.add_trace(scatter(
             x=group['PC1'],
             y=group['PC2'],
             mode='markers',
             name=cluster_map[cluster_id]['name'],
             marker=dict(size=10, color=cluster_map[cluster_id]['color'], line=dict(width=1, color='black')),
-            customdata=group[['hover_card']],
-            hovertemplate="%{customdata[0]}<extra></extra>"
+            customdata=group[hover_columns],
+            hovertemplate=get_cluster_hover_template(cluster_map[cluster_id])
         ))
 
     fig.update_layout(
-        title="Patterns of Success: Student Profiles and Habit Clusters",
+        title="Patterns of Success: Student Profiles and Habit Clusters" + (
+            f" (sample of {shown} of {len(df)} students)" if shown < len(df) else ""
+        ),
         xaxis_title="PC1",
         yaxis_title="PC2",
         plot_bgcolor="white",
@@ -72,4 +72,79 @@ def get_cluster_figure(df):
         legend_title="Profile"
     )
     
-    return fig
\ No newline at end of file
+    return fig
+
+
+def get_scatter_cluster_model(df):
+    '''
+        Gets the cluster model of the scatter plot, fitting it on the first call.
+
+        Args:
+            df: The dataframe of the students
+        Returns:
+            The ClusterModel, with the 2D PCA projection of the students
+    '''
+    # Every habit of the shared feature matrix is used
+    return get_cluster_model(df, cluster_features, n_clusters=4, random_state=42, n_components=2)
+
+
+def extend_scatter_cluster_model(df, n_new_rows):
+    '''
+        Gets the cluster model of the scatter plot of data whose last rows
+        were just appended, assigning them to the clusters of the previous rows.
+
+        Args:
+            df: The dataframe of the students, with the appended rows at its end
+            n_new_rows: The number of appended rows
+        Returns:
+            The ClusterModel of the data
+    '''
+    return extend_cluster_model(df, n_new_rows, cluster_features, n_clusters=4, random_state=42, n_components=2)
+
+
+def get_scatter_cluster_lineage(df):
+    '''
+        Gets the lineage of the cluster model of the scatter plot, without fitting it.
+    '''
+    return get_cluster_lineage(df, cluster_features, n_clusters=4, random_state=42, n_components=2)
+
+
+def get_cluster_hover_template(persona):
+    # Build rich hover text (to match marker color)
+    return (
+        f"<span style='background-color:{persona['color']}; padding:5px; display:block;'>"
+        f"<b>{persona['name']}</b></span><br>"
+        "Gender: %{customdata[0]}<br>"
+        "Age: %{customdata[1]}<br>"
+        "Extracurricular: %{customdata[2]}<br>"
+        "Part-time Job: %{customdata[3]}<extra></extra>"
+    )
+
+
+def downsample_cluster(group, max_points, outlier_share=0.1, seed=0):
+    '''
+        Samples the students of a cluster, keeping its shape and its outliers.
+
+        The students farthest from the cluster center are always kept, the
+        others are sampled uniformly (with a fixed seed, so that the figure is
+        the same from one call to the next), which preserves the density.
+
+        Args:
+            group: The students of the cluster, with their PC1 and PC2
+            max_points: The number of students to keep
+            outlier_share: The share of the kept students chosen as outliers
+            seed: The seed of the sampling
+        Returns:
+            The kept students, in their original order
+    '''
+    if len(group) <= max_points:
+        return group
+
+    points = group[['PC1', 'PC2']].to_numpy()
+    distances = np.linalg.norm(points - points.mean(axis=0), axis=1)
+    n_outliers = int(max_points * outlier_share)
+    order = np.argsort(distances)
+    outliers = order[len(order) - n_outliers:]
+    others = np.random.RandomState(seed).choice(order[:len(order) - n_outliers],
+                                                max_points - n_outliers, replace=False)
+    return group.iloc[np.sort(np.concatenate([outliers, others]))]
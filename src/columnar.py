@@ -0,0 +1,216 @@
+'''
+    Contains the reader and writer of the columnar format of the dataset.
+
+    A dataset is stored as a directory holding one .npy file per column and a
+    schema.json file describing how to decode each of them:
+
+        - category: integer codes (-1 for missing) and the list of categories
+        - int: integers in the smallest dtype holding them
+        - decimal: integers to divide by a scale, for values with few decimals
+        - float: 64-bit floats
+        - string: integer codes (-1 for missing) into a second .npy file of
+          fixed-width unicode strings, decoded to objects with NaN for missing
+
+    In the shared layout, the numbers are instead stored undecoded in one 2D
+    array per dtype (float64.npy and int64.npy), laid out like the blocks of a
+    pandas dataframe. Memory-mapping them then gives a dataframe whose values
+    stay in the page cache, shared by every process reading the dataset.
+'''
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SCHEMA_FILE = 'schema.json'
+
+# Kind of each column of the student dataset, the other columns are stored as float or string
+dataset_schema = {
+    'student_id': 'string',
+    'age': 'int',
+    'gender': 'category',
+    'study_hours_per_day': 'decimal',
+    'social_media_hours': 'decimal',
+    'netflix_hours': 'decimal',
+    'part_time_job': 'category',
+    'attendance_percentage': 'decimal',
+    'sleep_hours': 'decimal',
+    'diet_quality': 'category',
+    'exercise_frequency': 'int',
+    'parental_education_level': 'category',
+    'internet_quality': 'category',
+    'mental_health_rating': 'int',
+    'extracurricular_participation': 'category',
+    'exam_score': 'decimal'
+}
+
+
+def write_columns(df, directory, schema=None, shared=False):
+    '''
+        Writes a dataframe in the columnar format.
+
+        Columns that cannot be stored losslessly in their kind (e.g. integers
+        with missing values) are stored as floats or strings instead.
+
+        Args:
+            df: The dataframe to write
+            directory: The directory to write the columns to
+            schema: The kind of each column, dataset_schema if None
+            shared: Whether to use the shared layout for the numbers
+    '''
+    schema = dataset_schema if schema is None else schema
+    os.makedirs(directory, exist_ok=True)
+
+    columns = []
+    blocks = {}
+    for position, column in enumerate(df.columns):
+        kind = schema.get(column) or ('float' if pd.api.types.is_numeric_dtype(df[column]) else 'string')
+        if shared and kind in ('int', 'decimal', 'float'):
+            values, meta = _encode_shared(df[column], kind)
+            block = blocks.setdefault(meta['file'], [])
+            meta.update(name=column, row=len(block))
+            block.append(values)
+        else:
+            values, meta = _encode(df[column], kind)
+            meta.update(name=column, file=f'{position:03d}.npy')
+            np.save(os.path.join(directory, meta['file']), values, allow_pickle=False)
+            if meta['kind'] == 'string':
+                meta['strings'] = f'{position:03d}-strings.npy'
+                np.save(os.path.join(directory, meta['strings']), meta.pop('values'), allow_pickle=False)
+        columns.append(meta)
+
+    for file_name, block in blocks.items():
+        np.save(os.path.join(directory, file_name), np.stack(block), allow_pickle=False)
+
+    with open(os.path.join(directory, SCHEMA_FILE), 'w', encoding='utf-8') as file:
+        json.dump({'columns': columns, 'rows': len(df)}, file, indent=2)
+
+
+def read_columns(directory, mmap_mode=None):
+    '''
+        Reads a dataframe written in the columnar format.
+
+        Args:
+            directory: The directory of the columns
+            mmap_mode: The mode to memory-map the column files with, or None to read them
+        Returns:
+            The dataframe
+    '''
+    with open(os.path.join(directory, SCHEMA_FILE), encoding='utf-8') as file:
+        schema = json.load(file)
+
+    data = {}
+    blocks = {}
+    for meta in schema['columns']:
+        if 'row' in meta:
+            blocks.setdefault(meta['file'], []).append(meta['name'])
+            continue
+        values = np.load(os.path.join(directory, meta['file']), mmap_mode=mmap_mode, allow_pickle=False)
+        data[meta['name']] = _decode(values, meta, _load_strings(directory, meta))
+
+    # Each block of the shared layout becomes a single pandas block, without copy
+    frames = [
+        pd.DataFrame(np.load(os.path.join(directory, file_name), mmap_mode=mmap_mode, allow_pickle=False).T,
+                     columns=names, copy=False)
+        for file_name, names in blocks.items()
+    ]
+    frames.append(pd.DataFrame(data, copy=not blocks))
+    return pd.concat(frames, axis=1, copy=False)
+
+
+def iter_columns(directory, chunk_size):
+    '''
+        Reads a dataframe written in the columnar format in chunks of rows.
+
+        The column files are memory-mapped, so only the rows of the current
+        chunk are decoded in memory.
+
+        Args:
+            directory: The directory of the columns
+            chunk_size: The number of rows of each chunk
+        Yields:
+            The dataframe of each chunk of rows, with the columns in their written order
+    '''
+    with open(os.path.join(directory, SCHEMA_FILE), encoding='utf-8') as file:
+        schema = json.load(file)
+
+    files = {
+        meta['file']: np.load(os.path.join(directory, meta['file']), mmap_mode='r', allow_pickle=False)
+        for meta in schema['columns']
+    }
+    strings = {meta['name']: _load_strings(directory, meta) for meta in schema['columns']}
+    for start in range(0, schema['rows'], chunk_size):
+        data = {}
+        for meta in schema['columns']:
+            values = files[meta['file']]
+            values = values[meta['row'], start:start + chunk_size] if 'row' in meta else values[start:start + chunk_size]
+            data[meta['name']] = _decode(np.array(values), meta, strings[meta['name']])
+        yield pd.DataFrame(data, index=pd.RangeIndex(start, start + len(values)))
+
+
+def has_columns(directory):
+    '''
+        Tells whether a dataset was written in the columnar format in the directory.
+    '''
+    return os.path.isfile(os.path.join(directory, SCHEMA_FILE))
+
+
+def _encode(series, kind):
+    if kind == 'category':
+        categorical = pd.Categorical(series)
+        codes = categorical.codes.astype(np.min_scalar_type(-len(categorical.categories) - 1))
+        return codes, {'kind': kind, 'categories': categorical.categories.tolist()}
+
+    if kind in ('int', 'decimal') and len(series) and series.notna().all():
+        values = series.to_numpy(dtype=np.float64)
+        decimals = _count_decimals(values, max_decimals=0 if kind == 'int' else 4)
+        if decimals is not None and np.abs(values).max() * 10 ** decimals < 2 ** 53:
+            scaled = np.round(values * 10 ** decimals)
+            dtype = np.promote_types(np.int8, np.promote_types(np.min_scalar_type(int(scaled.min())),
+                                                               np.min_scalar_type(int(scaled.max()))))
+            if kind == 'int':
+                return scaled.astype(dtype), {'kind': 'int'}
+            return scaled.astype(dtype), {'kind': 'decimal', 'scale': 10 ** decimals}
+
+    if kind in ('int', 'decimal', 'float'):
+        return series.to_numpy(dtype=np.float64), {'kind': 'float'}
+
+    codes, uniques = pd.factorize(series)
+    codes = codes.astype(np.min_scalar_type(-len(uniques) - 1))
+    return codes, {'kind': 'string', 'values': np.asarray(uniques, dtype=object).astype(str)}
+
+
+def _encode_shared(series, kind):
+    if kind == 'int' and len(series) and series.notna().all():
+        values = series.to_numpy(dtype=np.float64)
+        if np.array_equal(np.round(values), values):
+            return values.astype(np.int64), {'kind': 'int', 'file': 'int64.npy'}
+    return series.to_numpy(dtype=np.float64), {'kind': 'float', 'file': 'float64.npy'}
+
+
+def _load_strings(directory, meta):
+    if 'strings' not in meta:
+        return None
+    # The missing code -1 picks the NaN appended after the strings
+    strings = np.load(os.path.join(directory, meta['strings']), allow_pickle=False)
+    return np.append(strings.astype(object), np.nan)
+
+
+def _decode(values, meta, strings=None):
+    kind = meta['kind']
+    if kind == 'category':
+        return pd.Categorical.from_codes(values, categories=meta['categories'])
+    if kind == 'decimal':
+        return values / meta['scale']
+    if kind == 'string':
+        return strings[values]
+    return values
+
+
+def _count_decimals(values, max_decimals=4):
+    # Smallest number of decimals representing every value exactly, None if there is none
+    for decimals in range(max_decimals + 1):
+        scale = 10 ** decimals
+        if np.array_equal(np.round(values * scale) / scale, values):
+            return decimals
+    return None
@@ -1,39 +1,129 @@
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
 
-# Fonction pour attribuer des clusters et noms
-def assign_cluster_labels(df, n_clusters=4):
-    habits = [
-        'sleep_hours', 'study_hours_per_day', 'netflix_hours',
-        'mental_health_rating', 'social_media_hours', 'attendance_percentage'
-    ]
+from src.cluster_model import extend_cluster_model, get_cluster_lineage, get_cluster_model
+from src.correlation_stats import CorrelationStats
+from src.filters import is_selected
+from src.personas import heatmap_personas, match_personas
 
-    df = df.dropna(subset=habits + ['gender'])
-    
+# Habits the heatmap clusters are fitted on
+cluster_habits = [
+    'sleep_hours', 'study_hours_per_day', 'netflix_hours',
+    'mental_health_rating', 'social_media_hours', 'attendance_percentage'
+]
 
-    X = StandardScaler().fit_transform(df[habits])
-    kmeans = KMeans(n_clusters=n_clusters, random_state=0)
-    df['cluster'] = kmeans.fit_predict(X)
+# Habits shown in the heatmap
+corr_vars = [
+    'study_hours_per_day', 'social_media_hours', 'netflix_hours',
+    'attendance_percentage', 'sleep_hours', 'exercise_frequency',
+    'mental_health_rating', 'exam_score'
+]
 
-    cluster_labels = {
-        0: "The Bookworm",
-        1: "The Balanced Learner",
-        2: "The Media Addict",
-        3: "The Minimalist"
-    }
-    df['cluster_name'] = df['cluster'].map(cluster_labels).fillna("Cluster " + df['cluster'].astype(str))
-    return df
+# Fonction pour attribuer des clusters et noms
+def assign_cluster_labels(df, n_clusters=4):
+    # The model is fitted once per dataset version and shared with the other figures
+    model = get_cluster_model(df, cluster_habits, n_clusters=n_clusters, random_state=0)
+    df = df.loc[model.index].assign(cluster=model.labels)
 
-def get_correlation_figure(df, selected_cluster='All students'):
-    df = assign_cluster_labels(df)
+    df['cluster_name'] = df['cluster'].map(get_cluster_names(model))
+    return df
 
-    corr_vars = [
-        'study_hours_per_day', 'social_media_hours', 'netflix_hours',
-        'attendance_percentage', 'sleep_hours', 'exercise_frequency',
-        'mental_health_rating', 'exam_score'
-    ]
+def get_heatmap_cluster_lineage(df, n_clusters=4):
+    '''
+        Gets the lineage of the cluster model of the heatmap, without fitting it.
+    '''
+    return get_cluster_lineage(df, cluster_habits, n_clusters=n_clusters, random_state=0)
+
+def get_cluster_names(model):
+    '''
+        Gets the name of each cluster of the heatmap.
+
+        Args:
+            model: The cluster model of the heatmap
+        Returns:
+            A dict of the name of each cluster label
+    '''
+    # Match the clusters to the personas by their centroids, whatever their labels
+    return {label: persona['name'] for label, persona in match_personas(model, heatmap_personas).items()}
+
+def get_correlation_stats(df, n_clusters=4, variables=None, rows=None):
+    '''
+        Gets the correlation statistics of the clusters, computing them once per
+        cluster model (and for every call when some students are selected).
+
+        Args:
+            df: The dataframe of the students
+            n_clusters: The number of clusters
+            variables: The habits to correlate, corr_vars if None
+            rows: The positions of the selected students, None for all of them
+        Returns:
+            The CorrelationStats of the habits, grouped by cluster label
+    '''
+    variables = corr_vars if variables is None else list(variables)
+    model = get_cluster_model(df, cluster_habits, n_clusters=n_clusters, random_state=0)
+    key = ('correlation',) + tuple(variables)
+    stats = model.statistics.get(key) if rows is None else None
+    if stats is None:
+        keep = is_selected(model.positions, rows, len(df))
+        values = df[variables].take(model.positions[keep])
+        complete = values.notna().all(axis=1).to_numpy()
+        stats = CorrelationStats.from_rows(values[complete], model.labels[keep][complete])
+        if rows is None:
+            model.statistics[key] = stats
+    return stats
+
+def extend_correlation_stats(df, n_new_rows, n_clusters=4, variables=None):
+    '''
+        Gets the correlation statistics of data whose last rows were just
+        appended, adding the new rows to the statistics of the previous ones.
+
+        Args:
+            df: The dataframe with the appended rows at its end
+            n_new_rows: The number of appended rows
+            n_clusters: The number of clusters
+            variables: The habits to correlate, corr_vars if None
+        Returns:
+            The CorrelationStats of the habits, grouped by cluster label
+    '''
+    variables = corr_vars if variables is None else list(variables)
+    key = ('correlation',) + tuple(variables)
+    previous_df = df.iloc[:len(df) - n_new_rows]
+    previous = get_cluster_model(previous_df, cluster_habits, n_clusters=n_clusters, random_state=0)
+    model = extend_cluster_model(df, n_new_rows, cluster_habits, n_clusters=n_clusters, random_state=0)
+
+    # A model refitted on the whole data relabels the previous rows, whose statistics are then recomputed
+    start = len(previous.labels)
+    if key in model.statistics or not np.array_equal(model.labels[:start], previous.labels):
+        return get_correlation_stats(df, n_clusters, variables)
+
+    values = df[variables].take(model.positions[start:])
+    complete = values.notna().all(axis=1).to_numpy()
+    stats = get_correlation_stats(previous_df, n_clusters, variables).add(values[complete], model.labels[start:][complete])
+    model.statistics[key] = stats
+    return stats
+
+def get_cluster_choices(df):
+    '''
+        Lists the choices of the cluster dropdown of the heatmap.
+    '''
+    return ["All students"] + sorted(assign_cluster_labels(df)['cluster_name'].unique())
+
+def get_correlation_figure(df, selected_cluster='All students', variables=None, rows=None, stats=None):
+    '''
+        Draws the correlation matrix of the habits of a cluster.
+
+        Args:
+            df: The dataframe of the students
+            selected_cluster: The name of the cluster, or "All students"
+            variables: The habits to correlate, corr_vars if None (e.g. every numeric column)
+            rows: The positions of the selected students, None for all of them
+            stats: The CorrelationStats of all the students to draw instead of
+                those of the clusters of df (e.g. computed out of core), only
+                for "All students"
+        Returns:
+            The figure
+    '''
 
     habits_names = {
         'study_hours_per_day': 'Study Hours Per Day',
@@ -46,30 +136,27 @@ def get_correlation_figure(df, selected_cluster='All students'):
         'exam_score': 'Exam Score'
     }
 
-    df_corr = df[corr_vars + ['cluster_name']].dropna()
-
+    # Derived from the statistics of the clusters, without scanning the students
+    if stats is None:
+        stats = get_correlation_stats(df, variables=variables, rows=rows)
     if selected_cluster == "All students":
-        subset = df_corr[corr_vars]
+        corr_matrix = stats.get_correlation()
     else:
-        subset = df_corr[df_corr['cluster_name'] == selected_cluster][corr_vars]
-
-    corr_matrix = subset.corr().round(2)
-    corr_matrix.rename(columns=habits_names, index=habits_names, inplace=True)
+        model = get_cluster_model(df, cluster_habits, n_clusters=4, random_state=0)
+        corr_matrix = stats.get_correlation(
+            [label for label, name in get_cluster_names(model).items() if name == selected_cluster])
 
-    hovertext = [
-        [
-            f"<b>{x}</b> vs <b>{y}</b><br>Correlation: {corr_matrix.loc[y, x]:.2f}<br>{interpret_correlation(corr_matrix.loc[y, x])}"
-            for x in corr_matrix.columns
-        ]
-        for y in corr_matrix.index
-    ]
+    corr_matrix = corr_matrix.round(2)
+    names = [habits_names.get(column, column.replace('_', ' ').title()) for column in corr_matrix.columns]
 
+    # The interpretation of every cell is looked up at once, and the rest of
+    # the hover text is filled in by plotly from the template
     fig = go.Figure(go.Heatmap(
         z=corr_matrix.values,
-        x=corr_matrix.columns,
-        y=corr_matrix.index,
-        text=hovertext,
-        hoverinfo="text", 
+        x=names,
+        y=names,
+        customdata=interpret_correlation(corr_matrix.values),
+        hovertemplate="<b>%{x}</b> vs <b>%{y}</b><br>Correlation: %{z:.2f}<br>%{customdata}<extra></extra>",
         zmin=-1, zmax=1,
         colorscale='RdBu',
         colorbar=dict(
@@ -100,19 +187,24 @@ def get_correlation_figure(df, selected_cluster='All students'):
 
 
 def interpret_correlation(r):
-    if r >= 0.7:
-        return "Strong positive relationship"
-    elif r >= 0.4:
-        return "Moderate positive correlation"
-    elif r >= 0.1:
-        return "Weak positive relationship"
-    elif r <= -0.7:
-        return "Strong negative relationship"
-    elif r <= -0.4:
-        return "Moderate negative correlation"
-    elif r <= -0.1:
-        return "Weak negative relationship"
-    else:
-        return "No meaningful correlation"
-    
-
+    '''
+        Interprets correlation coefficients.
+
+        Args:
+            r: A correlation coefficient, or an array of them
+        Returns:
+            The interpretation of each coefficient, as an array of strings
+    '''
+    r = np.asarray(r, dtype=float)
+    return np.select(
+        [r >= 0.7, r >= 0.4, r >= 0.1, r <= -0.7, r <= -0.4, r <= -0.1],
+        [
+            "Strong positive relationship",
+            "Moderate positive correlation",
+            "Weak positive relationship",
+            "Strong negative relationship",
+            "Moderate negative correlation",
+            "Weak negative relationship"
+        ],
+        default="No meaningful correlation"
+    )
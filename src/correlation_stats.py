@@ -0,0 +1,110 @@
+'''
+    Contains the sufficient statistics of the correlations between habits.
+
+    For each group of students, the count, the sums and the sums of the
+    cross-products of the habits are enough to derive their correlation
+    matrix in O(k²) for k habits, without scanning the rows again. The
+    statistics of new rows are simply added, so they can follow a growing
+    dataset.
+'''
+import numpy as np
+import pandas as pd
+
+
+class CorrelationStats:
+    '''
+        The count, sums and cross-products of the habits of each group.
+
+        The values are shifted by the mean of the first rows before being
+        summed, which keeps the differences of sums numerically accurate.
+
+        Attributes:
+            features: The names of the habits
+            shift: The values subtracted from the habits before summing them
+            counts: The number of rows of each group
+            sums: The sums of the shifted habits of each group
+            cross: The sums of the cross-products of the shifted habits of each group
+    '''
+
+    def __init__(self, features, shift):
+        self.features = list(features)
+        self.shift = np.asarray(shift, dtype=np.float64)
+        self.counts = {}
+        self.sums = {}
+        self.cross = {}
+
+    @classmethod
+    def from_rows(cls, values, groups):
+        '''
+            Computes the statistics of rows.
+
+            Args:
+                values: A dataframe of the habits of the rows, without missing values
+                groups: The group of each row
+            Returns:
+                The CorrelationStats of the rows
+        '''
+        stats = cls(values.columns, values.mean().fillna(0).to_numpy())
+        return stats.add(values, groups)
+
+    def add(self, values, groups):
+        '''
+            Adds rows to the statistics, in time proportional to their number.
+
+            Args:
+                values: A dataframe of the habits of the rows, without missing values
+                groups: The group of each row
+            Returns:
+                New statistics, including the rows
+        '''
+        stats = CorrelationStats(self.features, self.shift)
+        stats.counts, stats.sums, stats.cross = dict(self.counts), dict(self.sums), dict(self.cross)
+
+        X = values[self.features].to_numpy(dtype=np.float64) - self.shift
+        groups = np.asarray(groups)
+        # The rows are sorted by group once, rather than selected once per group
+        order = np.argsort(groups, kind='stable')
+        unique, starts = np.unique(groups[order], return_index=True)
+        for group, rows in zip(unique, np.split(X[order], starts[1:])):
+            stats.counts[group] = stats.counts.get(group, 0) + len(rows)
+            stats.sums[group] = stats.sums.get(group, 0) + rows.sum(axis=0)
+            stats.cross[group] = stats.cross.get(group, 0) + rows.T @ rows
+        return stats
+
+    def select(self, groups):
+        '''
+            Keeps the statistics of some groups.
+
+            Args:
+                groups: The groups to keep
+            Returns:
+                New statistics, of the given groups only
+        '''
+        stats = CorrelationStats(self.features, self.shift)
+        for group in groups:
+            if group in self.counts:
+                stats.counts[group] = self.counts[group]
+                stats.sums[group] = self.sums[group]
+                stats.cross[group] = self.cross[group]
+        return stats
+
+    def get_correlation(self, groups=None):
+        '''
+            Derives the correlation matrix of some groups, as DataFrame.corr would.
+
+            Args:
+                groups: The groups to consider together, all of them if None
+            Returns:
+                The correlation matrix, NaN where it is undefined
+        '''
+        groups = list(self.counts) if groups is None else [group for group in groups if group in self.counts]
+        k = len(self.features)
+        n = sum(self.counts[group] for group in groups)
+        sums = sum((self.sums[group] for group in groups), np.zeros(k))
+        cross = sum((self.cross[group] for group in groups), np.zeros((k, k)))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = (cross - np.outer(sums, sums) / n) / (n - 1)
+            std = np.sqrt(np.diag(cov))
+            corr = np.clip(cov / np.outer(std, std), -1, 1)
+        return pd.DataFrame(corr, index=self.features, columns=self.features)
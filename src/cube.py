@@ -0,0 +1,298 @@
+'''
+    Contains the aggregate cube of the students, from which the bar, waffle
+    and sankey charts are drawn.
+
+    The students are grouped into cells by their demographics and performance
+    tiers. Each cell holds the number of its students, the counts, sums and
+    sums of squares of their numeric habits, and the number of them in each
+    habit group. A chart then adds up the cells it needs,
+    whatever the filters, in time proportional to the number of cells
+    instead of the number of students.
+
+    The habit groups are counts rather than dimensions, as crossing the
+    groups of the seven habits would make more cells than students. The
+    cube of appended rows is merged into the cube of the previous rows, as
+    long as the quantile tiers of the previous rows did not change.
+
+    The cells have no cluster dimension, so that the charts drawn from the
+    cube do not wait for the clusters to be fitted.
+'''
+import threading
+
+import numpy as np
+import pandas as pd
+
+from src.dataset import get_dataset_version
+from src.filters import filter_columns, get_filter_key, range_columns
+from src.preprocess import get_performance_tier_cuts, habit_group_columns, with_derived_columns
+
+# Performance tier schemes the cells are split by
+tier_dimensions = ['performance_tier', 'performance_tier_bar']
+
+# Dimensions of the cells
+cube_dimensions = filter_columns + range_columns + tier_dimensions
+
+# Numeric columns whose counts, sums and sums of squares are kept
+cube_measures = [
+    'study_hours_per_day', 'social_media_hours', 'netflix_hours', 'sleep_hours',
+    'diet_quality_numeric', 'exercise_frequency', 'mental_health_rating',
+    'attendance_percentage', 'exam_score'
+]
+
+# Raw columns the cube is computed from
+_source_columns = sorted(set(
+    filter_columns + range_columns + habit_group_columns + ['attendance_percentage', 'exam_score']
+))
+
+
+class AggregateCube:
+    '''
+        The aggregates of the students, by cell of the dimensions.
+
+        Attributes:
+            cells: One row per non-empty cell, with the values of the dimensions
+                (NaN when missing) and the measures: 'students', then
+                '<measure>_count', '<measure>_sum' and '<measure>_sumsq' for
+                each of cube_measures and '<habit>_group=<group>' for each
+                habit group
+            habit_groups: The groups of each habit of habit_group_columns
+            tier_cuts: The cut points of the performance tiers of the rows
+    '''
+
+    def __init__(self, cells, habit_groups, tier_cuts):
+        self.cells = cells
+        self.habit_groups = habit_groups
+        self.tier_cuts = tier_cuts
+
+    @classmethod
+    def from_rows(cls, df, tier_cuts):
+        '''
+            Computes the cube of rows, in a single pass over each column.
+
+            Args:
+                df: The students, with the derived columns
+                tier_cuts: The cut points of the performance tiers of the students
+            Returns:
+                The AggregateCube of the rows
+        '''
+        cells, inverse = group_cells([df[column] for column in cube_dimensions])
+        measures, habit_groups = get_cell_measures(df, inverse, len(cells))
+        for measure, values in measures.items():
+            cells[measure] = values
+        return cls(cells, habit_groups, tier_cuts)
+
+    def add(self, df, tier_cuts):
+        '''
+            Adds rows to the cube, in time proportional to their number and to the number of cells.
+
+            The tiers of the previous rows must not depend on the new rows,
+            which is the case when tier_cuts are those of the cube.
+
+            Args:
+                df: The new students, with the derived columns
+                tier_cuts: The cut points of the performance tiers of all the students
+            Returns:
+                A new AggregateCube, including the rows
+        '''
+        new = AggregateCube.from_rows(df, tier_cuts)
+        both = pd.concat([self.cells, new.cells], ignore_index=True)
+        cells, inverse = group_cells([both[column] for column in cube_dimensions])
+        for measure in both.columns.difference(cube_dimensions, sort=False):
+            sums = np.bincount(inverse, weights=both[measure].to_numpy(dtype=np.float64), minlength=len(cells))
+            # The counts stay integers, the sums of integers below 2**53 being exact
+            cells[measure] = sums.astype(both[measure].dtype)
+        return AggregateCube(cells, self.habit_groups, tier_cuts)
+
+    def aggregate(self, by, filters=None):
+        '''
+            Adds up the measures of the selected cells, by values of some dimensions.
+
+            Args:
+                by: The dimensions to group the cells by
+                filters: A dict of filters, as for FilterIndex.select, or None
+            Returns:
+                A dataframe of the summed measures, indexed by the values of
+                the dimensions (NaN for the missing ones)
+        '''
+        measures = self.cells.columns.difference(cube_dimensions, sort=False)
+        return self.cells[select_cells(self.cells, filters)].groupby(by, dropna=False)[measures].sum()
+
+
+def get_means(aggregates, measures):
+    '''
+        Derives the means of measures from their aggregates, ignoring missing values.
+
+        Args:
+            aggregates: A row of the aggregates of AggregateCube.aggregate
+            measures: The measures, among cube_measures
+        Returns:
+            A series of the means, NaN when there is no value
+    '''
+    sums = aggregates[[f'{measure}_sum' for measure in measures]].to_numpy(dtype=np.float64)
+    counts = aggregates[[f'{measure}_count' for measure in measures]].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.Series(sums / counts, index=measures)
+
+
+def select_cells(cells, filters):
+    '''
+        Tells which cells hold the students selected by filters.
+
+        Args:
+            cells: A dataframe of cells, with the filter and range columns
+            filters: A dict of filters, as for FilterIndex.select, or None
+        Returns:
+            A boolean array, True for the selected cells
+    '''
+    selected = np.ones(len(cells), dtype=bool)
+    for column, values in get_filter_key(filters):
+        if column in range_columns:
+            selected &= cells[column].between(*values).to_numpy()
+        else:
+            selected &= cells[column].isin(values).to_numpy()
+    return selected
+
+
+def group_cells(dimensions, names=None):
+    '''
+        Numbers the distinct combinations of values of some dimensions,
+        missing values included, in the order of the values.
+
+        Args:
+            dimensions: The values of each dimension, as series of the same length
+            names: The names of the dimensions, cube_dimensions if None
+        Returns:
+            A dataframe of the combinations, and the combination of each row
+    '''
+    names = cube_dimensions if names is None else names
+    key = np.zeros(len(dimensions[0]), dtype=np.int64)
+    uniques = []
+    for values in dimensions:
+        codes, values_uniques = pd.factorize(values, sort=True)
+        uniques.append(np.asarray(values_uniques, dtype=object))
+        key = key * (len(values_uniques) + 1) + (codes + 1)
+    cell_keys, inverse = np.unique(key, return_inverse=True)
+
+    cells = {}
+    for column, values_uniques in zip(reversed(names), reversed(uniques)):
+        digits = cell_keys % (len(values_uniques) + 1)
+        cell_keys = cell_keys // (len(values_uniques) + 1)
+        column_values = pd.Series(values_uniques[np.maximum(digits - 1, 0)] if len(values_uniques)
+                                  else np.full(len(digits), np.nan, dtype=object))
+        column_values[digits == 0] = np.nan
+        cells[column] = column_values.infer_objects()
+    return pd.DataFrame({column: cells[column] for column in names}), inverse
+
+
+def get_cell_measures(df, inverse, size):
+    '''
+        Computes the measures of the cube of rows grouped into cells.
+
+        Args:
+            df: The rows, with the derived columns
+            inverse: The cell of each row
+            size: The number of cells
+        Returns:
+            A dict of the values of each measure, in the order of the cube,
+            and the groups of each habit of habit_group_columns
+    '''
+    measures = {'students': np.bincount(inverse, minlength=size)}
+    for measure in cube_measures:
+        values = df[measure].to_numpy(dtype=np.float64)
+        known = ~np.isnan(values)
+        values = np.where(known, values, 0)
+        measures[f'{measure}_count'] = np.bincount(inverse[known], minlength=size)
+        measures[f'{measure}_sum'] = np.bincount(inverse, weights=values, minlength=size)
+        measures[f'{measure}_sumsq'] = np.bincount(inverse, weights=values * values, minlength=size)
+
+    habit_groups = {}
+    for habit in habit_group_columns:
+        groups = df[habit + '_group'].cat
+        habit_groups[habit] = groups.categories.tolist()
+        codes = groups.codes.to_numpy()
+        for code, group in enumerate(habit_groups[habit]):
+            measures[f'{habit}_group={group}'] = np.bincount(inverse[codes == code], minlength=size)
+    return measures, habit_groups
+
+
+def _get_tier_cuts(df):
+    return {scheme: get_performance_tier_cuts(df['exam_score'], scheme) for scheme in tier_dimensions}
+
+
+_cubes = {}
+_lock = threading.Lock()
+
+
+def get_cube_version(df):
+    '''
+        Computes the fingerprint of the columns the cube depends on.
+    '''
+    return get_dataset_version(df, _source_columns)
+
+
+def get_cube(df):
+    '''
+        Gets the aggregate cube of the data, computing it on the first call.
+
+        Args:
+            df: The dataframe of the students
+        Returns:
+            The AggregateCube of the data, shared between calls
+    '''
+    version = get_cube_version(df)
+    with _lock:
+        cube = _cubes.get(version)
+        if cube is None:
+            df = with_derived_columns(df)
+            cube = AggregateCube.from_rows(df, _get_tier_cuts(df))
+            _cubes[version] = cube
+    return cube
+
+
+def extend_cube(df, n_new_rows):
+    '''
+        Gets the aggregate cube of data whose last rows were just appended,
+        merging the new rows into the cube of the previous rows.
+
+        The cube is recomputed instead when the appended rows moved the
+        quantile tiers of the previous rows.
+
+        Args:
+            df: The dataframe with the appended rows at its end
+            n_new_rows: The number of appended rows
+        Returns:
+            The AggregateCube of the data, registered for its new version
+    '''
+    version = get_cube_version(df)
+    with _lock:
+        cube = _cubes.get(version)
+    if cube is not None:
+        return cube
+
+    start = len(df) - n_new_rows
+    previous = get_cube(df.iloc[:start])
+    df = with_derived_columns(df)
+    tier_cuts = _get_tier_cuts(df)
+
+    if tier_cuts != previous.tier_cuts:
+        cube = AggregateCube.from_rows(df, tier_cuts)
+    else:
+        cube = previous.add(df.iloc[start:], tier_cuts)
+    with _lock:
+        _cubes[version] = cube
+    return cube
+
+
+def clear_cubes(df=None):
+    '''
+        Forgets the cube of a dataframe, e.g. once rows were appended to it,
+        or every cube after the dataset was reloaded.
+
+        Args:
+            df: The dataframe, None for every cube
+    '''
+    with _lock:
+        if df is None:
+            _cubes.clear()
+        else:
+            _cubes.pop(get_cube_version(df), None)
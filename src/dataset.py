@@ -0,0 +1,222 @@
+'''
+    Contains the dataset shared by the visualisations and helpers to identify its version.
+'''
+import functools
+import hashlib
+import weakref
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from src.columnar import has_columns, read_columns
+from src.filters import FilterIndex
+from src.preprocess import add_derived_columns
+
+DATA_PATH = "src/assets/data/student_habits_performance.csv"
+# Written by `python -m src.ingest`
+COLUMNS_PATH = "src/assets/data/student_habits_performance.columns"
+
+
+def load_dataframe(csv_path=DATA_PATH, columns_path=COLUMNS_PATH):
+    '''
+        Loads the raw dataset, from its columnar copy if it was ingested.
+
+        Args:
+            csv_path: The path of the CSV file, read when there is no columnar copy
+            columns_path: The directory of the columnar copy
+        Returns:
+            The raw dataframe
+    '''
+    if has_columns(columns_path):
+        # Memory-mapped: the numbers of the shared layout are not copied in each worker
+        return read_columns(columns_path, mmap_mode='r')
+    return pd.read_csv(csv_path)
+
+
+def get_dataset_version(df, columns=None):
+    '''
+        Computes a short fingerprint of the content of the dataframe.
+
+        Two dataframes holding the same values in the given columns get the
+        same version, so derived results (cluster models, figures) can be
+        reused between calls. Each column is hashed once for as long as its
+        array is alive, so its values must not be modified in place after
+        being fingerprinted (as for the Dataset).
+
+        Args:
+            df: The dataframe to fingerprint
+            columns: The columns to consider, all of them if None
+        Returns:
+            A hexadecimal string identifying the content
+    '''
+    columns = sorted(df.columns if columns is None else columns)
+    # Hash column by column to avoid copying the dataframe; the version does
+    # not depend on the order of the columns
+    digest = hashlib.blake2b(_get_index_digest(df.index), digest_size=8)
+    for column in columns:
+        digest.update(str(column).encode())
+        digest.update(_get_column_digest(df[column]))
+    return digest.hexdigest()
+
+
+# Hash states of the arrays already hashed, by buffer; the dataframes handed out
+# by Dataset.df share the arrays of the dataset, so each column is hashed once.
+# The states are kept rather than the digests so that the digest of a column
+# extended with new rows only needs the new rows to be hashed
+_digests = {}
+
+
+def _get_index_digest(index):
+    if isinstance(index, pd.RangeIndex):
+        # Each slice of a dataframe gets a new RangeIndex, hashed once by its bounds
+        return _get_range_digest(index.start, index.stop, index.step)
+    return _get_digest(index, index)
+
+
+@functools.lru_cache(maxsize=64)
+def _get_range_digest(start, stop, step):
+    return hashlib.blake2b(_hash_values(pd.RangeIndex(start, stop, step)), digest_size=8).digest()
+
+
+def _get_column_digest(series):
+    return _get_column_state(series).digest()
+
+
+def _get_column_state(series):
+    return _get_state(series, *_get_column_buffer(series))
+
+
+def _get_column_buffer(series):
+    values = series.array
+    if isinstance(values, pd.Categorical):
+        return values.codes, tuple(values.categories)
+    return np.asarray(values), ()
+
+
+def _get_digest(data, array, extra=()):
+    return _get_state(data, array, extra).digest()
+
+
+def _get_state(data, array, extra=()):
+    key, owner = _get_buffer_key(array, extra)
+    entry = _digests.get(key)
+    if entry is not None and entry[0]() is owner:
+        return entry[1]
+
+    state = hashlib.blake2b(_hash_values(data), digest_size=8)
+    _set_state(key, owner, state)
+    return state
+
+
+def _get_buffer_key(array, extra):
+    # The arrays are read-only by contract, so a digest stays valid as long as
+    # the array owning the buffer is alive
+    if isinstance(array, np.ndarray):
+        owner = array
+        while isinstance(owner.base, np.ndarray):
+            owner = owner.base
+        return (id(owner), array.__array_interface__['data'][0], array.shape, array.strides, array.dtype.str, extra), owner
+    return (id(array), extra), array
+
+
+def _set_state(key, owner, state):
+    _digests[key] = (weakref.ref(owner, lambda _, key=key: _digests.pop(key, None)), state)
+
+
+def _hash_values(data):
+    hashed = pd.util.hash_pandas_object(data, index=False) if isinstance(data, pd.Series) else pd.util.hash_pandas_object(data)
+    return hashed.values.tobytes()
+
+
+def _extend_digests(previous, df):
+    # The rows of a column are hashed one by one, so the digest of a column
+    # whose dtype did not change is the one of its previous rows, updated with
+    # the hashes of its new rows
+    start = len(previous)
+    head, tail = df.iloc[:start], df.iloc[start:]
+    for column in df.columns:
+        if df[column].dtype != previous[column].dtype:
+            continue
+        state = _get_column_state(previous[column])
+        _set_state(*_get_buffer_key(*_get_column_buffer(head[column])), state)
+        state = state.copy()
+        state.update(_hash_values(tail[column]))
+        _set_state(*_get_buffer_key(*_get_column_buffer(df[column])), state)
+
+
+def _append_column(previous, new):
+    # Appends the new values of a column, with the dtype a fresh load of all
+    # the values would give it: the categories stay sorted, as those of
+    # pd.Categorical, and the integers get the smallest dtype holding them
+    if isinstance(previous.dtype, pd.CategoricalDtype):
+        return union_categoricals([previous.array, pd.Categorical(new.astype(object))], sort_categories=True)
+    if pd.api.types.is_numeric_dtype(previous.dtype):
+        new = pd.to_numeric(new, errors='coerce')
+        dtype = np.float64
+        if pd.api.types.is_integer_dtype(previous.dtype) and new.notna().all() and (new == new.round()).all():
+            bounds = [np.min_scalar_type(int(value)) for value in new.agg(['min', 'max'])] if len(new) else []
+            dtype = np.result_type(previous.dtype, *bounds)
+        return np.concatenate([previous.to_numpy(dtype=dtype), new.to_numpy(dtype=dtype)])
+    return np.concatenate([previous.to_numpy(dtype=object), new.to_numpy(dtype=object)])
+
+
+class Dataset:
+    '''
+        The read-only dataset shared by the figure builders and the callbacks.
+
+        The derived columns (numeric diet quality, habit groups, performance
+        tier) are computed once, with dtypes that are never merged with the
+        memory-mapped blocks of the raw data. The figure builders get shallow views of the
+        data, so they never write to the shared dataframe and no per-request
+        copy of the values is needed, which keeps threaded workers safe.
+
+        Attributes:
+            version: The fingerprint of the raw data
+            filter_index: The FilterIndex of the demographic filters
+    '''
+
+    def __init__(self, df):
+        self.version = get_dataset_version(df)
+        self._columns = list(df.columns)
+        self._df = add_derived_columns(df)
+        self.filter_index = FilterIndex(self._df)
+
+    def append(self, rows):
+        '''
+            Appends new students to the data.
+
+            The dataset itself is left untouched, so the callbacks still using
+            it are not affected. The columns get the dtypes a fresh load of
+            all the rows would give them; those whose dtype does not change
+            only have their fingerprint updated with the new values.
+
+            The columns are concatenated into new arrays, in the private
+            memory of the process: the memory-mapped columns of a columnar
+            dataset are then no longer shared between the workers, and each
+            call copies every column, in time proportional to the number of
+            rows. The app only appends rows when it follows a stream
+            (STREAM_DIRECTORY), trading the shared pages for fresh data.
+
+            Args:
+                rows: A dataframe of the new students, with the raw columns
+                    (the missing ones are left empty, the others are ignored)
+            Returns:
+                A new Dataset of the previous and new students
+        '''
+        rows = rows.reindex(columns=self._columns).reset_index(drop=True)
+        df = pd.DataFrame({column: _append_column(self._df[column], rows[column]) for column in self._columns})
+        # The columns of the dataset are views of the fingerprinted arrays
+        _extend_digests(self._df, df)
+        return Dataset(df)
+
+    @property
+    def df(self):
+        '''
+            A view of the data: adding or replacing columns of it does not
+            affect the dataset, but the values must not be modified in place.
+        '''
+        return self._df.copy(deep=False)
+
+    def __len__(self):
+        return len(self._df)
@@ -0,0 +1,107 @@
+'''
+    Contains the feature pipeline shared by the clusterings of the visualisations.
+
+    The habits used by the cluster scatter plot and the correlation heatmap
+    are standardized once per dataset version into a single contiguous
+    float32 matrix. Each cluster model reads the columns of its features from
+    it, instead of running its own scaler over its own copy of the data.
+'''
+import threading
+
+import numpy as np
+
+from src.dataset import get_dataset_version
+
+# Habits the students are clustered on
+cluster_features = [
+    'study_hours_per_day', 'social_media_hours', 'netflix_hours',
+    'exercise_frequency', 'exam_score', 'sleep_hours', 'mental_health_rating',
+    'attendance_percentage'
+]
+
+# Details shown with the clustered students, rows missing one of them are left out
+cluster_required = ['gender', 'age', 'extracurricular_participation', 'part_time_job']
+
+
+class FeatureMatrix:
+    '''
+        The standardized cluster features of the students.
+
+        Attributes:
+            version: The fingerprint of the feature and required columns
+            index: The index of the rows without missing values
+            positions: The positions of these rows in the dataframe
+            features: The names of the columns of the matrix
+            mean: The mean of each feature
+            scale: The standard deviation of each feature
+            values: The standardized features, as a C-contiguous float32 array
+    '''
+
+    def __init__(self, df, version):
+        # Rows missing a feature or a required detail are left out
+        complete = df[cluster_features + cluster_required].notna().all(axis=1).to_numpy()
+        self.positions = np.flatnonzero(complete)
+        values = df[cluster_features].to_numpy(dtype=np.float64)[complete]
+        self.version = version
+        self.index = df.index[complete]
+        self.features = list(cluster_features)
+        self.mean = values.mean(axis=0)
+        # Constant features are left centered, as StandardScaler does
+        scale = values.std(axis=0)
+        self.scale = np.where(scale == 0, 1.0, scale)
+        self.values = np.ascontiguousarray((values - self.mean) / self.scale, dtype=np.float32)
+
+    def get_columns(self, features):
+        '''
+            Gets the position of features in the matrix.
+
+            Args:
+                features: The names of the features
+            Returns:
+                The list of their column numbers
+        '''
+        return [self.features.index(feature) for feature in features]
+
+
+_matrices = {}
+_lock = threading.Lock()
+
+
+def get_feature_version(df):
+    '''
+        Computes the fingerprint of the columns the feature matrix depends on.
+    '''
+    return get_dataset_version(df, cluster_features + cluster_required)
+
+
+def get_feature_matrix(df):
+    '''
+        Gets the feature matrix of the data, computing it on the first call.
+
+        Args:
+            df: The dataframe of the students
+        Returns:
+            The FeatureMatrix of the data
+    '''
+    version = get_feature_version(df)
+    with _lock:
+        matrix = _matrices.get(version)
+        if matrix is None:
+            matrix = FeatureMatrix(df, version)
+            _matrices[version] = matrix
+    return matrix
+
+
+def clear_feature_matrices(df=None):
+    '''
+        Forgets the feature matrix of a dataframe, e.g. once rows were
+        appended to it, or every feature matrix after the dataset was reloaded.
+
+        Args:
+            df: The dataframe, None for every feature matrix
+    '''
+    with _lock:
+        if df is None:
+            _matrices.clear()
+        else:
+            _matrices.pop(get_feature_version(df), None)
@@ -0,0 +1,191 @@
+'''
+    Contains the cache of the serialized figures returned by the callbacks.
+
+    Figures are stored as JSON, keyed by the dataset version, the version of
+    the code and the callback inputs. The in-memory store evicts the least recently used figures once
+    it holds too many entries or bytes. An optional directory can be given to
+    share the figures between the gunicorn workers of a machine.
+'''
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+
+def get_code_version(directory=os.path.dirname(os.path.abspath(__file__))):
+    '''
+        Computes a short fingerprint of the Python modules of a directory.
+
+        Args:
+            directory: The directory of the modules, the src package by default
+        Returns:
+            A hexadecimal string, different as soon as a module changes
+    '''
+    digest = hashlib.blake2b(digest_size=8)
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.py'):
+            digest.update(name.encode())
+            with open(os.path.join(directory, name), 'rb') as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+# Version of the code the figures are built with: a cache directory kept
+# across deploys does not serve the figures (nor the fitted models) of the
+# previous code
+FIGURE_CACHE_VERSION = get_code_version()
+
+
+class FigureCache:
+    '''
+        A LRU cache of serialized figures, optionally backed by a directory.
+
+        Args:
+            max_entries: The maximum number of figures kept in memory
+            max_bytes: The maximum total size of the figures kept in memory
+            directory: The directory shared by the workers, or None
+            max_disk_bytes: The maximum total size of the figures kept on disk
+    '''
+
+    def __init__(self, max_entries=256, max_bytes=64 * 2**20, directory=None, max_disk_bytes=512 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get_or_build(self, key, build):
+        '''
+            Gets the figure of the given key, building it on a miss.
+
+            Args:
+                key: A tuple of the dataset version and the callback inputs
+                build: A function without arguments returning the figure
+            Returns:
+                The figure, as a dict ready to be sent to the browser
+        '''
+        text = self.get(key)
+        if text is None:
+            text = pio.to_json(build(), validate=False)
+            self.put(key, text)
+        return json.loads(text)
+
+    def get(self, key):
+        '''
+            Gets the serialized figure of the given key.
+
+            Args:
+                key: A tuple of the dataset version and the callback inputs
+            Returns:
+                The JSON of the figure, or None if it is not cached
+        '''
+        digest = _digest(key)
+        with self._lock:
+            text = self._entries.get(digest)
+            if text is not None:
+                self._entries.move_to_end(digest)
+                return text
+
+        text = self._read(digest)
+        if text is not None:
+            self._remember(digest, text)
+        return text
+
+    def put(self, key, text):
+        '''
+            Stores the serialized figure of the given key.
+
+            Args:
+                key: A tuple of the dataset version and the callback inputs
+                text: The JSON of the figure
+        '''
+        digest = _digest(key)
+        self._remember(digest, text)
+        self._write(digest, text)
+
+    def clear(self):
+        '''
+            Forgets every figure kept in memory and on disk.
+        '''
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        for path in self._disk_entries():
+            _remove(path)
+
+    def _remember(self, digest, text):
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[digest] = text
+            self._size += len(text)
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _read(self, digest):
+        if self.directory is None:
+            return None
+        path = os.path.join(self.directory, digest + '.json')
+        try:
+            with open(path, encoding='utf-8') as file:
+                text = file.read()
+        except OSError:
+            return None
+        # Touch the file so that the disk eviction is least recently used too
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return text
+
+    def _write(self, digest, text):
+        if self.directory is None:
+            return
+        # Write to a temporary file first so other workers never read a partial figure
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(tmp_path, os.path.join(self.directory, digest + '.json'))
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        for path in self._disk_entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            _remove(path)
+            total -= size
+
+    def _disk_entries(self):
+        if self.directory is None:
+            return []
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                if name.endswith('.json')]
+
+
+def _digest(key):
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
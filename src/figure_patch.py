@@ -0,0 +1,114 @@
+'''
+    Contains the diff of two figures, used to send only what a callback changes.
+
+    A patch is a list of operations on the reference figure, each one either
+    [path, value] to set a property or [path] to delete it, the path being
+    the list of keys and trace indices leading to the property. Arrays of
+    values (coordinates, colors, texts) are replaced as a whole.
+
+    The browser applies the patches with the clientside function of
+    apply_patch_js, so the figure the patch is computed against must be the
+    one the browser holds (see the reference stores of src/app.py). The
+    reference and the patches are sent with the version of the data and the
+    filters they were drawn from: the browser skips a patch of another version
+    than its reference, and a worker whose data has another version than the
+    reference of the browser sends the whole figure instead of a patch.
+'''
+
+# Clientside function applying a patch ({'version', 'patch'}) to a copy of the
+# reference figure ({'version', 'figure'}), the same as apply_figure_patch, or
+# showing the whole figure sent instead ({'figure'})
+apply_patch_js = """
+function(reference, patch) {
+    if (!reference) {
+        return window.dash_clientside.no_update;
+    }
+    if (!patch) {
+        return reference.figure;
+    }
+    if (patch.figure) {
+        return patch.figure;
+    }
+    if (patch.version !== reference.version) {
+        // A patch of other data or filters, the patch of the new reference follows
+        return window.dash_clientside.no_update;
+    }
+    const figure = JSON.parse(JSON.stringify(reference.figure));
+    patch.patch.forEach(operation => {
+        const path = operation[0];
+        let parent = figure;
+        path.slice(0, -1).forEach(key => {
+            parent = parent[key];
+        });
+        if (operation.length > 1) {
+            parent[path[path.length - 1]] = operation[1];
+        } else {
+            delete parent[path[path.length - 1]];
+        }
+    });
+    return figure;
+}
+"""
+
+
+def get_figure_patch(reference, figure):
+    '''
+        Computes the operations turning a figure into another one.
+
+        Args:
+            reference: The figure the browser already holds, as a dict
+            figure: The new figure, as a dict
+        Returns:
+            The list of operations, empty if the figures are equal
+    '''
+    patch = []
+    _diff(reference, figure, [], patch)
+    return patch
+
+
+def apply_figure_patch(reference, patch):
+    '''
+        Applies a patch to a figure, as the browser does.
+
+        Args:
+            reference: The figure the patch was computed against, as a dict (not modified)
+            patch: The operations of get_figure_patch
+        Returns:
+            The patched figure, as a dict
+    '''
+    figure = _copy(reference)
+    for operation in patch:
+        path = operation[0]
+        parent = figure
+        for key in path[:-1]:
+            parent = parent[key]
+        if len(operation) > 1:
+            parent[path[-1]] = operation[1]
+        else:
+            del parent[path[-1]]
+    return figure
+
+
+def _diff(old, new, path, patch):
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            if key not in old:
+                patch.append([path + [key], value])
+            else:
+                _diff(old[key], value, path + [key], patch)
+        patch.extend([path + [key]] for key in old if key not in new)
+    elif (isinstance(old, list) and isinstance(new, list) and len(old) == len(new)
+          and all(isinstance(item, dict) for item in old + new)):
+        # Lists of objects (traces, annotations) are diffed item by item
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            _diff(old_item, new_item, path + [index], patch)
+    elif old != new:
+        patch.append([path, new])
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
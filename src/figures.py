@@ -0,0 +1,206 @@
+'''
+    Contains the builders of the figures of the app and their cache keys.
+'''
+import hashlib
+
+import pandas as pd
+
+from src.bar_chart import get_bar_chart_figure
+from src.cluster_scatter import (extend_scatter_cluster_model, get_cluster_figure, get_scatter_cluster_lineage,
+                                 get_scatter_cluster_model)
+from src.correlation_heatmap import (get_correlation_figure, get_cluster_choices, assign_cluster_labels,
+                                     extend_correlation_stats, get_heatmap_cluster_lineage)
+from src.cube import extend_cube, get_cube
+from src.figure_cache import FIGURE_CACHE_VERSION
+from src.filters import ALL_ROWS
+from src.personas import PERSONAS_VERSION
+from src.radar_chart import get_radar_chart, normalize_user_values
+from src.sankey_chart import get_sankey_chart_figure, sankey_left_type_options, sankey_habit_options
+from src.waffle_chart import get_waffle_figure
+
+
+def _get_radar_figure(df, *user_values, selection=ALL_ROWS):
+    if not user_values:
+        return get_radar_chart(df, selection=selection)
+    return get_radar_chart(df, user_data=normalize_user_values(user_values), selection=selection)
+
+
+# Each builder takes the dataframe, the inputs of the figure and the Selection
+# of the filters; the charts drawn from the aggregate cube only need the filters,
+# the radar chart the positions of the selected rows when its baseline is not
+# cached, and the others the positions of the selected rows
+figure_builders = {
+    'bar': lambda df, selection=ALL_ROWS: get_bar_chart_figure(df, filters=dict(selection.key)),
+    'cluster': lambda df, selection=ALL_ROWS: get_cluster_figure(df, rows=selection.rows),
+    'waffle': lambda df, selection=ALL_ROWS: get_waffle_figure(df, filters=dict(selection.key)),
+    'sankey': lambda df, left_type, habit, selection=ALL_ROWS: get_sankey_chart_figure(
+        df, selected_left_type=left_type, selected_habit=habit, filters=dict(selection.key)),
+    'correlation': lambda df, cluster, selection=ALL_ROWS: get_correlation_figure(df, cluster, rows=selection.rows),
+    'radar': _get_radar_figure,
+}
+
+
+# The aggregates read by the figures drawn from the aggregate cube. These
+# figures are keyed by a digest of their aggregates rather than by the dataset
+# version, so that appending rows only invalidates those whose aggregates
+# change, e.g. not the figures of filters the new students do not match
+figure_sources = {
+    'bar': lambda df, selection=ALL_ROWS: get_cube(df).aggregate(
+        ['performance_tier_bar'], dict(selection.key)),
+    'waffle': lambda df, selection=ALL_ROWS: get_cube(df).aggregate(
+        ['parental_education_level', 'performance_tier'], dict(selection.key)),
+    'sankey': lambda df, left_type, habit, selection=ALL_ROWS: get_cube(df).aggregate(
+        [left_type], dict(selection.key)),
+}
+
+# The lineage of the cluster model of the figures drawn from one, which is part
+# of their version: a model extended with streamed rows and a model fitted on
+# the same rows by a restarted worker do not have the same clusters
+figure_lineages = {
+    'cluster': get_scatter_cluster_lineage,
+    'correlation': get_heatmap_cluster_lineage,
+}
+
+
+def get_figure_version(df, dataset_version, name, *inputs, selection=ALL_ROWS):
+    '''
+        Gets the version of the data a figure is drawn from.
+
+        Args:
+            df: The dataframe the figure is built from
+            dataset_version: The version of the dataframe
+            name: The name of the figure in figure_builders
+            inputs: The inputs of the figure builder
+            selection: The Selection of the filters
+        Returns:
+            The digest of the aggregates of the figure for the figures of
+            figure_sources, the dataset version and the lineage of the cluster
+            model for those of figure_lineages, the dataset version for the others
+    '''
+    if name in figure_lineages:
+        return dataset_version, figure_lineages[name](df)
+    source = figure_sources.get(name)
+    if source is None:
+        return dataset_version
+    aggregates = source(df, *inputs, selection=selection)
+    return hashlib.blake2b(pd.util.hash_pandas_object(aggregates).values.tobytes(), digest_size=8).hexdigest()
+
+
+def get_data_version(df, dataset_version, selection=ALL_ROWS):
+    '''
+        Gets the version of everything the figures are drawn from: the data,
+        the lineage of the cluster models of figure_lineages and the filters.
+
+        Args:
+            df: The dataframe the figures are built from
+            dataset_version: The version of the dataframe
+            selection: The Selection of the filters
+        Returns:
+            A hexadecimal string, the same for workers drawing the same figures
+    '''
+    digest = hashlib.blake2b(dataset_version.encode(), digest_size=8)
+    for lineage in figure_lineages.values():
+        digest.update(str(lineage(df)).encode())
+    if selection.key:
+        digest.update(repr(selection.key).encode())
+    return digest.hexdigest()
+
+
+def get_figure_key(dataset_version, name, *inputs, selection=ALL_ROWS):
+    '''
+        Gets the cache key of a figure.
+
+        Args:
+            dataset_version: The version of the dataset the figure is built from
+            name: The name of the figure in figure_builders
+            inputs: The inputs of the figure builder
+            selection: The Selection of the filters
+        Returns:
+            The key of the figure in the figure cache
+    '''
+    # The personas and the code are part of the key, so that changing them does
+    # not serve stale cluster names or figures drawn by the previous builders
+    key = (name, dataset_version, PERSONAS_VERSION, FIGURE_CACHE_VERSION) + tuple(inputs)
+    return key + (('filters',) + selection.key if selection.key else ())
+
+
+def build_figure(df, name, *inputs, selection=ALL_ROWS):
+    '''
+        Builds a figure without going through the cache.
+
+        Args:
+            df: The dataframe to build the figure from
+            name: The name of the figure in figure_builders
+            inputs: The inputs of the figure builder
+            selection: The Selection of the filters
+        Returns:
+            The figure
+    '''
+    return figure_builders[name](df, *inputs, selection=selection)
+
+
+def get_cached_figure(cache, df, dataset_version, name, *inputs, selection=ALL_ROWS):
+    '''
+        Gets a figure from the cache, building it on a miss.
+
+        Args:
+            cache: The FigureCache to look the figure up in
+            df: The dataframe to build the figure from
+            dataset_version: The version of the dataframe
+            name: The name of the figure in figure_builders
+            inputs: The inputs of the figure builder
+            selection: The Selection of the filters
+        Returns:
+            The figure, as a dict
+    '''
+    version = get_figure_version(df, dataset_version, name, *inputs, selection=selection)
+    return cache.get_or_build(get_figure_key(version, name, *inputs, selection=selection),
+                              lambda: build_figure(df, name, *inputs, selection=selection))
+
+
+def get_finite_figure_inputs(df):
+    '''
+        Lists every input combination of the static figures and of the figures driven by dropdowns.
+
+        Args:
+            df: The dataframe the figures are built from
+        Returns:
+            A list of (name, inputs) pairs
+    '''
+    inputs = [('bar', ()), ('cluster', ()), ('waffle', ())]
+    inputs += [
+        ('sankey', (left['value'], habit['value']))
+        for left in sankey_left_type_options
+        for habit in sankey_habit_options
+    ]
+
+    inputs += [('correlation', (cluster,)) for cluster in get_cluster_choices(df)]
+    inputs.append(('radar', ()))
+    return inputs
+
+
+def fit_cluster_models(df):
+    '''
+        Fits the cluster models of every figure into the cluster model
+        registry, and builds the aggregate cube of the data.
+
+        Args:
+            df: The dataframe the figures are built from
+    '''
+    assign_cluster_labels(df)
+    get_scatter_cluster_model(df)
+    get_cube(df)
+
+
+def extend_cluster_models(df, n_new_rows):
+    '''
+        Extends the cluster models of every figure, and the aggregate cube,
+        with rows appended to the data they were built from.
+
+        Args:
+            df: The dataframe the figures are built from, with the appended rows at its end
+            n_new_rows: The number of appended rows
+    '''
+    extend_correlation_stats(df, n_new_rows)
+    extend_scatter_cluster_model(df, n_new_rows)
+    extend_cube(df, n_new_rows)
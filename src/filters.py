@@ -0,0 +1,182 @@
+'''
+    Contains the index of the demographic filters shared by all the charts.
+
+    Each value of a categorical filter column has a bitmap of its rows,
+    packed 8 rows per byte, and each range filter column has the cumulative
+    bitmaps of its sorted values, so that a range is the difference of two of
+    them. A combination of filters then resolves to the positions of the
+    selected rows with a few bitwise operations, without scanning the columns.
+'''
+import numpy as np
+import pandas as pd
+
+# Columns filtered by a set of values
+filter_columns = ['gender', 'part_time_job', 'internet_quality', 'parental_education_level']
+# Columns filtered by a range of values
+range_columns = ['age']
+
+
+class Selection:
+    '''
+        The rows selected by some filters.
+
+        The charts drawn from the aggregate cube only need the key, so the
+        positions of the rows are only unpacked from the bitmap when read.
+
+        Attributes:
+            key: A hashable key of the filters
+    '''
+
+    def __init__(self, key, rows=None, bitmap=None, size=None):
+        self.key = key
+        self._rows = rows
+        self._bitmap = bitmap
+        self._size = size
+
+    @property
+    def rows(self):
+        '''
+            The sorted positions of the selected rows, None when every row is selected.
+        '''
+        if self._rows is None and self._bitmap is not None:
+            self._rows = np.flatnonzero(np.unpackbits(self._bitmap, count=self._size))
+        return self._rows
+
+
+ALL_ROWS = Selection(())
+
+
+class FilterIndex:
+    '''
+        The bitmap indexes of the filter columns of a dataframe.
+
+        The range columns hold few distinct values (ages), so a packed bitmap
+        per value stays small.
+
+        Attributes:
+            size: The number of rows
+            bitmaps: The packed bitmap of each value of each filter column
+            range_values: The sorted distinct values of each range column, without missing values
+            range_bitmaps: For each range column, the packed bitmap of the rows
+                whose value is below each of its range_values, then of every
+                row with a value
+    '''
+
+    def __init__(self, df):
+        self.size = len(df)
+        self.bitmaps = {}
+        for column in filter_columns:
+            categorical = pd.Categorical(df[column])
+            self.bitmaps[column] = {
+                value: np.packbits(categorical.codes == code)
+                for code, value in enumerate(categorical.categories)
+            }
+
+        self.range_values = {}
+        self.range_bitmaps = {}
+        for column in range_columns:
+            values = df[column].to_numpy(dtype=np.float64)
+            positions = np.flatnonzero(~np.isnan(values))
+            unique, codes = np.unique(values[positions], return_inverse=True)
+            bitmaps = np.zeros((len(unique) + 1, (self.size + 7) // 8), dtype=np.uint8)
+            for code in range(len(unique)):
+                mask = np.zeros(self.size, dtype=bool)
+                mask[positions[codes == code]] = True
+                bitmaps[code + 1] = np.packbits(mask)
+            self.range_values[column] = unique
+            self.range_bitmaps[column] = np.bitwise_or.accumulate(bitmaps, axis=0)
+
+    def get_options(self, column):
+        '''
+            Lists the values of a filter column, or the bounds of a range column.
+        '''
+        if column in self.bitmaps:
+            return list(self.bitmaps[column])
+        values = self.range_values[column]
+        return [values[0], values[-1]] if len(values) else [0, 0]
+
+    def select(self, filters):
+        '''
+            Resolves filters to the rows they select.
+
+            Args:
+                filters: A dict of the selected values of the filter columns
+                    and of the [low, high] bounds of the range columns; a
+                    missing or empty entry does not filter
+            Returns:
+                The Selection of the rows
+        '''
+        key = get_filter_key(filters)
+        if not key:
+            return ALL_ROWS
+
+        bitmap = None
+        for column, values in key:
+            if column in self.bitmaps:
+                empty = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+                column_bitmap = empty
+                for value in values:
+                    column_bitmap = column_bitmap | self.bitmaps[column].get(value, empty)
+            else:
+                # The rows below the high bound, without those below the low bound
+                low, high = values
+                start = np.searchsorted(self.range_values[column], low, side='left')
+                stop = np.searchsorted(self.range_values[column], high, side='right')
+                column_bitmap = self.range_bitmaps[column][stop] & ~self.range_bitmaps[column][start]
+            bitmap = column_bitmap if bitmap is None else bitmap & column_bitmap
+
+        return Selection(key, bitmap=bitmap, size=self.size)
+
+
+def get_filter_key(filters):
+    '''
+        Gets a hashable key of filters, the same for equivalent filters.
+
+        Args:
+            filters: A dict of filters, as for FilterIndex.select, or None
+        Returns:
+            A tuple of the (column, values) pairs that filter
+    '''
+    key = []
+    for column, values in sorted((filters or {}).items()):
+        if not values:
+            continue
+        if column in range_columns:
+            key.append((column, (float(values[0]), float(values[1]))))
+        else:
+            key.append((column, tuple(sorted(str(value) for value in values))))
+    return tuple(key)
+
+
+def is_selected(positions, rows, size):
+    '''
+        Tells which of some rows are selected.
+
+        Args:
+            positions: The positions of the rows to check
+            rows: The positions of the selected rows, None for all of them
+            size: The number of rows of the dataframe
+        Returns:
+            A boolean array, True for the selected rows among positions
+    '''
+    if rows is None:
+        return np.ones(len(positions), dtype=bool)
+    mask = np.zeros(size, dtype=bool)
+    mask[rows] = True
+    return mask[positions]
+
+
+def select_rows(df, rows, columns=None):
+    '''
+        Gets the selected rows of a dataframe.
+
+        Args:
+            df: The dataframe
+            rows: The positions of the rows, None for all of them
+            columns: The columns to keep, all of them if None
+        Returns:
+            The dataframe of the selected rows
+    '''
+    if columns is not None:
+        df = df[columns]
+    return df if rows is None else df.take(rows)
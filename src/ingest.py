@@ -0,0 +1,46 @@
+'''
+    Converts the CSV dataset into the typed columnar format loaded by the app.
+
+    Usage: python -m src.ingest [--csv PATH] [--output DIR] [--shared]
+
+    With --shared, the numbers are stored in the layout that gunicorn workers
+    memory-map without copying (larger on disk than the compact one).
+'''
+import argparse
+
+import pandas as pd
+
+from src.columnar import write_columns
+from src.dataset import DATA_PATH, COLUMNS_PATH
+
+
+def ingest_csv(csv_path=DATA_PATH, output=COLUMNS_PATH, shared=False):
+    '''
+        Writes the columnar copy of a CSV dataset.
+
+        Args:
+            csv_path: The path of the CSV file
+            output: The directory of the columnar copy
+            shared: Whether to use the layout shared between the workers
+        Returns:
+            The number of rows written
+    '''
+    df = pd.read_csv(csv_path)
+    write_columns(df, output, shared=shared)
+    return len(df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--csv', default=DATA_PATH, help='path of the CSV dataset')
+    parser.add_argument('--output', default=COLUMNS_PATH, help='directory of the columnar dataset')
+    parser.add_argument('--shared', action='store_true',
+                        help='store the numbers so that the workers share them in memory')
+    args = parser.parse_args(argv)
+
+    count = ingest_csv(args.csv, args.output, args.shared)
+    print(f"Wrote {count} rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''
+    Reports the memory of the gunicorn workers, split into unique and shared memory (Linux only).
+
+    Usage: python -m src.memory MASTER_PID
+
+    The unique memory is what each additional worker costs, the shared memory
+    (e.g. the memory-mapped dataset) is paid once for all of them.
+'''
+import argparse
+import os
+
+
+def get_memory_usage(pid='self'):
+    '''
+        Reads the memory usage of a process from /proc.
+
+        Args:
+            pid: The id of the process, the current one by default
+        Returns:
+            A dict of the rss, pss, unique and shared memory, in bytes
+    '''
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'unique': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        'shared': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+    }
+
+
+def get_worker_pids(master_pid):
+    '''
+        Lists the child processes of the gunicorn master.
+
+        Args:
+            master_pid: The id of the master process
+        Returns:
+            The ids of the workers
+    '''
+    pids = []
+    for task in os.listdir(f'/proc/{master_pid}/task'):
+        with open(f'/proc/{master_pid}/task/{task}/children', encoding='utf-8') as file:
+            pids += [int(pid) for pid in file.read().split()]
+    return pids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('master_pid', type=int, help='id of the gunicorn master process')
+    args = parser.parse_args(argv)
+
+    mib = 2**20
+    print(f"{'pid':>8} {'rss':>10} {'pss':>10} {'unique':>10} {'shared':>10}  (MiB)")
+    for pid in get_worker_pids(args.master_pid):
+        usage = get_memory_usage(pid)
+        print(f"{pid:>8} {usage['rss'] / mib:>10.1f} {usage['pss'] / mib:>10.1f} "
+              f"{usage['unique'] / mib:>10.1f} {usage['shared'] / mib:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
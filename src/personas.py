@@ -0,0 +1,99 @@
+'''
+    Contains the student personas and their matching with the clusters.
+
+    KMeans numbers its clusters arbitrarily, so a refit, another seed or new
+    data can shuffle the labels. Each persona is therefore described by a
+    reference centroid, in the units of the features, and the clusters of a
+    model are matched to the personas by minimizing the total distance
+    between the centroids (Hungarian assignment).
+'''
+import pandas as pd
+
+# Bumped whenever the personas change, to invalidate the figures using them
+PERSONAS_VERSION = 2
+
+# Personas of the cluster scatter plot
+scatter_personas = [
+    {
+        'name': 'The Academic Achiever', 'color': '#1f77b4', 'desc': 'Focused, healthy and top of the class.',
+        'centroid': {'study_hours_per_day': 4.86, 'social_media_hours': 2.24, 'netflix_hours': 1.64,
+                     'exercise_frequency': 4.64, 'exam_score': 88.34, 'sleep_hours': 6.85,
+                     'mental_health_rating': 6.0, 'attendance_percentage': 86.23}
+    },
+    {
+        'name': 'The Balanced Learner', 'color': '#2ca02c', 'desc': 'Stable academic and personal life balance.',
+        'centroid': {'study_hours_per_day': 4.18, 'social_media_hours': 3.3, 'netflix_hours': 1.69,
+                     'exercise_frequency': 1.68, 'exam_score': 72.97, 'sleep_hours': 6.05,
+                     'mental_health_rating': 5.81, 'attendance_percentage': 88.16}
+    },
+    {
+        'name': 'The Social Butterfly', 'color': '#ff7f0e', 'desc': 'Socially active, academically inconsistent.',
+        'centroid': {'study_hours_per_day': 3.32, 'social_media_hours': 1.6, 'netflix_hours': 1.73,
+                     'exercise_frequency': 2.43, 'exam_score': 69.3, 'sleep_hours': 6.55,
+                     'mental_health_rating': 5.92, 'attendance_percentage': 77.24}
+    },
+    {
+        'name': 'The Minimalist', 'color': '#d62728', 'desc': 'Low engagement, just getting by.',
+        'centroid': {'study_hours_per_day': 2.06, 'social_media_hours': 2.86, 'netflix_hours': 2.17,
+                     'exercise_frequency': 3.41, 'exam_score': 50.43, 'sleep_hours': 6.43,
+                     'mental_health_rating': 4.18, 'attendance_percentage': 85.0}
+    },
+]
+
+# Personas of the clusters of the correlation heatmap
+heatmap_personas = [
+    {
+        'name': 'The Bookworm',
+        'centroid': {'sleep_hours': 6.63, 'study_hours_per_day': 2.95, 'netflix_hours': 1.94,
+                     'mental_health_rating': 8.17, 'social_media_hours': 1.72, 'attendance_percentage': 81.27}
+    },
+    {
+        'name': 'The Balanced Learner',
+        'centroid': {'sleep_hours': 6.15, 'study_hours_per_day': 3.93, 'netflix_hours': 1.62,
+                     'mental_health_rating': 2.85, 'social_media_hours': 1.94, 'attendance_percentage': 79.81}
+    },
+    {
+        'name': 'The Media Addict',
+        'centroid': {'sleep_hours': 6.0, 'study_hours_per_day': 4.69, 'netflix_hours': 1.68,
+                     'mental_health_rating': 6.92, 'social_media_hours': 3.26, 'attendance_percentage': 87.35}
+    },
+    {
+        'name': 'The Minimalist',
+        'centroid': {'sleep_hours': 7.18, 'study_hours_per_day': 2.49, 'netflix_hours': 2.09,
+                     'mental_health_rating': 3.86, 'social_media_hours': 3.17, 'attendance_percentage': 88.63}
+    },
+]
+
+
+def match_personas(model, personas):
+    '''
+        Matches the clusters of a model to the closest personas.
+
+        The match is computed once per model and personas version. Clusters
+        left without a persona (when there are more clusters than personas)
+        get a generic one.
+
+        Args:
+            model: The fitted ClusterModel
+            personas: The list of personas, with their reference centroids
+        Returns:
+            A dict of the persona of each cluster label
+    '''
+    key = (PERSONAS_VERSION, tuple(persona['name'] for persona in personas))
+    matches = model.persona_matches.get(key)
+    if matches is not None:
+        return matches
+
+    # pylint: disable=import-outside-toplevel
+    from scipy.optimize import linear_sum_assignment
+    from scipy.spatial.distance import cdist
+
+    # The distances are measured in the standardized space of the model
+    reference = pd.DataFrame([persona['centroid'] for persona in personas])
+    rows, cols = linear_sum_assignment(cdist(model.centroids, model.standardize(reference)))
+
+    matches = {label: {'name': f'Cluster {label}', 'color': '#7f7f7f', 'desc': ''}
+               for label in range(len(model.centroids))}
+    matches.update({label: personas[persona] for label, persona in zip(rows, cols)})
+    model.persona_matches[key] = matches
+    return matches
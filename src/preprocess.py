@@ -1,8 +1,170 @@
 '''
     Contains some functions to preprocess the data used in the visualisation.
 '''
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
+
+diet_quality_map = {'Poor': 1, 'Fair': 2, 'Good': 3}
+
+# Performance tier schemes of the charts: the two cut points of the exam score
+# between the Low, Mid and Top tiers, whether they are quantiles of the scores,
+# and whether a score equal to the lower cut point is Low
+performance_tier_schemes = {
+    'performance_tier': {'cuts': (50, 85), 'quantiles': False, 'low_inclusive': False},  # waffle chart
+    'performance_tier_sankey': {'cuts': (50, 85), 'quantiles': False, 'low_inclusive': True},
+    'performance_tier_radar': {'cuts': (0.5, 0.85), 'quantiles': True, 'low_inclusive': False},
+    'performance_tier_bar': {'cuts': (0.4, 0.8), 'quantiles': True, 'low_inclusive': True},
+}
+performance_tiers = ['Low', 'Mid', 'Top']
+
+# Habits binned into the groups of the sankey chart
+habit_group_columns = ['study_hours_per_day', 'social_media_hours', 'netflix_hours',
+                       'sleep_hours', 'diet_quality', 'exercise_frequency',
+                       'mental_health_rating']
+
+
+def add_derived_columns(df):
+    '''
+        Computes the columns derived from the raw data that are shared by the charts:
+        the numeric diet quality, the habit groups and the performance tier of
+        every scheme of performance_tier_schemes.
+
+        The given dataframe is left untouched.
+
+        Args:
+            df: The raw dataframe
+        Returns:
+            A shallow copy of the dataframe with the derived columns added
+    '''
+    df = df.copy(deep=False)
+    diet_quality = df['diet_quality'].map(diet_quality_map).astype('float64')
+    # Kept out of the float64 block of the raw columns when there is no missing value
+    df['diet_quality_numeric'] = diet_quality.astype('int8') if diet_quality.notna().all() else diet_quality
+    for habit_col in habit_group_columns:
+        df[habit_col + '_group'] = get_habit_groups(df[habit_col], habit_col)
+    for scheme in performance_tier_schemes:
+        df[scheme] = get_performance_tiers(df['exam_score'], scheme)
+    return df
+
+
+def with_derived_columns(df):
+    '''
+        Gets the dataframe with the derived columns, computing them only if missing.
+
+        Args:
+            df: The raw dataframe, or one that already has the derived columns
+        Returns:
+            A dataframe with the derived columns
+    '''
+    if all(scheme in df.columns for scheme in performance_tier_schemes):
+        return df
+    return add_derived_columns(df)
+
+
+def get_performance_tiers(scores, scheme, cuts=None):
+    '''
+        Assigns the students to the performance tiers of a scheme.
+
+        Args:
+            scores: The exam scores of the students
+            scheme: The name of the scheme in performance_tier_schemes
+            cuts: The (low, top) cut points, those of the scores if None
+        Returns:
+            A categorical series of the tiers (Low, Mid, Top), NaN for missing scores
+    '''
+    settings = performance_tier_schemes[scheme]
+    low, top = get_performance_tier_cuts(scores, scheme) if cuts is None else cuts
+
+    values = scores.to_numpy(dtype=np.float64)
+    is_low = values <= low if settings['low_inclusive'] else values < low
+    codes = np.select([values >= top, is_low, ~np.isnan(values)], [2, 0, 1], -1).astype(np.int8)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=performance_tiers), index=scores.index, name=scheme)
+
+
+def get_performance_tier_cuts(scores, scheme):
+    '''
+        Gets the exam scores separating the performance tiers of a scheme.
+
+        Args:
+            scores: The exam scores of the students
+            scheme: The name of the scheme in performance_tier_schemes
+        Returns:
+            The (low, top) cut points, quantiles of the scores for the quantile schemes
+    '''
+    settings = performance_tier_schemes[scheme]
+    if settings['quantiles']:
+        return tuple(scores.quantile(list(settings['cuts'])).tolist())
+    return settings['cuts']
+
+
+def get_performance_tier_cuts_from_counts(score_counts, scheme):
+    '''
+        Gets the exam scores separating the performance tiers of a scheme,
+        from the number of students of each score.
+
+        Args:
+            score_counts: A series of the number of students, indexed by exam score
+            scheme: The name of the scheme in performance_tier_schemes
+        Returns:
+            The (low, top) cut points, as get_performance_tier_cuts computes them from the scores
+    '''
+    settings = performance_tier_schemes[scheme]
+    if settings['quantiles']:
+        return tuple(get_quantiles_from_counts(score_counts, settings['cuts']))
+    return settings['cuts']
+
+
+def get_quantiles_from_counts(counts, quantiles):
+    '''
+        Computes quantiles of values from the number of occurrences of each value.
+
+        The counts of two sets of values add up to those of their union, so
+        they are a mergeable sketch of the values, as large as the number of
+        distinct values, from which the quantiles are exactly those of
+        Series.quantile (linear interpolation between the closest values).
+
+        Args:
+            counts: A series of the number of occurrences, indexed by value
+            quantiles: The quantiles to compute, between 0 and 1
+        Returns:
+            The list of the quantiles, NaN when there is no value
+    '''
+    counts = counts[counts > 0].sort_index()
+    size = int(counts.sum())
+    if size == 0:
+        return [np.nan] * len(quantiles)
+
+    values = counts.index.to_numpy(dtype=np.float64)
+    # Number of values up to each distinct value
+    ends = np.cumsum(counts.to_numpy(dtype=np.int64))
+    # Computed as np.percentile does, which Series.quantile calls with quantiles * 100
+    index = (size - 1) * np.true_divide(np.asarray(quantiles, dtype=np.float64) * 100.0, 100)
+    previous = np.floor(index)
+    gamma = index - previous
+    low = values[np.searchsorted(ends, previous.astype(np.int64), side='right')]
+    high = values[np.searchsorted(ends, np.minimum(previous.astype(np.int64) + 1, size - 1), side='right')]
+    difference = high - low
+    return np.where(gamma >= 0.5, high - difference * (1 - gamma), low + difference * gamma).tolist()
+
+
+def get_habit_groups(habit_series, habit_col):
+    '''
+        Bins the values of a habit into the groups shown on the right of the sankey chart.
+
+        Args:
+            habit_series: The values of the habit
+            habit_col: The column of the habit
+        Returns:
+            A categorical series of the habit groups, NaN for missing or unknown values
+    '''
+    if habit_col == 'diet_quality':
+        return pd.Series(pd.Categorical(habit_series, categories=['Poor', 'Fair', 'Good']),
+                         index=habit_series.index)
+
+    edges = [4, 7] if habit_col == 'mental_health_rating' else [2, 5]
+    values = pd.to_numeric(habit_series, errors='coerce')
+    return pd.cut(values, bins=[-np.inf] + edges + [np.inf], right=False, labels=['Low', 'Mid', 'High'])
+
 
 def get_groups_radar_chart(my_df):
 
@@ -10,29 +172,37 @@ def get_groups_radar_chart(my_df):
                'sleep_hours','diet_quality', 'exercise_frequency',
               'mental_health_rating']
     
+    # The radar columns may be given alone, with their derived columns
+    if 'performance_tier_radar' not in my_df.columns:
+        my_df = with_derived_columns(my_df)
     df = my_df.dropna(subset=habits + ['exam_score'])
+    numeric_habits = ['diet_quality_numeric' if h == 'diet_quality' else h for h in habits]
 
-    df['diet_quality'] = df['diet_quality'].map({'Poor': 1, 'Fair': 2, 'Good' : 3})
+    performance_group = df['performance_tier_radar'].cat.rename_categories(
+        ['Low Performers', 'Mid-Level Performers', 'Top Performers']).rename('performance_group')
 
-    p85 = df['exam_score'].quantile(0.85)
-    p50 = df['exam_score'].quantile(0.50)
+    # Min-max scaling to [0, 5], constant habits are left at 0 as MinMaxScaler does
+    values = df[numeric_habits].to_numpy(dtype=np.float64)
+    # The initial bounds only matter when no student is selected by the filters
+    low, high = values.min(axis=0, initial=np.inf), values.max(axis=0, initial=-np.inf)
+    span = np.where(high > low, high - low, 1.0)
+    df_normalized = pd.DataFrame(5 * (values - low) / span, columns=habits, index=df.index)
 
-    def assign_group(score):
-        if score < p50: 
-            return 'Low Performers'
-        if score < p85:
-            return 'Mid-Level Performers'
-        elif score >= p50:
-            return 'Top Performers'
+    group_means = df_normalized.groupby(performance_group, observed=True)[habits].mean().reset_index()
+    return sort_radar_groups(group_means, habits)
 
-    df['performance_group'] = df['exam_score'].apply(assign_group)
 
-    scaler = MinMaxScaler(feature_range=(0,5))
-    df_normalized = df.copy()
-    df_normalized[habits] = scaler.fit_transform(df[habits])
-
-    group_means = df_normalized.groupby('performance_group')[habits].mean().reset_index()
+def sort_radar_groups(group_means, habits):
+    '''
+        Orders the mean habits of the performance groups of the radar chart.
 
+        Args:
+            group_means: A dataframe of the performance_group and the mean normalized habits of each group
+            habits: The habit columns
+        Returns:
+            The group means, from the low to the top performers, and the
+            means of the mid-level performers (2.5 when there is none)
+    '''
     order = ['Low Performers', 'Mid-Level Performers', 'Top Performers']
     group_means['performance_group'] = pd.Categorical(group_means['performance_group'], categories=order, ordered=True)
     group_means = group_means.sort_values('performance_group').reset_index(drop=True)
@@ -40,31 +210,4 @@ def get_groups_radar_chart(my_df):
     mid_means_row = group_means[group_means['performance_group'] == 'Mid-Level Performers']
     mid_means = mid_means_row[habits].iloc[0].tolist() if not mid_means_row.empty else [2.5]*len(habits)
 
-
     return group_means, mid_means
-
-def preprocess_waffle_chart_data(df):
-    
-    def categorize_score(score):
-        if score >= 85:
-            return 'Top'
-        elif score >= 50:
-            return 'Mid'
-        else:
-            return 'Low'
-    
-    df = df[['parental_education_level', 'exam_score']]
-    df['exam_score'] = df['exam_score'].apply(categorize_score)
-    df['parental_education_level'] = df['parental_education_level'].fillna('None')
-    
-    return df
-
-def preprocess_sankey_chart_data(df):
-    df["PerformanceGroup"] = "Mid"
-    df.loc[df["exam_score"] >= 85, "PerformanceGroup"] = "Top"
-    df.loc[df["exam_score"] <= 50, "PerformanceGroup"] = "Low"
-
-    diet_map = {"Poor": 1, "Fair": 2, "Good": 3}
-    df["diet_quality_numeric"] = df["diet_quality"].map(diet_map)
-    
-    return df
\ No newline at end of file
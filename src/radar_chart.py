@@ -1,57 +1,82 @@
+import threading
+
 import pandas as pd
 import plotly.graph_objects as go
-from src.preprocess import get_groups_radar_chart
+from src.dataset import get_dataset_version
+from src.filters import ALL_ROWS, select_rows
+from src.preprocess import get_groups_radar_chart, with_derived_columns
 from src.hover_template import get_radar_hover_template
 
+# Mean habits of the performance groups, by version of the columns they are computed from
+# and key of the filters (at most MAX_BASELINES)
+MAX_BASELINES = 64
+_baselines = {}
+_baselines_lock = threading.Lock()
 
-def get_radar_chart(df, user_data=None):
-    habits = ['study_hours_per_day', 'social_media_hours', 'netflix_hours',
-              'sleep_hours','diet_quality', 'exercise_frequency',
-              'mental_health_rating']
+habits = ['study_hours_per_day', 'social_media_hours', 'netflix_hours',
+          'sleep_hours','diet_quality', 'exercise_frequency',
+          'mental_health_rating']
 
-    colors = {
-        'Low Performers': '#cc6041',
-        'Mid-Level Performers': '#ffce67',
-        'Top Performers': '#6DD2B0',
-        'You': '#569caa'
-    }
+colors = {
+    'Low Performers': '#cc6041',
+    'Mid-Level Performers': '#ffce67',
+    'Top Performers': '#6DD2B0',
+    'You': '#569caa'
+}
 
-    labels = ['Study Hours', 'Social Media Hours', 'Netflix Hours',
+# Columns the group means are computed from, the tiers being those of all the students
+_baseline_columns = habits + ['exam_score', 'diet_quality_numeric', 'performance_tier_radar']
+
+labels = ['Study Hours', 'Social Media Hours', 'Netflix Hours',
           'Sleep Hours', 'Diet Quality', 'Exercise Frequency',
           'Mental Health Rating']
-    
-    habit_advice = {
-        'study_hours_per_day': {
-            'good': "Keep up the good work!",
-            'bad': "Try increasing your study time to improve academic performance"
-        },
-        'social_media_hours': {
-            'bad': "You’re managing your social media time well",
-            'good': "Reducing social media use could help you focus more"
-        },
-        'netflix_hours': {
-            'bad': "Nice balance on entertainment",
-            'good': "Consider watching less Netflix to make room for more productive habits"
-        },
-        'sleep_hours': {
-            'good': "You're getting a healthy amount of sleep!",
-            'bad': "Better sleep habits can significantly improve your performance"
-        },
-        'diet_quality': {
-            'good': "Great! You're maintaining a good diet",
-            'bad': "Improving your diet could benefit your health and focus"
-        },
-        'exercise_frequency': {
-            'good': "You're active enough — keep it up!",
-            'bad': "Try to exercise more regularly for better mental and physical health"
-        },
-        'mental_health_rating': {
-            'good': "Good mental health is key to success. Keep prioritizing it!",
-            'bad': "Consider stress-reducing habits"
-        }
+
+habit_advice = {
+    'study_hours_per_day': {
+        'good': "Keep up the good work!",
+        'bad': "Try increasing your study time to improve academic performance"
+    },
+    'social_media_hours': {
+        'bad': "You’re managing your social media time well",
+        'good': "Reducing social media use could help you focus more"
+    },
+    'netflix_hours': {
+        'bad': "Nice balance on entertainment",
+        'good': "Consider watching less Netflix to make room for more productive habits"
+    },
+    'sleep_hours': {
+        'good': "You're getting a healthy amount of sleep!",
+        'bad': "Better sleep habits can significantly improve your performance"
+    },
+    'diet_quality': {
+        'good': "Great! You're maintaining a good diet",
+        'bad': "Improving your diet could benefit your health and focus"
+    },
+    'exercise_frequency': {
+        'good': "You're active enough — keep it up!",
+        'bad': "Try to exercise more regularly for better mental and physical health"
+    },
+    'mental_health_rating': {
+        'good': "Good mental health is key to success. Keep prioritizing it!",
+        'bad': "Consider stress-reducing habits"
     }
+}
 
-    categories, mid_means = get_groups_radar_chart(df)
+# Slider bounds of each habit, in the order of the sliders
+ranges = {
+    'study_hours_per_day': (0, 9),
+    'social_media_hours_per_day': (0, 7),
+    'netflix_hours_per_day': (0, 6),
+    'sleep_hours_per_day': (3, 10),
+    'diet_quality': (1, 3),
+    'exercise_frequency_per_week': (0, 6),
+    'mental_health_rating': (1, 10)
+}
+
+
+def get_radar_chart(df, user_data=None, selection=ALL_ROWS, baseline=None):
+    # The baseline may also be given, e.g. computed out of core by src.chunked
+    categories, mid_means = get_radar_baseline(df, selection) if baseline is None else baseline
 
     fig = go.Figure()
 
@@ -103,6 +128,56 @@ def get_radar_chart(df, user_data=None):
 
     return fig
 
+def get_radar_baseline(df, selection=ALL_ROWS):
+    '''
+        Gets the mean normalized habits of each performance group, computed
+        once per dataset version and filters so that the clicks only project
+        the user's values.
+
+        Only the habit and tier columns of the selected students are read,
+        and the positions of the students only on the first call.
+
+        Args:
+            df: The dataframe of the students
+            selection: The Selection of the students
+        Returns:
+            The group means and the means of the mid-level performers, which
+            are shared between calls and must not be modified
+    '''
+    columns = habits + ['exam_score'] + [column for column, _ in selection.key]
+    version = (get_dataset_version(df, columns), selection.key)
+    with _baselines_lock:
+        baseline = _baselines.get(version)
+        if baseline is None:
+            df = with_derived_columns(df)
+            baseline = get_groups_radar_chart(select_rows(df, selection.rows, _baseline_columns))
+            if len(_baselines) >= MAX_BASELINES:
+                del _baselines[next(iter(_baselines))]
+            _baselines[version] = baseline
+    return baseline
+
+def get_radar_user_settings(df, selection=ALL_ROWS, baseline=None):
+    '''
+        Gets what the browser needs to draw the user trace and its advice itself.
+
+        Args:
+            df: The dataframe of the students
+            selection: The Selection of the students
+            baseline: The group means and mid-level means to use, those of df if None
+        Returns:
+            A JSON-serializable dict of the slider ranges, the mid-level
+            means the advice is based on, the advice and the trace style
+    '''
+    _, mid_means = get_radar_baseline(df, selection) if baseline is None else baseline
+    return {
+        'ranges': list(ranges.values()),
+        'mid_means': list(mid_means),
+        'advice': [[habit_advice[habit]['good'], habit_advice[habit]['bad']] for habit in habits],
+        'labels': labels,
+        'color': colors['You'],
+        'hovertemplate': get_radar_hover_template(True)
+    }
+
 def wrap_text(text, max_length=20):
     # Break long strings into lines of max_length
     words = text.split()
@@ -116,3 +191,9 @@ def wrap_text(text, max_length=20):
             current_line = word
     lines.append(current_line)
     return "<br>".join(lines)
+
+def normalize_user_values(user_values):
+    return [
+        5 * (v - low) / (high - low)
+        for (low, high), v in zip(ranges.values(), user_values)
+    ]
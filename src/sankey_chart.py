@@ -2,7 +2,38 @@ import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 
-def get_sankey_chart_figure(df: pd.DataFrame, selected_left_type='age', selected_habit='study_hours_per_day'):
+from src.cube import get_cube
+
+# Dropdown options of the sankey chart
+sankey_left_type_options = [
+    {'label': 'Age', 'value': 'age'},
+    {'label': 'Gender', 'value': 'gender'}
+]
+
+sankey_habit_options = [
+    {'label': 'Study Hours per Day', 'value': 'study_hours_per_day'},
+    {'label': 'Sleep Hours per Day', 'value': 'sleep_hours_per_day'},
+    {'label': 'Social Media Hours per Day', 'value': 'social_media_hours_per_day'},
+    {'label': 'Netflix Hours per Day', 'value': 'netflix_hours_per_day'},
+    {'label': 'Exercise Frequency per Week', 'value': 'exercise_frequency_per_week'},
+    {'label': 'Mental Health Rating', 'value': 'mental_health_rating'},
+    {'label': 'Diet Quality', 'value': 'diet_quality'}
+]
+
+def get_sankey_chart_figure(df: pd.DataFrame, selected_left_type='age', selected_habit='study_hours_per_day', filters=None,
+                            cube=None):
+    '''
+        Draws the flows from the age or gender of the students to their habit groups.
+
+        Args:
+            df: The dataframe of the students
+            selected_left_type: The column of the left nodes, 'age' or 'gender'
+            selected_habit: The habit of the right nodes, a value of sankey_habit_options
+            filters: A dict of the demographic filters, as for FilterIndex.select
+            cube: The AggregateCube to draw from, that of df if None
+        Returns:
+            The figure
+    '''
     # Mapping for dropdown to actual column names
     habit_column_map = {
         'study_hours_per_day': 'study_hours_per_day',
@@ -15,54 +46,36 @@ def get_sankey_chart_figure(df: pd.DataFrame, selected_left_type='age', selected
     }
     habit_col = habit_column_map[selected_habit]
 
-    # Map for diet quality (categorical → numeric)
-    quality_map = {'Poor': 1, 'Fair': 2, 'Good': 3}
-
-    # Define habit bins (group values)
-    def categorize_habit(value):
-        try:
-            value = float(value)
-        except:
-            return 'Unknown'
-
-        if habit_col == 'diet_quality':
-            return {1: 'Poor', 2: 'Fair', 3: 'Good'}.get(int(value), 'Unknown')
-        elif habit_col == 'mental_health_rating':
-            return 'Low' if value < 4 else 'Mid' if value < 7 else 'High'
-        else:
-            return 'Low' if value < 2 else 'Mid' if value < 5 else 'High'
-
-    # Add habit group column
-    if habit_col not in df.columns:
-        return go.Figure()  # empty chart fallback
-    habit_series = df[habit_col]
-    if habit_col == 'diet_quality':
-        habit_series = habit_series.map(quality_map)
-    df['habit_group'] = habit_series.apply(categorize_habit)
+    if cube is None:
+        if habit_col not in df.columns:
+            return go.Figure()  # empty chart fallback
+        cube = get_cube(df)
+    # Students of every (left node, habit group) pair, added up from the cells of the cube
+    cells = cube.aggregate([selected_left_type], filters)
+    cells = cells[cells.index.notna()]
 
     # Get node labels
-    left_nodes = sorted(df[selected_left_type].dropna().unique().tolist())
-    right_nodes = ['Low', 'Mid', 'High'] if habit_col != 'diet_quality' else ['Poor', 'Fair', 'Good']
+    left_nodes = sorted(cells.index.tolist())
+    right_nodes = cube.habit_groups[habit_col]
     labels = left_nodes + right_nodes
     label_to_index = {label: i for i, label in enumerate(labels)}
 
+    counts = cells.loc[left_nodes, [f'{habit_col}_group={group}' for group in right_nodes]].to_numpy()
+
     # Build links
     source = []
     target = []
     values = []
     link_hover = []
 
-    for l in left_nodes:
-        for r in right_nodes:
-            subset = df[(df[selected_left_type] == l) & (df['habit_group'] == r)]
-            count = len(subset)
-            if count > 0:
-                source.append(label_to_index[l])
-                target.append(label_to_index[r])
-                values.append(count)
-                link_hover.append(
-                    f"{selected_left_type.capitalize()}: {l}<br>Habit group: {r}<br>Students: {count}"
-                )
+    for i, code in zip(*np.nonzero(counts)):
+        l, r, count = left_nodes[i], right_nodes[code], counts[i, code]
+        source.append(label_to_index[l])
+        target.append(label_to_index[r])
+        values.append(count)
+        link_hover.append(
+            f"{selected_left_type.capitalize()}: {l}<br>Habit group: {r}<br>Students: {count}"
+        )
 
     # Colors
     left_color = 'rgba(58, 129, 191, 0.8)'  # blue
@@ -105,3 +118,4 @@ def get_sankey_chart_figure(df: pd.DataFrame, selected_left_type='age', selected
     )
 
     return fig
+
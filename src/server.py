@@ -24,8 +24,10 @@ def create_app():
         Returns:
             The server to be run
     '''
-    # the import is intentionally inside to work with the server failsafe
-    from app import app  # pylint: disable=import-outside-toplevel
+    # the import is intentionally inside to work with the server failsafe.
+    # Importing the app is cheap: the data and the figures are only loaded
+    # when the layout or a callback first needs them
+    from src.app import app  # pylint: disable=import-outside-toplevel
     return app.server
 
     # Generate figures
@@ -0,0 +1,293 @@
+'''
+    Contains the streaming ingestion of new student records.
+
+    Usage: python -m src.stream --directory DIR [--store DIR] [--interval SECONDS]
+
+    The records are read from the CSV and JSON Lines files of a drop
+    directory, whether the files are new or appended to (they must only be
+    appended to). Only the complete lines written since the last read are
+    parsed, in blocks of bounded size.
+
+    A single ingester (this command, which gunicorn.conf.py starts next to
+    the workers) reads the drop directory and writes each read as a numbered
+    batch into a batch store. Every worker then appends the batches of the
+    store to its dataset, in the same order, as a new Dataset whose cluster
+    models, correlation statistics and aggregate cube are extended with the
+    new rows instead of being recomputed. The workers thus get the same
+    dataset versions and the same cluster models, a restarted worker
+    included.
+
+    The app follows a drop directory when STREAM_DIRECTORY is set. The
+    batches are plain JSON, never unpickled, but the workers trust the records
+    of the store: the drop directory and the store must be private to the app.
+'''
+import argparse
+import io
+import json
+import logging
+import os
+import time
+
+import pandas as pd
+
+from src.cluster_model import clear_cluster_models
+from src.cube import clear_cubes
+from src.figures import extend_cluster_models
+
+# Maximum number of bytes of new lines parsed at once
+BLOCK_SIZE = 16 * 2**20
+
+# Extensions of the files read from the drop directory
+record_formats = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+# Name of the batch store in the drop directory, when no other directory is given
+STORE_NAME = '.ingested'
+
+
+class RecordStream:
+    '''
+        The records of the files of a drop directory that were not read yet.
+
+        Attributes:
+            directory: The drop directory
+            block_size: The maximum number of bytes parsed at once
+            offsets: The number of bytes of each file already ingested
+            headers: The header line of each CSV file
+    '''
+
+    def __init__(self, directory, block_size=BLOCK_SIZE):
+        self.directory = directory
+        self.block_size = block_size
+        self.offsets = {}
+        self.headers = {}
+        self._read_offsets = {}
+
+    def read(self):
+        '''
+            Reads the records written since the last commit, file by file in the order of their names.
+
+            A malformed block raises an error; as nothing is committed, the
+            records are then neither skipped nor read twice.
+
+            Returns:
+                A dataframe of the new records, None if there is none
+        '''
+        self._read_offsets = {}
+        chunks = []
+        for name in sorted(os.listdir(self.directory)):
+            record_format = record_formats.get(os.path.splitext(name)[1].lower())
+            path = os.path.join(self.directory, name)
+            if record_format is not None and os.path.isfile(path):
+                chunks += self._read_file(path, record_format)
+        chunks = [chunk for chunk in chunks if len(chunk)]
+        return pd.concat(chunks, ignore_index=True) if chunks else None
+
+    def commit(self):
+        '''
+            Marks the records of the last read as ingested.
+        '''
+        self.offsets.update(self._read_offsets)
+        self._read_offsets = {}
+
+    def get_read_offsets(self):
+        '''
+            Gets the offsets of the files once the last read is committed.
+        '''
+        return dict(self.offsets, **self._read_offsets)
+
+    def _read_file(self, path, record_format):
+        chunks = []
+        offset = self.offsets.get(path, 0)
+        with open(path, 'rb') as file:
+            while True:
+                file.seek(offset)
+                block = file.read(self.block_size)
+                # A line longer than a block is read whole
+                block += file.readline() if block and not block.endswith(b'\n') else b''
+                end = block.rfind(b'\n') + 1
+                if end == 0:
+                    # Nothing new, or a last line still being written
+                    break
+                lines = block[:end]
+
+                if record_format == 'csv':
+                    if offset == 0:
+                        header_end = lines.find(b'\n') + 1
+                        self.headers[path], lines = lines[:header_end], lines[header_end:]
+                    if lines.strip():
+                        chunks.append(pd.read_csv(io.BytesIO(self.headers[path] + lines)))
+                elif lines.strip():
+                    chunks.append(pd.read_json(io.BytesIO(lines), lines=True, dtype=False, convert_dates=False,
+                                               precise_float=True))
+                offset += end
+        if offset != self.offsets.get(path, 0):
+            self._read_offsets[path] = offset
+        return chunks
+
+
+def append_rows(dataset, rows):
+    '''
+        Appends records to the dataset, extending what the figures are built from.
+
+        The models and the cube of the previous rows are forgotten once
+        extended, so following a stream does not accumulate them.
+
+        Args:
+            dataset: The current Dataset
+            rows: A dataframe of the new records
+        Returns:
+            The new Dataset, with its new version
+    '''
+    previous_df = dataset.df
+    new = dataset.append(rows)
+    extend_cluster_models(new.df, len(new) - len(dataset))
+    clear_cluster_models(previous_df)
+    clear_cubes(previous_df)
+    return new
+
+
+class BatchStore:
+    '''
+        The batches of records ingested from a drop directory, shared by the processes of the app.
+
+        Each batch is a JSON Lines file of records named after its number,
+        next to a JSON file of the offsets (and CSV headers) of the drop files
+        after it, so that an ingester restarted with the store resumes where
+        the previous one stopped.
+
+        Attributes:
+            directory: The directory of the batches
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def count(self):
+        '''
+            Counts the batches of the store.
+        '''
+        return len(self._names())
+
+    def read(self, start=0):
+        '''
+            Reads the batches of the store from a batch number on.
+
+            Args:
+                start: The number of the first batch to read
+            Yields:
+                The dataframe of the records of each batch, in order
+        '''
+        for name in self._names()[start:]:
+            with open(os.path.join(self.directory, name + '.json'), encoding='utf-8') as file:
+                columns = json.load(file)['columns']
+            with open(os.path.join(self.directory, name + '.jsonl'), encoding='utf-8') as file:
+                yield pd.DataFrame([json.loads(line) for line in file], columns=columns)
+
+    def write(self, rows, stream):
+        '''
+            Writes the records of the last read of a stream as the next batch.
+
+            Args:
+                rows: The dataframe of the records
+                stream: The RecordStream the records were read from, not committed yet
+        '''
+        path = os.path.join(self.directory, f'{self.count():08d}')
+        # The headers are bytes, kept as they are through the surrogate escapes
+        headers = {name: header.decode('utf-8', 'surrogateescape') for name, header in stream.headers.items()}
+        _write_text(path + '.json', json.dumps({'columns': [str(column) for column in rows.columns],
+                                                'offsets': stream.get_read_offsets(), 'headers': headers}))
+        # The records file is written last, as it is the one the batch is counted by
+        records = rows.astype(object).where(rows.notna(), None).to_numpy().tolist()
+        _write_text(path + '.jsonl', ''.join(json.dumps(record) + '\n' for record in records))
+
+    def resume(self, stream):
+        '''
+            Marks the records of the batches of the store as read by a new stream.
+        '''
+        names = self._names()
+        if names:
+            with open(os.path.join(self.directory, names[-1] + '.json'), encoding='utf-8') as file:
+                batch = json.load(file)
+            stream.offsets = dict(batch['offsets'])
+            stream.headers = {name: header.encode('utf-8', 'surrogateescape')
+                              for name, header in batch['headers'].items()}
+
+    def _names(self):
+        # The numbers of the batches, without extension
+        return sorted(name[:-len('.jsonl')] for name in os.listdir(self.directory) if name.endswith('.jsonl'))
+
+
+def _write_text(path, text):
+    # Written under a temporary name, so that the workers never read a partial file
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(path + '.tmp', path)
+
+
+def get_store_directory(directory):
+    '''
+        Gets the batch store directory of a drop directory, STREAM_STORE if set.
+    '''
+    return os.environ.get('STREAM_STORE') or os.path.join(directory, STORE_NAME)
+
+
+def ingest(stream, store):
+    '''
+        Writes the new records of a stream as a batch of the store.
+
+        Args:
+            stream: The RecordStream of the drop directory
+            store: The BatchStore of the app
+        Returns:
+            The number of records ingested
+    '''
+    rows = stream.read()
+    if rows is None:
+        return 0
+    store.write(rows, stream)
+    stream.commit()
+    return len(rows)
+
+
+def follow_directory(directory, store_directory=None, interval=10, logger=None):
+    '''
+        Ingests the new records of a drop directory into its batch store, forever.
+
+        Args:
+            directory: The drop directory
+            store_directory: The directory of the batch store, get_store_directory if None
+            interval: The number of seconds between two reads of the directory
+            logger: The logger of the errors, that of the module if None
+    '''
+    logger = logging.getLogger(__name__) if logger is None else logger
+    store = BatchStore(get_store_directory(directory) if store_directory is None else store_directory)
+    stream = RecordStream(directory)
+    store.resume(stream)
+    while True:
+        try:
+            ingest(stream, store)
+        except Exception:  # pylint: disable=broad-except
+            # Retried on the next read, e.g. once a malformed file was fixed
+            logger.exception("Could not ingest the records of %s", directory)
+        time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--directory', default=os.environ.get('STREAM_DIRECTORY'),
+                        help='drop directory (default: $STREAM_DIRECTORY)')
+    parser.add_argument('--store', default=None,
+                        help='batch store directory (default: $STREAM_STORE, or .ingested in the drop directory)')
+    parser.add_argument('--interval', type=float, default=float(os.environ.get('STREAM_INTERVAL', '10')),
+                        help='seconds between two reads of the directory (default: $STREAM_INTERVAL or 10)')
+    args = parser.parse_args(argv)
+    if not args.directory:
+        parser.error('--directory or STREAM_DIRECTORY is required')
+
+    logging.basicConfig(level=logging.INFO)
+    follow_directory(args.directory, args.store, args.interval)
+
+
+if __name__ == '__main__':
+    main()
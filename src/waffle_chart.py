@@ -2,22 +2,39 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 
-from src.preprocess import preprocess_waffle_chart_data
-
-def get_waffle_figure(df):
-    df = preprocess_waffle_chart_data(df)
-    counts = df.groupby(['parental_education_level', 'exam_score']).size().unstack(fill_value=0)
+from src.cube import get_cube
+
+def get_waffle_figure(df, students_per_square=None, max_squares=1200, filters=None, cube=None):
+    '''
+        Draws the waffle chart of the performance by parental education level.
+
+        Large populations are aggregated: each square then stands for several
+        students, so that the figure never has more than about max_squares squares.
+
+        Args:
+            df: The dataframe of the students
+            students_per_square: The number of students of a square, chosen from
+                the population size if None
+            max_squares: The maximum number of squares when choosing it
+            filters: A dict of the demographic filters, as for FilterIndex.select
+            cube: The AggregateCube to draw from, that of df if None
+        Returns:
+            The figure
+    '''
+    # Students per (education, performance), added up from the cells of the cube;
+    # a missing education level counts as None and a missing score is left out
+    cube = get_cube(df) if cube is None else cube
+    cells = cube.aggregate(['parental_education_level', 'performance_tier'], filters).reset_index()
+    cells['parental_education_level'] = cells['parental_education_level'].fillna('None')
+    cells = cells.dropna(subset=['performance_tier'])
+    counts = cells.groupby(['parental_education_level', 'performance_tier'])['students'].sum().unstack(fill_value=0)
 
     education_levels = ['None', 'High School', 'Bachelor', 'Master']
     performance_levels = ['Low', 'Mid', 'Top']
     colors = {'Top': '#6DD2B0', 'Mid': '#ffce67', 'Low': '#cc6041'}
 
-    # Create a lookup for totals per (education, performance)
-    totals_lookup = {}
-    for level in education_levels:
-        for perf in performance_levels:
-            count = counts.loc[level, perf] if (level in counts.index and perf in counts.columns) else 0
-            totals_lookup[(level, perf)] = count
+    # Totals per (education, performance), 0 for the missing combinations
+    counts = counts.reindex(index=education_levels, columns=performance_levels, fill_value=0)
 
     # Waffle chart settings
     cols = 8
@@ -25,56 +42,38 @@ def get_waffle_figure(df):
     marker_size = 8
     scale_y = 1  # moderate vertical spacing
 
-    x_vals, y_vals, color_vals, text_vals = [], [], [], []
-    max_rows = 0
-    group_rows = []
+    if students_per_square is None:
+        students_per_square = get_students_per_square(int(counts.to_numpy().sum()), max_squares)
+    squares = get_square_counts(counts, students_per_square)
 
     # Calculate rows needed per education level
-    for i, level in enumerate(education_levels):
-        level_counts = counts.loc[level] if level in counts.index else pd.Series([0, 0, 0], index=performance_levels)
-        total = level_counts.sum()
-        rows = int(np.ceil(total / cols))
-        group_rows.append(rows)
-        if rows > max_rows:
-            max_rows = rows
-
-    # Build waffle squares (fill from top)
-    for i, level in enumerate(education_levels):
-        level_counts = counts.loc[level] if level in counts.index else pd.Series([0, 0, 0], index=performance_levels)
-        rows = group_rows[i]
+    group_rows = np.ceil(squares.sum(axis=1).to_numpy() / cols).astype(int)
+    max_rows = int(group_rows.max()) if len(group_rows) else 0
 
+    # Build waffle squares (fill from top), one trace per (education, performance)
+    # so that the hover text and the color are sent once per category
+    fig = go.Figure()
+    for i, level in enumerate(education_levels):
         x_offset = i * (cols + group_gap)
-        pos = 0
+        start = 0
         for perf in reversed(performance_levels):
-            count_perf = level_counts.get(perf, 0)
-            for _ in range(count_perf):
-                row = pos // cols
-                col = pos % cols
-                x = x_offset + col
-                y = row  # top aligned
-
-                x_vals.append(x + 0.5)
-                y_vals.append(y * scale_y + 0.5)
-                color_vals.append(colors[perf])
-
-                total_same = totals_lookup.get((level, perf), 0)
-                hover_text = (
+            count_perf = int(counts.loc[level, perf])
+            squares_perf = int(squares.loc[level, perf])
+            row, col = np.divmod(np.arange(start, start + squares_perf), cols)
+            start += squares_perf
+
+            fig.add_trace(go.Scatter(
+                x=x_offset + col + 0.5,
+                y=row * scale_y + 0.5,  # top aligned
+                mode='markers',
+                marker=dict(size=marker_size, color=colors[perf], symbol='square'),
+                hovertemplate=(
                     f"Education: {level}<br>"
                     f"Performance: {perf}<br>"
-                    f"Total Students: {total_same}"
-                )
-                text_vals.append(hover_text)
-                pos += 1
-
-    # Create figure
-    fig = go.Figure(data=go.Scatter(
-        x=x_vals,
-        y=y_vals,
-        mode='markers',
-        marker=dict(size=marker_size, color=color_vals, symbol='square'),
-        text=text_vals,
-        hoverinfo='text'
-    ))
+                    f"Total Students: {count_perf}<extra></extra>"
+                ),
+                showlegend=False
+            ))
 
     # Add group labels below each waffle group
     annotations = []
@@ -99,7 +98,9 @@ def get_waffle_figure(df):
 
     # Update layout
     fig.update_layout(
-        title="Waffle Chart: Student Performance by Parental Education Level",
+        title="Waffle Chart: Student Performance by Parental Education Level" + (
+            f" (1 square = {students_per_square} students)" if students_per_square > 1 else ""
+        ),
         annotations=annotations,
         dragmode=False,
         xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
@@ -115,3 +116,44 @@ def get_waffle_figure(df):
     
     
     return fig
+
+
+def get_students_per_square(total, max_squares):
+    '''
+        Chooses a round number of students per square (1, 2, 5, 10, 20, 50, ...)
+        keeping the number of squares under max_squares.
+    '''
+    students_per_square = 1
+    steps = [2, 2.5, 2]  # 1 -> 2 -> 5 -> 10 -> 20 -> ...
+    step = 0
+    while total / students_per_square > max_squares:
+        students_per_square = int(students_per_square * steps[step % 3])
+        step += 1
+    return students_per_square
+
+
+def get_square_counts(counts, students_per_square):
+    '''
+        Splits the squares between the categories proportionally to their
+        number of students, with the largest remainder method so that the
+        total number of squares matches the total number of students.
+        A category with students always keeps at least one square.
+
+        Args:
+            counts: The number of students per (education, performance)
+            students_per_square: The number of students of a square
+        Returns:
+            The number of squares per (education, performance)
+    '''
+    if students_per_square == 1:
+        return counts
+
+    values = counts.to_numpy(dtype=float).ravel()
+    quotas = values / students_per_square
+    squares = np.floor(quotas).astype(int)
+    missing = int(round(values.sum() / students_per_square)) - squares.sum()
+    if missing > 0:
+        squares[np.argsort(squares - quotas, kind='stable')[:missing]] += 1
+    squares[(values > 0) & (squares == 0)] = 1
+
+    return pd.DataFrame(squares.reshape(counts.shape), index=counts.index, columns=counts.columns)
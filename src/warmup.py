@@ -0,0 +1,125 @@
+'''
+    Pre-renders every figure with a finite set of inputs into the figure cache.
+
+    Usage: python -m src.warmup --cache-dir DIR [--processes N] [--clear]
+
+    The gunicorn startup hook in gunicorn.conf.py runs it when WARMUP_FIGURES=1,
+    so that new workers only read figures from FIGURE_CACHE_DIR. The fitted
+    cluster models are saved next to the figures, so that the workers do not
+    refit them either. The workers unpickle these models, so FIGURE_CACHE_DIR
+    must be private to the app.
+
+    The figure keys include the version of the code, so the figures rendered by
+    a previous build are never served and are rendered again. --clear also
+    deletes them from the directory, instead of leaving them to the eviction.
+'''
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import plotly.io as pio
+
+from src.cluster_model import CLUSTER_MODELS_FILE, load_cluster_models, save_cluster_models
+from src.dataset import Dataset, load_dataframe
+from src.figure_cache import FigureCache
+from src.figures import (build_figure, fit_cluster_models, get_figure_key, get_figure_version,
+                         get_finite_figure_inputs)
+
+_worker_df = None
+
+
+def _init_worker(df):
+    global _worker_df  # pylint: disable=global-statement
+    _worker_df = df
+
+
+def _render(job):
+    name, inputs = job
+    return pio.to_json(build_figure(_worker_df, name, *inputs), validate=False)
+
+
+def warm_up(cache, df, dataset_version, processes=None):
+    '''
+        Renders the figures missing from the cache in a pool of processes.
+
+        Args:
+            cache: The FigureCache to fill
+            df: The dataframe the figures are built from
+            dataset_version: The version of the dataframe
+            processes: The number of processes, the number of CPUs if None
+        Returns:
+            The number of figures rendered
+    '''
+    keys = {
+        (name, inputs): get_figure_key(get_figure_version(df, dataset_version, name, *inputs), name, *inputs)
+        for name, inputs in get_finite_figure_inputs(df)
+    }
+    jobs = [job for job, key in keys.items() if cache.get(key) is None]
+    if not jobs:
+        return 0
+
+    if processes == 1:
+        _init_worker(df)
+        _store(cache, keys, jobs, map(_render, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(df,)) as executor:
+            _store(cache, keys, jobs, executor.map(_render, jobs))
+    return len(jobs)
+
+
+def _store(cache, keys, jobs, texts):
+    for job, text in zip(jobs, texts):
+        cache.put(keys[job], text)
+
+
+def warm_up_directory(directory, data_path=None, processes=None, clear=False):
+    '''
+        Renders the figures of a dataset file into a cache directory.
+
+        Args:
+            directory: The cache directory shared by the workers
+            data_path: The path of a CSV dataset, the app's dataset if None
+            processes: The number of processes, the number of CPUs if None
+            clear: Whether to delete the figures and models already in the directory
+        Returns:
+            The number of figures rendered
+    '''
+    dataset = Dataset(load_dataframe() if data_path is None else pd.read_csv(data_path))
+    cache = FigureCache(directory=directory)
+
+    models_path = os.path.join(directory, CLUSTER_MODELS_FILE)
+    if clear:
+        cache.clear()
+        if os.path.isfile(models_path):
+            os.remove(models_path)
+
+    # Fitted before forking, so that the rendering processes inherit the models
+    if os.path.isfile(models_path):
+        load_cluster_models(models_path)
+    fit_cluster_models(dataset.df)
+    os.makedirs(directory, exist_ok=True)
+    save_cluster_models(models_path)
+
+    return warm_up(cache, dataset.df, dataset.version, processes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cache-dir', default=os.environ.get('FIGURE_CACHE_DIR'),
+                        help='figure cache directory (default: $FIGURE_CACHE_DIR)')
+    parser.add_argument('--data', default=None, help='path of a CSV dataset (default: the app\'s dataset)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--clear', action='store_true',
+                        help='delete the figures and models of previous builds first')
+    args = parser.parse_args(argv)
+    if not args.cache_dir:
+        parser.error('--cache-dir or FIGURE_CACHE_DIR is required')
+
+    count = warm_up_directory(args.cache_dir, args.data, args.processes, args.clear)
+    print(f"Rendered {count} figures into {args.cache_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+'''
+    Fixtures shared by the tests: the dataset of the app, with and without missing values.
+'''
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.dataset import DATA_PATH
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='session')
+def raw():
+    '''
+        The raw dataset of the app, read from its CSV file.
+    '''
+    return pd.read_csv(os.path.join(ROOT, DATA_PATH))
+
+
+@pytest.fixture(scope='session')
+def raw_with_missing(raw):
+    '''
+        The raw dataset with 5% of missing values in some of the filter, habit and score columns.
+    '''
+    rng = np.random.default_rng(1)
+    df = raw.copy()
+    for column in ['parental_education_level', 'exam_score', 'sleep_hours', 'age', 'gender']:
+        df.loc[rng.random(len(df)) < 0.05, column] = np.nan
+    return df
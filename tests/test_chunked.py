@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.app
+import src.chunked
+from src.chunked import (SCORE_DECIMALS, ChunkedAggregates, demographic_dimensions, get_figure_inputs,
+                         warm_up_directory)
+from src.cube import get_cube
+from src.dataset import Dataset
+from src.figure_cache import FigureCache
+from src.filters import filter_columns, range_columns
+from src.radar_chart import get_radar_baseline
+
+filter_cases = [
+    None,
+    {'gender': ['Male'], 'age': [18, 21]},
+    {'parental_education_level': ['Master'], 'internet_quality': ['Poor', 'Good']},
+]
+
+
+def get_chunked_aggregates(df, chunk_size=137):
+    return ChunkedAggregates.from_chunks(df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size))
+
+
+@pytest.mark.parametrize('data', ['raw', 'raw_with_missing'])
+@pytest.mark.parametrize('filters', filter_cases)
+def test_chunked_cube_matches_in_memory_cube(data, filters, request):
+    df = request.getfixturevalue(data)
+    cube = get_cube(Dataset(df).df)
+    chunked = get_chunked_aggregates(df).get_cube()
+
+    assert chunked.tier_cuts == cube.tier_cuts
+    for by in [['performance_tier_bar'], ['parental_education_level', 'performance_tier'], ['age'], ['gender']]:
+        pd.testing.assert_frame_equal(chunked.aggregate(by, filters), cube.aggregate(by, filters), check_dtype=False)
+
+
+@pytest.mark.parametrize('data', ['raw', 'raw_with_missing'])
+def test_chunked_radar_baseline_matches_in_memory_baseline(data, request):
+    df = request.getfixturevalue(data)
+    group_means, mid_means = get_radar_baseline(Dataset(df).df)
+    chunked_means, chunked_mid_means = get_chunked_aggregates(df).get_radar_baseline()
+
+    pd.testing.assert_frame_equal(chunked_means, group_means, check_dtype=False, check_categorical=False)
+    assert chunked_mid_means == pytest.approx(mid_means)
+
+
+def test_cells_bounded_by_rounded_scores(raw):
+    rng = np.random.default_rng(0)
+    df = raw.sample(20000, replace=True, random_state=0).reset_index(drop=True)
+    # Scores of many decimals, nearly all distinct
+    df['exam_score'] = rng.uniform(0, 100, len(df))
+    aggregates = get_chunked_aggregates(df, chunk_size=5000)
+
+    # At most one cell per demographic cell and rounded score, however many students there are
+    demographics = aggregates.cells[demographic_dimensions].drop_duplicates()
+    assert len(aggregates.score_counts) <= 100 * 10 ** SCORE_DECIMALS + 1
+    assert aggregates.cells['exam_score'].nunique() == len(aggregates.score_counts)
+    assert len(aggregates.cells) <= len(demographics) * len(aggregates.score_counts)
+    assert aggregates.get_cube().aggregate(['gender'])['students'].sum() == len(df)
+
+
+def test_version_and_options(raw_with_missing):
+    df = raw_with_missing
+    aggregates = get_chunked_aggregates(df)
+    index = Dataset(df).filter_index
+
+    assert get_chunked_aggregates(df, chunk_size=500).version == aggregates.version
+    assert get_chunked_aggregates(df.iloc[:-1]).version != aggregates.version
+    for column in filter_columns + range_columns:
+        assert aggregates.get_options(column) == index.get_options(column)
+
+
+def test_app_reads_the_pre_rendered_figures(raw, tmp_path, monkeypatch):
+    data_path = tmp_path / 'students.csv'
+    raw.to_csv(data_path, index=False)
+    cache_dir = tmp_path / 'cache'
+    assert warm_up_directory(str(cache_dir), str(data_path)) == len(get_figure_inputs())
+    assert warm_up_directory(str(cache_dir), str(data_path)) == 0
+
+    def build_figure(*args, **kwargs):
+        pytest.fail(f"{args[1]} was not pre-rendered under the key of the app")
+
+    monkeypatch.setattr(src.app, 'OUT_OF_CORE_DATA', str(data_path))
+    monkeypatch.setattr(src.app, '_aggregates', None)
+    monkeypatch.setattr(src.app, 'figure_cache', FigureCache(directory=str(cache_dir)))
+    monkeypatch.setattr(src.chunked, 'build_figure', build_figure)
+    for name, inputs in get_figure_inputs():
+        assert src.app.get_figure(name, *inputs)['layout']
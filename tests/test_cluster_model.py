@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.cluster_model import clear_cluster_models, extend_cluster_model, get_cluster_model
+from src.correlation_heatmap import assign_cluster_labels
+from src.features import cluster_features
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    clear_cluster_models()
+    yield
+    clear_cluster_models()
+
+
+def test_model_reused_for_same_feature_version(raw):
+    model = get_cluster_model(raw, cluster_features, n_clusters=4, random_state=42)
+
+    # Another dataframe of the same values, and one differing only outside the features
+    assert get_cluster_model(raw.copy(), cluster_features, n_clusters=4, random_state=42) is model
+    other_ids = raw.assign(student_id=raw['student_id'] + 'x')
+    assert get_cluster_model(other_ids, cluster_features, n_clusters=4, random_state=42) is model
+
+
+def test_model_refitted_when_feature_version_changes(raw):
+    model = get_cluster_model(raw, cluster_features, n_clusters=4, random_state=42)
+
+    changed = raw.copy()
+    changed.loc[0, 'study_hours_per_day'] += 1
+    refitted = get_cluster_model(changed, cluster_features, n_clusters=4, random_state=42)
+
+    assert refitted is not model
+    assert get_cluster_model(changed, cluster_features, n_clusters=4, random_state=42) is refitted
+    assert get_cluster_model(raw, cluster_features, n_clusters=4, random_state=42) is model
+
+
+def test_model_keyed_by_its_settings(raw):
+    model = get_cluster_model(raw, cluster_features, n_clusters=4, random_state=42)
+
+    assert get_cluster_model(raw, cluster_features, n_clusters=3, random_state=42) is not model
+    assert get_cluster_model(raw, cluster_features, n_clusters=4, random_state=0) is not model
+
+
+def test_heatmap_labels_share_the_registered_model(raw):
+    first = assign_cluster_labels(raw)
+    second = assign_cluster_labels(raw)
+
+    np.testing.assert_array_equal(first['cluster'], second['cluster'])
+    assert first['cluster'].nunique() == 4
+
+
+def test_concurrent_extensions_share_one_model(raw):
+    get_cluster_model(raw.iloc[:900], cluster_features, n_clusters=4, random_state=42)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        models = list(executor.map(
+            lambda _: extend_cluster_model(raw, 100, cluster_features, n_clusters=4, random_state=42), range(8)))
+
+    assert all(model is models[0] for model in models)
+    assert get_cluster_model(raw, cluster_features, n_clusters=4, random_state=42) is models[0]
@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from src.columnar import iter_columns, read_columns, write_columns
+from src.dataset import Dataset, get_dataset_version
+
+
+@pytest.mark.parametrize('data', ['raw', 'raw_with_missing'])
+@pytest.mark.parametrize('shared', [False, True])
+def test_columns_round_trip(data, shared, tmp_path, request):
+    df = request.getfixturevalue(data)
+    write_columns(df, tmp_path, shared=shared)
+
+    for mmap_mode in [None, 'r']:
+        pd.testing.assert_frame_equal(read_columns(tmp_path, mmap_mode=mmap_mode)[df.columns], df, check_dtype=False,
+                                      check_categorical=False)
+    chunks = pd.concat(iter_columns(tmp_path, chunk_size=137))
+    pd.testing.assert_frame_equal(chunks, read_columns(tmp_path)[chunks.columns])
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_columns_dataset_version(raw, shared, tmp_path):
+    write_columns(raw, tmp_path, shared=shared)
+
+    # The version depends on the values, not on whether the columns are memory-mapped
+    assert Dataset(read_columns(tmp_path, mmap_mode='r')).version == Dataset(read_columns(tmp_path)).version
+    assert get_dataset_version(read_columns(tmp_path)) != get_dataset_version(read_columns(tmp_path).iloc[:-1])
+
+
+
+def test_missing_strings_round_trip(tmp_path):
+    df = pd.DataFrame({'name': ['a', None, 'nan', 'a', float('nan')]})
+    write_columns(df, tmp_path)
+
+    # Missing values are decoded to NaN, not to the string 'nan'
+    for names in [read_columns(tmp_path)['name'], pd.concat(iter_columns(tmp_path, chunk_size=2))['name']]:
+        assert names.isna().tolist() == [False, True, False, False, True]
+        assert names.dropna().tolist() == ['a', 'nan', 'a']
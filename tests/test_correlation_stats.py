@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.cluster_model import clear_cluster_models, get_cluster_model
+from src.correlation_heatmap import (cluster_habits, corr_vars, extend_correlation_stats,
+                                     get_correlation_stats)
+from src.correlation_stats import CorrelationStats
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    clear_cluster_models()
+    yield
+    clear_cluster_models()
+
+
+def get_groups(raw, seed=0):
+    return np.random.default_rng(seed).integers(0, 4, size=len(raw))
+
+
+@pytest.mark.parametrize('selected', [None, [0], [1, 3]])
+def test_correlation_matches_pandas(raw, selected):
+    groups = get_groups(raw)
+    stats = CorrelationStats.from_rows(raw[corr_vars], groups)
+
+    rows = raw[corr_vars] if selected is None else raw[corr_vars][np.isin(groups, selected)]
+    pd.testing.assert_frame_equal(stats.get_correlation(selected), rows.corr())
+    pd.testing.assert_frame_equal(stats.select(selected or [0, 1, 2, 3]).get_correlation(), rows.corr())
+
+
+def test_added_rows_match_all_rows(raw):
+    groups = get_groups(raw)
+    stats = CorrelationStats.from_rows(raw[corr_vars].iloc[:300], groups[:300])
+    for start in range(300, len(raw), 250):
+        stats = stats.add(raw[corr_vars].iloc[start:start + 250], groups[start:start + 250])
+
+    expected = CorrelationStats.from_rows(raw[corr_vars], groups)
+    assert stats.counts == expected.counts
+    for group in range(4):
+        pd.testing.assert_frame_equal(stats.get_correlation([group]), raw[corr_vars][groups == group].corr())
+
+
+def test_extended_stats_match_pandas(raw):
+    get_correlation_stats(raw.iloc[:900])
+    stats = extend_correlation_stats(raw, 100)
+
+    labels = get_cluster_model(raw, cluster_habits, n_clusters=4, random_state=0).labels
+    for label in range(4):
+        pd.testing.assert_frame_equal(stats.get_correlation([label]), raw[corr_vars][labels == label].corr())
+    pd.testing.assert_frame_equal(stats.get_correlation(), raw[corr_vars].corr())
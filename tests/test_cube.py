@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from src.cube import AggregateCube, cube_measures, get_cube
+from src.dataset import Dataset
+from src.filters import FilterIndex
+
+
+@pytest.mark.parametrize('data', ['raw', 'raw_with_missing'])
+@pytest.mark.parametrize('by', [['performance_tier_bar'], ['parental_education_level', 'performance_tier'], ['age']])
+@pytest.mark.parametrize('filters', [None, {'gender': ['Female'], 'age': [18, 21]}])
+def test_aggregate_matches_groupby(data, by, filters, request):
+    df = Dataset(request.getfixturevalue(data)).df
+    aggregates = get_cube(df).aggregate(by, filters)
+
+    rows = FilterIndex(df).select(filters).rows
+    selected = df if rows is None else df.take(rows)
+    # Grouped by plain values, as the groupby of categorical columns drops the missing ones
+    groups = selected.groupby([selected[column].astype(object) for column in by], dropna=False)
+    expected = pd.DataFrame({'students': groups.size()})
+    for measure in cube_measures:
+        expected[f'{measure}_count'] = groups[measure].count()
+        expected[f'{measure}_sum'] = groups[measure].sum()
+
+    actual = aggregates[aggregates['students'] > 0][expected.columns]
+    pd.testing.assert_frame_equal(to_rows(actual, by), to_rows(expected, by), check_dtype=False)
+
+
+def to_rows(aggregates, by):
+    rows = aggregates.reset_index()
+    rows[by] = rows[by].astype(object)
+    return rows.sort_values(by, ignore_index=True)
+
+
+def test_added_rows_match_whole_cube(raw):
+    df = Dataset(raw).df
+    cube = get_cube(df)
+    first = AggregateCube.from_rows(df.iloc[:600], cube.tier_cuts)
+
+    added = first.add(df.iloc[600:], cube.tier_cuts)
+    by = ['gender', 'performance_tier']
+    pd.testing.assert_frame_equal(added.aggregate(by), cube.aggregate(by))
+    assert added.aggregate(by)['students'].to_dict() == df.groupby(by, observed=True).size().to_dict()
@@ -0,0 +1,44 @@
+import io
+
+import pandas as pd
+import pytest
+
+from src.columnar import read_columns, write_columns
+from src.dataset import Dataset
+
+
+def load_csv(df, _):
+    return pd.read_csv(io.StringIO(df.to_csv(index=False)))
+
+
+def load_columns(df, directory):
+    write_columns(df, directory)
+    return read_columns(directory)
+
+
+def load_shared_columns(df, directory):
+    write_columns(df, directory, shared=True)
+    return read_columns(directory, mmap_mode='r')
+
+
+def test_appended_dataset_version(raw):
+    dataset = Dataset(raw.iloc[:900]).append(raw.iloc[900:950]).append(raw.iloc[950:])
+
+    assert dataset.version == Dataset(raw).version
+    pd.testing.assert_frame_equal(dataset.df, Dataset(raw).df)
+
+
+@pytest.mark.parametrize('load', [load_csv, load_columns, load_shared_columns])
+@pytest.mark.parametrize('data', ['raw', 'raw_with_missing'])
+def test_appended_dtypes_match_a_fresh_load(load, data, tmp_path, request):
+    df = request.getfixturevalue(data).copy()
+    # A new gender, sorted before the others, and an age out of the range of the first rows
+    df.loc[len(df) - 1, ['gender', 'age']] = ['Agender', 300]
+    new_rows = pd.read_csv(io.StringIO(df.iloc[900:].to_csv(index=False)))
+
+    appended = Dataset(load(df.iloc[:900], tmp_path / 'head')).append(new_rows)
+    fresh = Dataset(load(df, tmp_path / 'all'))
+
+    assert appended.df.dtypes.to_dict() == fresh.df.dtypes.to_dict()
+    pd.testing.assert_frame_equal(appended.df, fresh.df)
+    assert appended.version == fresh.version
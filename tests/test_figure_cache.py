@@ -0,0 +1,87 @@
+import os
+
+import plotly.graph_objects as go
+
+import src.figures
+from src.figure_cache import FigureCache, get_code_version
+from src.figures import get_figure_key
+
+
+def test_memory_eviction_is_least_recently_used():
+    cache = FigureCache(max_entries=2)
+    cache.put(('a',), '"a"')
+    cache.put(('b',), '"b"')
+    cache.get(('a',))
+    cache.put(('c',), '"c"')
+
+    assert cache.get(('a',)) == '"a"'
+    assert cache.get(('b',)) is None
+    assert cache.get(('c',)) == '"c"'
+
+
+def test_memory_eviction_by_size():
+    cache = FigureCache(max_bytes=10)
+    cache.put(('a',), '"aaaa"')
+    cache.put(('b',), '"bbbb"')
+
+    assert cache.get(('a',)) is None
+    assert cache.get(('b',)) == '"bbbb"'
+
+
+def test_disk_shared_between_caches_and_evicted(tmp_path):
+    writer = FigureCache(directory=tmp_path, max_disk_bytes=2 * len('"xxxx"'))
+    for index, key in enumerate(['a', 'b']):
+        writer.put((key,), f'"{key * 4}"')
+        # The disk eviction follows the modification times of the files
+        os.utime(next(path for path in tmp_path.iterdir() if path.read_text() == f'"{key * 4}"'),
+                 (index + 1, index + 1))
+    writer.put(('c',), '"cccc"')
+
+    reader = FigureCache(directory=tmp_path)
+    assert reader.get(('a',)) is None
+    assert reader.get(('b',)) == '"bbbb"'
+    assert reader.get(('c',)) == '"cccc"'
+    assert len(list(tmp_path.glob('*.json'))) == 2
+
+
+def test_get_or_build_builds_once():
+    cache = FigureCache()
+    calls = []
+
+    def build():
+        calls.append(1)
+        return go.Figure(go.Bar(y=[1, 2]))
+
+    first = cache.get_or_build(('bar',), build)
+    second = cache.get_or_build(('bar',), build)
+
+    assert len(calls) == 1
+    assert first == second and first['data'][0]['y'] == [1, 2]
+
+
+def test_code_version_changes_with_the_modules(tmp_path):
+    (tmp_path / 'module.py').write_text('x = 1\n')
+    (tmp_path / 'notes.txt').write_text('ignored\n')
+    version = get_code_version(str(tmp_path))
+
+    (tmp_path / 'notes.txt').write_text('still ignored\n')
+    assert get_code_version(str(tmp_path)) == version
+    (tmp_path / 'module.py').write_text('x = 2\n')
+    assert get_code_version(str(tmp_path)) != version
+
+
+def test_figure_key_includes_code_version(monkeypatch):
+    key = get_figure_key('v1', 'bar')
+
+    monkeypatch.setattr(src.figures, 'FIGURE_CACHE_VERSION', 'other code')
+    assert get_figure_key('v1', 'bar') != key
+    assert 'other code' in get_figure_key('v1', 'bar')
+
+
+def test_clear_forgets_memory_and_disk(tmp_path):
+    cache = FigureCache(directory=tmp_path)
+    cache.put(('a',), '"a"')
+    cache.clear()
+
+    assert cache.get(('a',)) is None
+    assert not list(tmp_path.glob('*.json'))
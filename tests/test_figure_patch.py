@@ -0,0 +1,50 @@
+import json
+
+import plotly.io as pio
+import pytest
+
+from src.dataset import Dataset
+from src.figure_patch import apply_figure_patch, get_figure_patch
+from src.figures import build_figure, get_data_version
+from src.filters import Selection
+
+
+def to_dict(figure):
+    return json.loads(pio.to_json(figure, validate=False))
+
+
+@pytest.fixture(name='dataset', scope='module')
+def student_dataset(raw):
+    return Dataset(raw.copy())
+
+
+@pytest.mark.parametrize('name, reference_inputs, inputs', [
+    ('sankey', ('age', 'study_hours_per_day'), ('gender', 'sleep_hours_per_day')),
+    ('sankey', ('age', 'study_hours_per_day'), ('age', 'study_hours_per_day')),
+    ('correlation', ('All students',), ('The Minimalist',)),
+])
+def test_patch_round_trip(dataset, name, reference_inputs, inputs):
+    reference = to_dict(build_figure(dataset.df, name, *reference_inputs))
+    figure = to_dict(build_figure(dataset.df, name, *inputs))
+
+    patch = get_figure_patch(reference, figure)
+
+    assert apply_figure_patch(reference, patch) == figure
+    assert (patch == []) == (reference_inputs == inputs)
+    # The patch goes through JSON to the browser, and the reference is left as it was
+    assert apply_figure_patch(reference, json.loads(json.dumps(patch))) == figure
+    assert reference == to_dict(build_figure(dataset.df, name, *reference_inputs))
+
+
+def test_patch_deletes_and_adds_keys():
+    reference = {'data': [{'x': [1, 2], 'name': 'a'}], 'layout': {'title': 'old'}}
+    figure = {'data': [{'x': [1, 3]}, {'x': [4]}], 'layout': {'title': 'new', 'height': 300}}
+
+    assert apply_figure_patch(reference, get_figure_patch(reference, figure)) == figure
+
+
+def test_version_depends_on_the_filters(dataset):
+    version = get_data_version(dataset.df, dataset.version)
+
+    assert get_data_version(dataset.df, dataset.version, Selection((('gender', ('Female',)),))) != version
+    assert get_data_version(dataset.df, dataset.version, Selection(())) == version
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from src.filters import ALL_ROWS, FilterIndex, range_columns
+
+filter_cases = [
+    {'gender': ['Male']},
+    {'gender': ['Female', 'Other'], 'age': [18, 21]},
+    {'parental_education_level': ['Master', 'Bachelor'], 'internet_quality': ['Poor'], 'part_time_job': ['Yes']},
+    {'age': [20, 20]},
+    {'age': [17.5, 19.5]},
+    {'age': [0, 100], 'gender': ['Male']},
+    {'age': [40, 50]},
+    {'gender': ['Unknown']},
+]
+
+
+def get_mask(df, filters):
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in filters.items():
+        if column in range_columns:
+            mask &= df[column].between(*values).to_numpy()
+        else:
+            mask &= df[column].isin(values).to_numpy()
+    return mask
+
+
+@pytest.mark.parametrize('data', ['raw', 'raw_with_missing'])
+@pytest.mark.parametrize('filters', filter_cases)
+def test_select_matches_mask(data, filters, request):
+    df = request.getfixturevalue(data)
+    selection = FilterIndex(df).select(filters)
+
+    np.testing.assert_array_equal(selection.rows, np.flatnonzero(get_mask(df, filters)))
+
+
+def test_select_without_filters(raw):
+    index = FilterIndex(raw)
+
+    assert index.select(None) is ALL_ROWS
+    assert index.select({'gender': [], 'age': None}) is ALL_ROWS
+    assert ALL_ROWS.rows is None
+
+
+def test_select_key_ignores_order(raw):
+    index = FilterIndex(raw)
+
+    assert index.select({'gender': ['Male', 'Female'], 'age': [18, 21]}).key == \
+        index.select({'age': [18.0, 21.0], 'gender': ['Female', 'Male']}).key
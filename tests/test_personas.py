@@ -0,0 +1,53 @@
+import copy
+
+import numpy as np
+import pytest
+
+from src.cluster_model import clear_cluster_models, get_cluster_model
+from src.features import cluster_features
+from src.personas import match_personas, scatter_personas
+
+
+@pytest.fixture(name='model')
+def fitted_model(raw):
+    clear_cluster_models()
+    yield get_cluster_model(raw, cluster_features, n_clusters=4, random_state=42, n_components=2)
+    clear_cluster_models()
+
+
+def relabel(model, permutation):
+    # The same clustering, with the cluster j of the copy being the cluster permutation[j] of the model
+    permuted = copy.copy(model)
+    permuted.centroids = model.centroids[permutation]
+    permuted.labels = np.argsort(permutation)[model.labels]
+    permuted.persona_matches = {}
+    return permuted
+
+
+def get_student_personas(model):
+    matches = match_personas(model, scatter_personas)
+    return [matches[label]['name'] for label in model.labels]
+
+
+@pytest.mark.parametrize('permutation', [[1, 0, 2, 3], [3, 2, 1, 0], [2, 3, 0, 1]])
+def test_personas_do_not_depend_on_labels(model, permutation):
+    permuted = relabel(model, np.array(permutation))
+
+    assert not np.array_equal(permuted.labels, model.labels)
+    assert get_student_personas(permuted) == get_student_personas(model)
+
+
+def test_each_persona_matched_once(model):
+    names = [persona['name'] for persona in match_personas(model, scatter_personas).values()]
+
+    assert sorted(names) == sorted(persona['name'] for persona in scatter_personas)
+
+
+def test_extra_clusters_get_a_generic_persona(raw):
+    clear_cluster_models()
+    model = get_cluster_model(raw, cluster_features, n_clusters=5, random_state=42)
+    matches = match_personas(model, scatter_personas)
+    clear_cluster_models()
+
+    generic = [label for label, persona in matches.items() if persona['name'] == f'Cluster {label}']
+    assert len(matches) == 5 and len(generic) == 1
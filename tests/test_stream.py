@@ -0,0 +1,75 @@
+import pandas as pd
+
+from src.stream import BatchStore, RecordStream, ingest
+
+
+def append(path, text):
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(text)
+
+
+def test_partial_lines_are_read_once_complete(tmp_path):
+    drop = tmp_path / 'drop'
+    drop.mkdir()
+    stream = RecordStream(str(drop))
+    append(drop / 'a.csv', 'student_id,age\nS1,20\nS2,2')
+
+    rows = stream.read()
+    stream.commit()
+    assert rows.to_dict('list') == {'student_id': ['S1'], 'age': [20]}
+    assert stream.offsets[str(drop / 'a.csv')] == len('student_id,age\nS1,20\n')
+
+    # The rest of the last line, and new lines parsed with the header of the file
+    append(drop / 'a.csv', '1\nS3,22\n')
+    rows = stream.read()
+    stream.commit()
+    assert rows.to_dict('list') == {'student_id': ['S2', 'S3'], 'age': [21, 22]}
+    assert stream.read() is None
+
+
+def test_small_blocks_and_json_lines(tmp_path):
+    drop = tmp_path / 'drop'
+    drop.mkdir()
+    append(drop / 'a.csv', 'student_id,age\n' + ''.join(f'S{i},{18 + i % 5}\n' for i in range(20)))
+    append(drop / 'b.jsonl', '{"student_id": "J1", "age": 19}\n{"student_id": "J2", "gender": "Male"}\n')
+    append(drop / 'notes.txt', 'ignored\n')
+
+    rows = RecordStream(str(drop), block_size=16).read()
+
+    assert rows['student_id'].tolist() == [f'S{i}' for i in range(20)] + ['J1', 'J2']
+    assert rows['age'].iloc[:21].tolist() == [18 + i % 5 for i in range(20)] + [19]
+    assert rows['gender'].isna().sum() == 21
+
+
+def test_uncommitted_read_is_read_again(tmp_path):
+    drop = tmp_path / 'drop'
+    drop.mkdir()
+    append(drop / 'a.csv', 'student_id\nS1\n')
+    stream = RecordStream(str(drop))
+
+    first = stream.read()
+    pd.testing.assert_frame_equal(stream.read(), first)
+
+
+def test_store_resumes_after_its_last_batch(tmp_path):
+    drop = tmp_path / 'drop'
+    drop.mkdir()
+    store = BatchStore(str(tmp_path / 'store'))
+    stream = RecordStream(str(drop))
+    append(drop / 'a.csv', 'student_id,exam_score\nS1,81.5\nS2,\n')
+    assert ingest(stream, store) == 2
+    append(drop / 'b.jsonl', '{"student_id": "J1", "exam_score": 70}\n')
+    assert ingest(stream, store) == 1
+
+    batches = list(store.read())
+    assert store.count() == 2 and list(store.read(1))[0].to_dict('list') == batches[1].to_dict('list')
+    assert batches[0]['student_id'].tolist() == ['S1', 'S2']
+    assert batches[0]['exam_score'].iloc[0] == 81.5 and pd.isna(batches[0]['exam_score'].iloc[1])
+    assert batches[1].to_dict('list') == {'student_id': ['J1'], 'exam_score': [70]}
+
+    # A restarted ingester reads the new lines only, with the header of the CSV file
+    resumed = RecordStream(str(drop))
+    BatchStore(str(tmp_path / 'store')).resume(resumed)
+    assert resumed.offsets == stream.offsets and resumed.headers == stream.headers
+    append(drop / 'a.csv', 'S3,90\n')
+    assert resumed.read().to_dict('list') == {'student_id': ['S3'], 'exam_score': [90]}
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.waffle_chart import get_square_counts, get_students_per_square
+
+
+def get_counts(seed, low):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.integers(low, 400, size=(5, 3)), index=list('abcde'), columns=['Low', 'Mid', 'Top'])
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('max_squares', [100, 1200])
+def test_square_counts_sum_to_square_total(seed, max_squares):
+    counts = get_counts(seed, low=100)
+    students_per_square = get_students_per_square(int(counts.values.sum()), max_squares)
+
+    squares = get_square_counts(counts, students_per_square)
+
+    assert squares.values.sum() == int(round(counts.values.sum() / students_per_square))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_square_counts_keep_small_categories(seed):
+    counts = get_counts(seed, low=0)
+    counts.iloc[0, 0] = 1
+    students_per_square = get_students_per_square(int(counts.values.sum()), 100)
+
+    squares = get_square_counts(counts, students_per_square)
+
+    # Only the categories of less than a square of students may add squares to the total
+    total = int(round(counts.values.sum() / students_per_square))
+    small = int(((counts.values > 0) & (counts.values < students_per_square)).sum())
+    assert total <= squares.values.sum() <= total + small
+    assert ((squares.values > 0) == (counts.values > 0)).all()
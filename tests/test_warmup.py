@@ -0,0 +1,25 @@
+import pytest
+
+import src.app
+import src.figures
+from src.dataset import Dataset
+from src.figure_cache import FigureCache
+from src.figures import get_finite_figure_inputs
+from src.warmup import warm_up
+
+
+def test_app_reads_the_warmed_up_figures(raw, monkeypatch):
+    dataset = Dataset(raw.copy())
+    cache = FigureCache()
+    count = warm_up(cache, dataset.df, dataset.version, processes=1)
+    assert count == len(get_finite_figure_inputs(dataset.df))
+
+    def build_figure(*args, **kwargs):
+        pytest.fail(f"{args[1]} was not warmed up under the key of the app")
+
+    monkeypatch.setattr(src.app, 'figure_cache', cache)
+    monkeypatch.setattr(src.figures, 'build_figure', build_figure)
+    for name, inputs in get_finite_figure_inputs(dataset.df):
+        assert src.app.get_figure(name, *inputs, dataset=dataset)['data']
+
+    assert warm_up(cache, dataset.df, dataset.version, processes=1) == 0